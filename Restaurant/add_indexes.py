@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Create the composite indexes declared in models.py on an existing database,
+then check with EXPLAIN that the hot public/admin queries use them
+(tests/test_query_plans.py runs the check on SQLite and, given a server,
+on Postgres).
+
+    python add_indexes.py            # create missing indexes + EXPLAIN check
+    python add_indexes.py --explain  # only run the EXPLAIN check
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, inspect, select, text
+from models import engine, create_tables, Model, Booking, City, MediaJob
+
+INDEXED_TABLES = [Model.__table__, Booking.__table__, City.__table__, MediaJob.__table__]
+
+# (description, query mirroring main.py, index the plan must mention)
+HOT_QUERIES = [
+    ("home featured models",
+     select(Model.id).where(Model.agency_id == 1, Model.status == "approved")
+     .order_by(Model.featured.desc(), Model.created_at.desc()).limit(6),
+     "ix_models_agency_status_featured_created"),
+    ("approved models in a city",
+     select(Model.id).where(Model.agency_id == 1, Model.status == "approved", Model.city_id == 1),
+     "ix_models_agency_status_city"),
+    ("dashboard pending applications",
+     select(Model.id).where(Model.agency_id == 1, Model.status == "pending")
+     .order_by(Model.created_at.desc()).limit(5),
+     "ix_models_agency_status_created"),
+    ("admin models list",
+     select(Model.id).where(Model.agency_id == 1).order_by(Model.created_at.desc()),
+     "ix_models_agency_created"),
+    ("pending bookings",
+     select(func.count(Booking.id)).where(Booking.agency_id == 1, Booking.status == "pending"),
+     "ix_bookings_agency_status_created"),
+    ("admin bookings list",
+     select(Booking.id).where(Booking.agency_id == 1).order_by(Booking.created_at.desc()),
+     "ix_bookings_agency_created"),
+    ("city by name",
+     select(City.id).where(City.agency_id == 1, City.name == "Marbella"),
+     "uq_cities_agency_name"),
+]
+
+
+def has_duplicate_cities(conn):
+    return conn.execute(text(
+        "SELECT agency_id, name FROM cities GROUP BY agency_id, name HAVING COUNT(*) > 1"
+    )).first() is not None
+
+
+def migrate(conn):
+    """Create missing indexes, inside the caller's transaction."""
+    inspector = inspect(conn)
+    for table in INDEXED_TABLES:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if index.name == "uq_cities_agency_name" and has_duplicate_cities(conn):
+                print("⚠️ Skipped uq_cities_agency_name: duplicate city names exist, "
+                      "rename or delete them and run python add_indexes.py")
+                continue
+            index.create(bind=conn)
+            print(f"✅ Created index {index.name} on {table.name}")
+
+
+def explain(conn, query):
+    """The query plan for `query`, one line per step."""
+    sql = str(query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        return "\n".join(str(row[-1]) for row in rows)
+    # Small tables are always cheapest to seq-scan; ask the planner whether
+    # an index path exists at all (for the rest of the caller's transaction)
+    conn.execute(text("SET LOCAL enable_seqscan = off"))
+    rows = conn.execute(text(f"EXPLAIN {sql}")).fetchall()
+    return "\n".join(row[0] for row in rows)
+
+
+def check_query_plans():
+    failures = 0
+    with engine.connect() as conn:
+        for description, query, index_name in HOT_QUERIES:
+            plan = explain(conn, query)
+            ok = index_name in plan
+            failures += not ok
+            print(f"{'✅' if ok else '❌'} {description}: expects {index_name}")
+            if not ok:
+                print("    " + plan.replace("\n", "\n    "))
+    return failures
+
+
+if __name__ == "__main__":
+    if "--explain" not in sys.argv:
+        create_tables()
+        with engine.begin() as conn:
+            migrate(conn)
+    sys.exit(1 if check_query_plans() else 0)
@@ -1,19 +0,0 @@
-from sqlalchemy import create_engine, text
-import os
-
-DATABASE_URL = os.environ.get("DATABASE_URL")
-if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-
-if not DATABASE_URL:
-    DATABASE_URL = "sqlite:///./agency.db"
-
-engine = create_engine(DATABASE_URL)
-
-with engine.connect() as conn:
-    try:
-        conn.execute(text("ALTER TABLE models ADD COLUMN phone VARCHAR(20)"))
-        conn.commit()
-        print("✅ Added phone column to models table")
-    except Exception as e:
-        print(f"Column might already exist or error: {e}")
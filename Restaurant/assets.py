@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Fingerprinted, precompressed static assets.
+
+The build step copies every file under static/ (except user uploads) to
+static_build/ under a content-hashed name, e.g. logo.jpg -> logo.3f2a9c1b7d0e.jpg,
+and writes .gz/.br siblings for text and font files. Templates link assets
+through the static_url() Jinja global. Hashed names are served with
+`Cache-Control: immutable` and the best encoding the client accepts.
+Anything not in the manifest (uploads, files added after the build) is served
+as before.
+
+Startup rebuilds when a source is newer than the manifest. To build at
+release time instead:
+
+    python assets.py
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # gzip variants only
+    brotli = None
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+static_dir = os.path.join(base_dir, "static")
+build_dir = os.environ.get("STATIC_BUILD_DIR", os.path.join(base_dir, "static_build"))
+manifest_path = os.path.join(build_dir, "manifest.json")
+
+# Uploaded media has its own URLs and lifecycle
+SKIP_DIRS = {"uploads"}
+# Already-compressed formats (png, jpg, webp, woff2, mp4...) gain nothing
+COMPRESSIBLE = {".css", ".js", ".json", ".svg", ".txt", ".html", ".xml", ".ico", ".ttf", ".otf", ".eot", ".woff"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+manifest = {}
+_hashed_names = {}  # hashed name -> (source name, manifest entry)
+_HASHED = re.compile(r"^(?P<stem>.+)\.[0-9a-f]{12}(?P<extension>\.[^./]+)$")
+
+
+def _sources():
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+        for name in files:
+            if not name.startswith("."):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, static_dir).replace(os.sep, "/"), path
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as out:
+        out.write(data)
+
+
+def build():
+    """Hash and precompress every static asset; returns the new manifest."""
+    entries = {}
+    for name, path in sorted(_sources()):
+        with open(path, "rb") as source:
+            data = source.read()
+        stem, extension = os.path.splitext(name)
+        hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+        target = os.path.join(build_dir, hashed)
+        _write(target, data)
+
+        encodings = []
+        if extension.lower() in COMPRESSIBLE:
+            variants = [("gzip", ".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.insert(0, ("br", ".br", brotli.compress(data, quality=11)))
+            for encoding, suffix, compressed in variants:
+                if len(compressed) < len(data):
+                    _write(target + suffix, compressed)
+                    encodings.append(encoding)
+        entries[name] = {"hashed": hashed, "encodings": encodings}
+
+    # Remove outputs of earlier builds that no longer match a source
+    keep = {os.path.join(build_dir, entry["hashed"]) + suffix
+            for entry in entries.values() for suffix in ("", ".gz", ".br")}
+    for root, dirs, files in os.walk(build_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if path != manifest_path and path not in keep:
+                os.remove(path)
+
+    _write(manifest_path, json.dumps(entries, indent=2).encode())
+    return entries
+
+
+def _stale(entries):
+    try:
+        built_at = os.path.getmtime(manifest_path)
+    except OSError:
+        return True
+    sources = dict(_sources())
+    if set(sources) != set(entries):
+        return True
+    return any(os.path.getmtime(path) > built_at for path in sources.values())
+
+
+def load():
+    """Load the manifest, rebuilding it first if any asset changed."""
+    global manifest, _hashed_names
+    try:
+        with open(manifest_path) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = {}
+    if _stale(entries):
+        entries = build()
+        print(f"✅ Built {len(entries)} static assets")
+    manifest = entries
+    _hashed_names = {entry["hashed"]: (name, entry) for name, entry in entries.items()}
+    return manifest
+
+
+def static_url(name):
+    """URL of a file under static/: hashed when it was built, plain otherwise."""
+    entry = manifest.get(name.lstrip("/"))
+    return "/static/" + (entry["hashed"] if entry else name.lstrip("/"))
+
+
+def accepted_encodings(header):
+    """Content codings an Accept-Encoding header allows (anything with q=0 is refused)."""
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class AssetFiles(StaticFiles):
+    """StaticFiles that serves hashed names from the build with far-future caching."""
+
+    async def get_response(self, path, scope):
+        path = path.replace(os.sep, "/")
+        found = _hashed_names.get(path)
+        if found is None or scope["method"] not in ("GET", "HEAD"):
+            # A page cached before the last deploy may still link an old hash;
+            # serve the current file, just without the immutable promise
+            match = _HASHED.match(path)
+            if match and match["stem"] + match["extension"] in manifest:
+                path = match["stem"] + match["extension"]
+            return await super().get_response(path, scope)
+
+        name, entry = found
+        file_path = os.path.join(build_dir, entry["hashed"])
+        headers = {"Cache-Control": IMMUTABLE}
+        if entry["encodings"]:
+            headers["Vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+            for encoding in entry["encodings"]:  # brotli first when both exist
+                if encoding in accepted:
+                    file_path += ".br" if encoding == "br" else ".gz"
+                    headers["Content-Encoding"] = encoding
+                    break
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        return FileResponse(file_path, media_type=media_type, headers=headers, method=scope["method"])
+
+
+if __name__ == "__main__":
+    for name, entry in build().items():
+        target = os.path.join(build_dir, entry["hashed"])
+        sizes = [f"{os.path.getsize(target) / 1024:.1f} KB"] + [
+            f"{encoding} {os.path.getsize(target + ('.br' if encoding == 'br' else '.gz')) / 1024:.1f} KB"
+            for encoding in entry["encodings"]
+        ]
+        print(f"{name:<24} -> {entry['hashed']:<36} {', '.join(sizes)}")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Load benchmarks for the agency app.
+
+Runs the FastAPI app in-process against a throwaway SQLite database, so it
+never touches the DATABASE_URL configured for the real site. The benchmarks
+live in the benchmarks/ package, one module per area; this is the command
+line over them. Correctness checks, such as the SQL statement budget per
+page, are tests instead (python -m pytest).
+
+`load` is the suite for the public and admin routes. It seeds a volume of
+agencies, cities, models and bookings, then drives each route and reports
+throughput, p50/p95/p99 latency and SQL statements per request. --save
+writes these to a JSON baseline. --compare checks a run against one and
+exits 1 when a route got slower than --threshold, or runs more SQL.
+
+To load a real server over HTTP instead, seed the database it uses, start it,
+then point the suite at it. SQL counts come from its Server-Timing header:
+
+    BENCH_DATABASE_URL=postgresql://... python benchmark.py load --seed-only
+    python benchmark.py load --url http://localhost:8000 --no-seed --save baseline.json
+
+    python benchmark.py slow-query [--requests 300] [--concurrency 20] [--slow-seconds 2]
+    python benchmark.py uploads [--photos 10] [--latency 0.2] [--concurrency 4]
+    python benchmark.py json-decode [--renders 2000]
+    python benchmark.py page-cache [--requests 600] [--concurrency 10]
+    python benchmark.py images [--photos 3] [--width 2400]
+    python benchmark.py ttfb [--models 300] [--requests 30]
+    python benchmark.py dashboard [--bookings 100000] [--models 2000]
+    python benchmark.py facets [--models 10000]
+    python benchmark.py search [--profiles 50000]
+    python benchmark.py startup [--repeat 20]
+    python benchmark.py bulk-migrate [--models 50000] [--chunk-size 5000]
+    python benchmark.py pool [--requests 300] [--concurrency 60]
+    python benchmark.py profiling [--requests 300]
+    python benchmark.py metrics [--requests 600]
+    python benchmark.py load [--agencies 3] [--models 3000] [--bookings 30000] [--requests 200]
+                             [--concurrency 10] [--save FILE] [--compare FILE] [--threshold 0.25]
+    python benchmark.py cold-start [--repeat 5]
+    python benchmark.py fragments [--models 300] [--rounds 5]
+"""
+
+import argparse
+import asyncio
+import sys
+
+from benchmarks import common, database, load, observability, pages, queries, uploads  # noqa: F401 (registration)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Agency app benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (function, help, options) in common.COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help)
+        subparser.set_defaults(run=function)
+        for option, spec in options.items():
+            spec = dict(spec) if isinstance(spec, dict) else {"default": spec}
+            if isinstance(spec["default"], bool):
+                spec.setdefault("action", "store_true")
+            elif spec["default"] is not None:
+                spec.setdefault("type", type(spec["default"]))
+            subparser.add_argument("--" + option.replace("_", "-"), **spec)
+    args = parser.parse_args()
+    return asyncio.run(args.run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,4 @@
+"""
+Benchmarks of the agency app, one module per area; run them through
+benchmark.py. Each registers its commands with benchmarks.common.command.
+"""
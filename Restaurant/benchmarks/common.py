@@ -0,0 +1,142 @@
+"""
+Shared setup and helpers of the benchmarks.
+
+Importing this module points DATABASE_URL at a throwaway SQLite database
+(or BENCH_DATABASE_URL) before any app module creates its engine, so every
+benchmark module imports it ahead of the app.
+"""
+import asyncio
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_DIR = tempfile.mkdtemp(prefix="agency-bench-")
+os.environ["DATABASE_URL"] = os.environ.get("BENCH_DATABASE_URL", f"sqlite:///{BENCH_DIR}/bench.db")
+os.environ["MEDIA_WORKER"] = "off"  # benchmarks drain the media queue themselves
+os.environ["MEDIA_STAGING_DIR"] = os.path.join(BENCH_DIR, "staging")
+
+from sqlalchemy import event
+
+from models import engine, SessionLocal, Agency, City, Model
+
+COMMANDS = {}  # name -> (coroutine function, help, options)
+
+
+def command(name, help, **options):
+    """Register a benchmark as `python benchmark.py <name>`.
+
+    Each option becomes a --flag; its value is the default, or a dict of
+    add_argument keywords (see option()).
+    """
+    def register(function):
+        COMMANDS[name] = (function, help, options)
+        return function
+    return register
+
+
+def option(default=None, **kwargs):
+    """An option with more than a default: help text, action, metavar."""
+    return dict(kwargs, default=default)
+
+
+PUBLIC_PAGES = ["/", "/models", "/cities", "/city/Marbella", "/about", "/contact"]
+
+
+def seed_models(count):
+    db = SessionLocal()
+    try:
+        agency = db.query(Agency).first()
+        cities = db.query(City).all()
+        for i in range(count):
+            db.add(Model(
+                agency_id=agency.id,
+                city_id=cities[i % len(cities)].id,
+                name=f"Model {i}",
+                age=20 + i % 15,
+                height=160 + i % 25,
+                hair_color=["Blonde", "Brunette", "Black", "Red"][i % 4],
+                eye_color=["Blue", "Brown", "Green"][i % 3],
+                nationality=["Spanish", "Italian", "French", "Brazilian", "Russian"][i % 5],
+                availability=["Worldwide", "Local"][i % 2],
+                gender="female" if i % 5 else "male",
+                bio="Benchmark profile " * 8,
+                photos=json.dumps([f"https://example.com/{i}/{n}.jpg" for n in range(4)]),
+                languages=json.dumps(["English", "Spanish"] + (["French"] if i % 7 == 0 else [])),
+                rates=json.dumps({"short_sweet_hour": "500.-", "two_hours_passion": "900.-", "overnight": "2200.-"}),
+                status="approved",
+                featured=i < 6
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement the engine executes inside the block."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(label, samples):
+    print(f"{label:<28} n={len(samples):<5} "
+          f"p50={percentile(samples, 50) * 1000:7.1f}ms "
+          f"p95={percentile(samples, 95) * 1000:7.1f}ms "
+          f"p99={percentile(samples, 99) * 1000:7.1f}ms")
+
+
+async def drive(client, paths, total, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(paths[i % len(paths)])
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f"{paths[i % len(paths)]} returned {response.status_code}")
+
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return latencies
+
+
+def sample_photo(width, seed):
+    # Gradient with a block of color, so formats and the blurhash have real detail
+    from PIL import Image, ImageDraw
+    height = width * 3 // 2
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    ImageDraw.Draw(image).ellipse((width // 4, height // 4, width * 3 // 4, height * 3 // 4),
+                                  fill=(180 + seed * 20, 40, 90))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+SERVER_TIMING = re.compile(r'(\w+);dur=([\d.]+)(?:;desc="(\d+) queries")?')
+
+
+def server_timing(response):
+    return {name: (float(ms), int(queries) if queries else None)
+            for name, ms, queries in SERVER_TIMING.findall(response.headers.get("server-timing", ""))}
@@ -0,0 +1,196 @@
+"""
+Startup migrations, bulk data migrations and the connection pool.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# First, so DATABASE_URL points at the benchmark database before the app is imported
+from benchmarks.common import (
+    BENCH_DIR, command, count_queries, drive, option, percentile, seed_models, summarize,
+)
+
+import httpx
+from sqlalchemy import text
+
+import data_migrations
+import db_pool
+import main
+import migrations
+import page_cache
+from models import engine, SessionLocal, Agency, City, Model
+
+
+def rerun_all_steps():
+    # Roughly what every boot did before: re-check each change against the schema
+    for version, name, step in migrations.STEPS:
+        with engine.begin() as conn:
+            step(conn)
+
+
+@command("startup", "startup version check vs re-running every migration step", repeat=20)
+async def startup_benchmark(args):
+    started = time.perf_counter()
+    await main.startup_event()
+    print(f"first start on an empty database (migrates itself on SQLite): {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    for label, run in (("version check (startup now)", migrations.check), ("every step re-run (before)", rerun_all_steps)):
+        with count_queries() as statements:
+            run()
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            run()
+            samples.append(time.perf_counter() - started)
+        print(f"{label:<30} {len(statements):>4} statements, p50 {percentile(samples, 50) * 1000:8.2f}ms")
+    with count_queries() as statements:
+        started = time.perf_counter()
+        await main.startup_event()
+    print(f"warm startup_event: {(time.perf_counter() - started) * 1000:.0f}ms, {len(statements)} statements")
+    return 0
+
+
+LEGACY_RATES = [
+    None,
+    json.dumps({"short_price": "900.-", "overnight_price": "2500.-"}),
+    "On request",  # not JSON at all
+    json.dumps(data_migrations.LEGACY_DETAILED_RATES),  # already migrated
+    json.dumps({"short_sweet_hour": "500.-", "two_hours_passion": "900.-", "overnight": "2200.-"}),
+]
+
+
+def seed_rates(count):
+    db = SessionLocal()
+    try:
+        agency = db.query(Agency).first()
+        city_ids = [city_id for (city_id,) in db.query(City.id).filter(City.agency_id == agency.id)]
+        for start in range(0, count, 10000):
+            db.execute(Model.__table__.insert(), [{
+                "agency_id": agency.id, "city_id": city_ids[i % len(city_ids)], "name": f"Rates {i}",
+                "status": "approved", "photos": "[]", "rates": LEGACY_RATES[i % len(LEGACY_RATES)],
+            } for i in range(start, min(start + 10000, count))])
+        db.commit()
+    finally:
+        db.close()
+
+
+def rates_snapshot():
+    with engine.connect() as conn:
+        return dict(conn.execute(text("SELECT id, rates FROM models ORDER BY id")).all())
+
+
+def restore_rates(snapshot):
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE models SET rates = :rates WHERE id = :id"),
+                     [{"id": model_id, "rates": rates} for model_id, rates in snapshot.items()])
+        conn.execute(text("DELETE FROM data_migration_checkpoints"))
+
+
+def row_by_row_detailed_rates():
+    # What migrate_detailed_rates.py did: every row read, merged in Python and
+    # written back with its own UPDATE, all in one transaction
+    with engine.begin() as conn:
+        for model_id, current_rates in conn.execute(text("SELECT id, rates FROM models")).fetchall():
+            detailed = dict(data_migrations.LEGACY_DETAILED_RATES)
+            if current_rates:
+                try:
+                    existing = json.loads(current_rates)
+                    if isinstance(existing, dict):
+                        detailed.update(existing)
+                except ValueError:
+                    pass
+            conn.execute(text("UPDATE models SET rates = :rates WHERE id = :id"),
+                         {"rates": json.dumps(detailed), "id": model_id})
+
+
+def quiet_progress(*args, **kwargs):
+    pass
+
+
+@command("bulk-migrate", "chunked set-based data migration vs the row-by-row script",
+         models=50000, chunk_size=5000)
+async def bulk_migrate_benchmark(args):
+    await main.startup_event()
+    seed_rates(args.models)
+    original = rates_snapshot()
+    step = data_migrations.MIGRATIONS["detailed_rates"].passes[0]
+    print(f"{len(original)} models, chunks of {args.chunk_size}")
+
+    with count_queries() as statements:
+        started = time.perf_counter()
+        row_by_row_detailed_rates()
+        took = time.perf_counter() - started
+    print(f"{'row by row (before)':<28} {took * 1000:8.0f}ms {len(statements):>7} statements")
+
+    for label, set_based in (("set-based SQL per chunk", True), ("Python + executemany", False)):
+        restore_rates(original)
+        with count_queries() as statements:
+            changed, took = data_migrations.run_pass("bench", step, args.chunk_size, set_based=set_based,
+                                                     progress=quiet_progress)
+        print(f"{label:<28} {took * 1000:8.0f}ms {len(statements):>7} statements, {changed} rows changed")
+
+    # Dry run: counts and a timed sample, nothing written
+    restore_rates(original)
+    data_migrations.run("detailed_rates", dry=True, chunk_size=args.chunk_size)
+    return 0
+
+
+def print_pool(label, report):
+    waits = report["checkout_wait_ms"]
+    print(f"{label:<26} {report['checkouts']:>6} checkouts, peak {report['peak_in_use']} in use, "
+          f"{report['overflow_opened']} overflow opened, {report['timeouts']} timeouts, "
+          f"wait p50={waits['p50']:.2f}ms p95={waits['p95']:.2f}ms max={waits['max']:.2f}ms")
+
+
+def mixed_workload(pool_engine, threads, operations):
+    # One writer thread commits small updates while the others read
+    with pool_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS counters (id INTEGER PRIMARY KEY, hits INTEGER)"))
+        conn.execute(text("INSERT OR REPLACE INTO counters (id, hits) VALUES (1, 0)"))
+
+    def worker(index):
+        for _ in range(operations):
+            if index == 0:
+                with pool_engine.begin() as conn:
+                    conn.execute(text("UPDATE counters SET hits = hits + 1 WHERE id = 1"))
+            else:
+                with pool_engine.connect() as conn:
+                    conn.execute(text("SELECT hits FROM counters WHERE id = 1")).scalar()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, range(threads)))
+    return time.perf_counter() - started
+
+
+@command("pool", "the app under more concurrent requests than connections; WAL vs rollback journal",
+         models=200, requests=300, concurrency=60,
+         operations=option(300, help="per thread, for the WAL comparison"))
+async def pool_benchmark(args):
+    page_cache.set_backend(None)  # every request needs a connection
+    await main.startup_event()
+    seed_models(args.models)
+
+    # The app under more concurrent requests than DB_THREADS
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 cookies={"admin_logged_in": "true"}) as client:
+        latencies = await drive(client, ["/models", "/cities", "/city/Marbella"], args.requests, args.concurrency)
+        summarize(f"app, {args.concurrency} concurrent", latencies)
+        response = await client.get("/admin/db-pool")
+    report = response.json()
+    print_pool(f"app pool {report['size']}+{report['max_overflow']}, {report['threads']} threads", report)
+
+    # WAL + synchronous=NORMAL against SQLite's defaults (rollback journal, FULL)
+    timings = {}
+    for label, pragmas in (("rollback journal, FULL", {"journal_mode": "DELETE", "synchronous": "FULL"}),
+                           ("WAL, NORMAL", dict(db_pool.SQLITE_PRAGMAS))):
+        saved, db_pool.SQLITE_PRAGMAS = db_pool.SQLITE_PRAGMAS, {**db_pool.SQLITE_PRAGMAS, **pragmas}
+        try:
+            mixed = db_pool.make_engine(f"sqlite:///{BENCH_DIR}/{pragmas['journal_mode'].lower()}.db")
+            timings[label] = mixed_workload(mixed, 8, args.operations)
+            mixed.dispose()
+        finally:
+            db_pool.SQLITE_PRAGMAS = saved
+        print(f"{label:<26} 1 writer + 7 readers x {args.operations}: {timings[label] * 1000:.0f}ms")
+    return 0
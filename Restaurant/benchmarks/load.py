@@ -0,0 +1,375 @@
+"""
+The seeded load suite with baselines, and cold starts of fresh processes.
+"""
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from urllib.parse import quote
+
+# First, so DATABASE_URL points at the benchmark database before the app is imported
+from benchmarks.common import (
+    BENCH_DIR, PUBLIC_PAGES, command, count_queries, option, percentile, seed_models,
+    server_timing,
+)
+from benchmarks.queries import CORPUS_LANGUAGES, CORPUS_NATIONALITIES
+
+import httpx
+
+import dashboard_stats
+import facets
+import main
+import page_cache
+import search
+import tenants
+from models import engine, SessionLocal, Agency, City, Model, Booking
+
+
+LOAD_CITIES = ["Marbella", "Madrid", "Barcelona", "Ibiza", "Valencia", "Seville", "Malaga", "Bilbao",
+               "Palma", "Granada", "Alicante", "Cadiz"]
+LOAD_ROUTES = ["GET /", "GET /models?city&age_min", "GET /model/{id}", "GET /cities", "GET /admin/dashboard",
+               "GET /admin/bookings", "POST /book/{id}"]
+
+
+def seed_volume(agencies, cities, models, bookings, rng):
+    """Agencies bench1..N (plus the sample agency), each with its share of rows; Core inserts."""
+    db = SessionLocal()
+    try:
+        for n in range(1, agencies):
+            db.add(Agency(name=f"Bench Agency {n}", subdomain=f"bench{n}", email=f"info@bench{n}.example"))
+        db.flush()
+        agency_ids = [agency_id for (agency_id,) in db.query(Agency.id).order_by(Agency.id)][:agencies]
+        for agency_id in agency_ids:
+            existing = {name for (name,) in db.query(City.name).filter(City.agency_id == agency_id)}
+            db.add_all(City(agency_id=agency_id, name=name, country="Spain", active=True)
+                       for name in LOAD_CITIES[:cities] if name not in existing)
+        db.flush()
+        city_ids = {agency_id: [city_id for (city_id,) in db.query(City.id).filter(City.agency_id == agency_id)]
+                    for agency_id in agency_ids}
+
+        rows = []
+        for i in range(models):
+            agency_id = agency_ids[i % len(agency_ids)]
+            rows.append({
+                "agency_id": agency_id,
+                "city_id": rng.choice(city_ids[agency_id]),
+                "name": f"Load {i}",
+                "age": rng.randint(20, 34),
+                "height": rng.randint(158, 185),
+                "hair_color": rng.choice(["Blonde", "Brunette", "Black", "Red"]),
+                "eye_color": rng.choice(["Blue", "Brown", "Green"]),
+                "nationality": rng.choice(CORPUS_NATIONALITIES),
+                "availability": rng.choice(["Worldwide", "Local"]),
+                "gender": "female" if rng.random() < 0.8 else "male",
+                "bio": "Load profile " * 10,
+                "photos": json.dumps([f"https://example.com/{i}/{n}.jpg" for n in range(rng.randint(1, 8))]),
+                "languages": json.dumps(rng.sample(CORPUS_LANGUAGES, rng.randint(1, 3))),
+                "rates": json.dumps({"short_sweet_hour": "500.-", "two_hours_passion": "900.-",
+                                     "overnight": f"{rng.randint(18, 30)}00.-"}),
+                "status": "pending" if rng.random() < 0.1 else "approved",
+                "featured": rng.random() < 0.02,
+                "created_at": datetime(2025, 1, 1) + timedelta(minutes=i),
+            })
+            if len(rows) == 10000 or i == models - 1:
+                db.execute(Model.__table__.insert(), rows)
+                rows = []
+
+        model_ids = {agency_id: [] for agency_id in agency_ids}
+        for model_id, agency_id in db.query(Model.id, Model.agency_id).filter(Model.agency_id.in_(agency_ids)):
+            model_ids[agency_id].append(model_id)
+        for start in range(0, bookings, 10000):
+            batch = []
+            for i in range(start, min(start + 10000, bookings)):
+                agency_id = agency_ids[i % len(agency_ids)]
+                batch.append({
+                    "agency_id": agency_id,
+                    "model_id": rng.choice(model_ids[agency_id]),
+                    "client_name": f"Client {i}",
+                    "client_email": f"client{i}@example.com",
+                    "event_date": datetime(2026, 1, 1) + timedelta(days=i % 365),
+                    "event_type": "Dinner",
+                    "status": rng.choice(["pending", "confirmed", "cancelled"]),
+                    "created_at": datetime(2025, 1, 1) + timedelta(minutes=i),
+                })
+            db.execute(Booking.__table__.insert(), batch)
+        # Core inserts skip the ORM listeners; bring the derived tables up to date
+        dashboard_stats.rebuild(db)
+        search.rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+    for cache in (facets, page_cache, tenants):
+        cache.clear()
+
+
+def load_targets():
+    """Per agency: Host header, approved model ids and city names to pick requests from."""
+    db = SessionLocal()
+    try:
+        targets = []
+        for agency in db.query(Agency).filter(Agency.active.is_(True)).order_by(Agency.id):
+            model_ids = [model_id for (model_id,) in db.query(Model.id).filter(
+                Model.agency_id == agency.id, Model.status == "approved")]
+            cities = [name for (name,) in db.query(City.name).filter(City.agency_id == agency.id, City.active.is_(True))]
+            if model_ids and cities:
+                targets.append(SimpleNamespace(host=f"{agency.subdomain}.bench.test", model_ids=model_ids,
+                                               cities=cities))
+        return targets
+    finally:
+        db.close()
+
+
+def load_request(route, target, rng):
+    """(method, path, form) for one request to `route` on the agency `target`."""
+    if route == "GET /models?city&age_min":
+        return "GET", f"/models?city={quote(rng.choice(target.cities))}&age_min={rng.randint(20, 30)}", None
+    if route == "GET /model/{id}":
+        return "GET", f"/model/{rng.choice(target.model_ids)}", None
+    if route == "POST /book/{id}":
+        return "POST", f"/book/{rng.choice(target.model_ids)}", {
+            "client_name": "Load Test", "client_email": "load@example.com", "event_date": "2026-06-01",
+            "event_type": "Other", "message": "benchmark"}
+    method, path = route.split(" ", 1)
+    return method, path, None
+
+
+async def load_route(client, route, targets, requests, concurrency, rng, in_process):
+    plan = [load_request(route, targets[i % len(targets)], rng) + (targets[i % len(targets)].host,)
+            for i in range(requests)]
+    latencies, sql, errors = [], [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(method, path, form, host):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(method, path, data=form, headers={"host": host})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400 or (form and not response.json().get("success")):
+                errors += 1
+            if not in_process:
+                sql.append(server_timing(response).get("db", (0, None))[1])
+
+    with count_queries() as statements:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(*request) for request in plan))
+        elapsed = time.perf_counter() - started
+    if in_process:
+        sql_per_request = len(statements) / requests
+    else:
+        sql_per_request = None if None in sql else sum(sql) / requests  # None without PROFILING
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "sql_per_request": None if sql_per_request is None else round(sql_per_request, 2),
+    }
+
+
+def compare_to_baseline(baseline, routes, threshold, slack_ms):
+    """Regressions of `routes` against a saved baseline, as printable lines."""
+    regressions = []
+    for route, result in routes.items():
+        before = baseline["routes"].get(route)
+        if before is None:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            limit = before[key] * (1 + threshold) + slack_ms
+            if result[key] > limit:
+                regressions.append(f"{route}: {key} {result[key]:.2f} > {limit:.2f} (baseline {before[key]:.2f})")
+        if None not in (before["sql_per_request"], result["sql_per_request"]) \
+                and result["sql_per_request"] > before["sql_per_request"] + 0.5:
+            regressions.append(f"{route}: {result['sql_per_request']:.1f} SQL statements per request "
+                               f"(baseline {before['sql_per_request']:.1f})")
+    return regressions
+
+
+@command("load", "seeded load test of the public and admin routes, with baselines",
+         agencies=3, cities=option(8, help="per agency"), models=3000, bookings=30000,
+         requests=option(200, help="per route"), concurrency=10,
+         seed=option(42, help="random seed for data and request order"),
+         no_page_cache=option(False, help="in-process: render every page"),
+         url=option(help="load a running server over HTTP instead of in-process"),
+         seed_only=option(False, help="seed BENCH_DATABASE_URL and stop"),
+         no_seed=option(False, help="use the data already in the database"),
+         save=option(metavar="FILE", help="write the results as a JSON baseline"),
+         compare=option(metavar="FILE", help="fail on regressions against a saved baseline"),
+         threshold=option(0.25, help="allowed p50/p95 slowdown, 0.25 = 25%%"),
+         slack_ms=option(1.0, help="absolute slack added to every limit"))
+async def load_benchmark(args):
+    settings = {"agencies": args.agencies, "cities": args.cities, "models": args.models, "bookings": args.bookings,
+                "requests": args.requests, "concurrency": args.concurrency, "seed": args.seed,
+                "page_cache": not args.no_page_cache}
+    rng = random.Random(args.seed)
+    in_process = args.url is None
+    if in_process or args.seed_only:
+        if args.no_page_cache:
+            page_cache.set_backend(None)
+        await main.startup_event()
+    if not args.no_seed:
+        started = time.perf_counter()
+        seed_volume(args.agencies, args.cities, args.models, args.bookings, rng)
+        print(f"seeded {args.agencies} agencies x {args.cities} cities, {args.models} models, "
+              f"{args.bookings} bookings in {time.perf_counter() - started:.1f}s ({engine.dialect.name})")
+    if args.seed_only:
+        return 0
+    targets = load_targets()
+
+    transport = httpx.ASGITransport(app=main.app) if in_process else None
+    async with httpx.AsyncClient(transport=transport, base_url=args.url or "http://bench", timeout=60,
+                                 cookies={"admin_logged_in": "true"}) as client:
+        for route in LOAD_ROUTES:  # warm templates, tenant and facet caches
+            await load_route(client, route, targets, len(targets), 1, rng, in_process)
+        routes = {}
+        print(f"{'route':<26} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'SQL/req':>8} {'errors':>6}")
+        for route in LOAD_ROUTES:
+            result = routes[route] = await load_route(client, route, targets, args.requests, args.concurrency,
+                                                      rng, in_process)
+            sql = "-" if result["sql_per_request"] is None else f"{result['sql_per_request']:.1f}"
+            print(f"{route:<26} {result['throughput_rps']:>8.0f} {result['p50_ms']:>7.1f}ms {result['p95_ms']:>7.1f}ms "
+                  f"{result['p99_ms']:>7.1f}ms {sql:>8} {result['errors']:>6}")
+
+    report = {"version": 1, "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+              "mode": "in-process" if in_process else "http", "target": args.url,
+              "database": engine.dialect.name if in_process else None, "python": sys.version.split()[0],
+              "settings": settings, "routes": routes}
+    failed = sum(result["errors"] for result in routes.values())
+    if failed:
+        print(f"❌ {failed} requests failed")
+    if args.save:
+        with open(args.save, "w") as out:
+            json.dump(report, out, indent=2)
+        print(f"ℹ️  Baseline written to {args.save}")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["settings"] != settings or baseline["mode"] != report["mode"]:
+            print(f"⚠️  Baseline was taken with {baseline['mode']} {baseline['settings']}; timings may not compare")
+        regressions = compare_to_baseline(baseline, routes, args.threshold, args.slack_ms)
+        for line in regressions:
+            print(f"❌ {line}")
+        if not regressions:
+            print(f"✅ No route slower than baseline +{args.threshold * 100:.0f}% (+{args.slack_ms}ms)")
+        failed += len(regressions)
+    return 1 if failed else 0
+
+
+COLD_START_PAGES = PUBLIC_PAGES + ["/model/1", "/admin/dashboard", "/admin/models", "/admin/bookings"]
+
+
+async def cold_start_child():
+    # Run in a fresh process by cold_start_benchmark; BENCH_SPAWNED is when the parent started it
+    imported = time.time() - float(os.environ["BENCH_SPAWNED"])
+    import templating
+    compiled = []
+    precompile = templating.precompile
+
+    def timed_precompile(env):
+        started = time.perf_counter()
+        count = precompile(env)
+        compiled.append((count, time.perf_counter() - started))
+        return count
+
+    templating.precompile = timed_precompile
+    await main.startup_event()
+    report = {"import_ms": imported * 1000,
+              "startup_ms": (time.time() - float(os.environ["BENCH_SPAWNED"]) - imported) * 1000,
+              "precompile_ms": sum(seconds for _, seconds in compiled) * 1000,
+              "cached_after_startup": len(main.templates.env.cache), "pages": {}}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 cookies={"admin_logged_in": "true"}) as client:
+        for path in COLD_START_PAGES:
+            started = time.perf_counter()
+            response = await client.get(path)
+            report["pages"][path] = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                report.setdefault("errors", []).append(f"{path}: {response.status_code}")
+            if path == COLD_START_PAGES[0]:
+                report["first_response_ms"] = (time.time() - float(os.environ["BENCH_SPAWNED"])) * 1000
+    print(json.dumps(report))
+
+
+def run_cold_start(settings):
+    env = {**os.environ, **settings, "BENCH_DATABASE_URL": str(engine.url), "BENCH_SPAWNED": repr(time.time())}
+    child = "import asyncio; from benchmarks import load; asyncio.run(load.cold_start_child())"
+    output = subprocess.run([sys.executable, "-c", child],
+                            env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@command("cold-start", "fresh process to first responses, lazy vs precompiled templates",
+         models=60, repeat=5, lookups=option(20000, help="get_template calls per reload setting"))
+async def cold_start_benchmark(args):
+    await main.startup_event()  # migrate and seed the database the children share
+    seed_models(args.models)
+    failures = 0
+
+    def check(ok, label):
+        nonlocal failures
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {label}")
+
+    template_count = len(main.templates.env.list_templates(extensions=["html"]))
+    lazy = {"TEMPLATE_RELOAD": "on", "TEMPLATE_PRECOMPILE": "off", "TEMPLATE_CACHE_DIR": "off"}
+    runs = {"lazy compile (before)": [], "precompile, empty cache": [], "precompile, warm cache": []}
+    for n in range(args.repeat):
+        cache_dir = os.path.join(BENCH_DIR, f"template-cache-{n}")
+        precompiled = {"TEMPLATE_RELOAD": "off", "TEMPLATE_PRECOMPILE": "on", "TEMPLATE_CACHE_DIR": cache_dir}
+        runs["lazy compile (before)"].append(run_cold_start(lazy))
+        runs["precompile, empty cache"].append(run_cold_start(precompiled))
+        runs["precompile, warm cache"].append(run_cold_start(precompiled))
+
+    print(f"Fresh processes, median of {args.repeat}; pages: {' '.join(COLD_START_PAGES)}")
+    print(f"{'':<26} {'import':>8} {'startup':>8} {'compile':>8} {'1st resp':>9} {'1st pages':>10}")
+    medians = {}
+    for label, reports in runs.items():
+        errors = [error for report in reports for error in report.get("errors", [])]
+        check(not errors, f"{label}: every page 200 {errors[:3] if errors else ''}".rstrip())
+        medians[label] = {key: percentile([report[key] for report in reports], 50)
+                          for key in ("import_ms", "startup_ms", "precompile_ms", "first_response_ms")}
+        medians[label]["pages_ms"] = percentile([sum(report["pages"].values()) for report in reports], 50)
+        row = medians[label]
+        print(f"{label:<26} {row['import_ms']:>6.0f}ms {row['startup_ms']:>6.0f}ms {row['precompile_ms']:>6.1f}ms "
+              f"{row['first_response_ms']:>7.0f}ms {row['pages_ms']:>8.1f}ms")
+
+    lazy_row, cold_row, warm_row = (medians[label] for label in runs)
+    check(all(report["cached_after_startup"] >= template_count
+              for label in list(runs)[1:] for report in runs[label]),
+          f"precompile: all {template_count} templates compiled before the first request")
+    check(all(report["cached_after_startup"] == 0 for report in runs["lazy compile (before)"]),
+          "lazy: nothing compiled before the first request")
+    check(warm_row["precompile_ms"] < cold_row["precompile_ms"],
+          f"warm bytecode cache: precompile {warm_row['precompile_ms']:.1f}ms vs {cold_row['precompile_ms']:.1f}ms "
+          f"compiling from source")
+    check(warm_row["pages_ms"] < lazy_row["pages_ms"],
+          f"first requests: {warm_row['pages_ms']:.1f}ms precompiled vs {lazy_row['pages_ms']:.1f}ms compiling on demand")
+
+    # Reload checks: with auto_reload every get_template stats the file
+    env = main.templates.env
+    template = env.get_template("about.html")
+    reload_setting = env.auto_reload
+    lookups = {}
+    try:
+        for auto_reload in (True, False):
+            env.auto_reload = auto_reload
+            started = time.perf_counter()
+            for _ in range(args.lookups):
+                found = env.get_template("about.html")
+            lookups[auto_reload] = (time.perf_counter() - started) / args.lookups
+            check(found is template, f"auto_reload={auto_reload}: cached template reused, "
+                                     f"{lookups[auto_reload] * 1e6:.2f}µs per lookup")
+    finally:
+        env.auto_reload = reload_setting
+    check(lookups[False] < lookups[True],
+          f"no reload checks: lookup {lookups[True] / lookups[False]:.1f}x faster (TEMPLATE_RELOAD=off)")
+    return 1 if failures else 0
@@ -0,0 +1,116 @@
+"""
+Cost of the profiling and metrics middleware.
+"""
+import time
+
+# First, so DATABASE_URL points at the benchmark database before the app is imported
+from benchmarks.common import PUBLIC_PAGES, command, drive, percentile, seed_models, summarize
+
+import httpx
+from sqlalchemy import event
+from starlette.middleware import Middleware
+
+import main
+import metrics
+import page_cache
+import profiling
+from models import engine
+
+
+def set_profiling(enabled):
+    # Rebuild the ASGI stack with or without the middleware and SQL events
+    middleware = [m for m in main.app.user_middleware if m.cls is not profiling.ProfilingMiddleware]
+    if enabled:
+        profiling.instrument(engine)
+        middleware.insert(0, Middleware(profiling.ProfilingMiddleware))
+    else:
+        event.remove(engine, "before_cursor_execute", profiling._before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", profiling._after_cursor_execute)
+    main.app.user_middleware = middleware
+    main.app.middleware_stack = main.app.build_middleware_stack()
+
+
+@command("profiling", "cost of the profiling middleware and SQL events", models=60, requests=300)
+async def profiling_benchmark(args):
+    page_cache.set_backend(None)  # profile the rendering path, not cache hits
+    await main.startup_event()
+    seed_models(args.models)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 cookies={"admin_logged_in": "true"}) as client:
+        await drive(client, PUBLIC_PAGES, len(PUBLIC_PAGES), 1)  # warm templates
+
+        # Overhead: the same requests with the middleware and events removed
+        results = {}
+        for enabled in (False, True, False, True):
+            set_profiling(enabled)
+            latencies = await drive(client, ["/models", "/model/1", "/cities"], args.requests, 1)
+            results.setdefault(enabled, []).extend(latencies)
+        for enabled, latencies in results.items():
+            summarize(f"profiling {'on' if enabled else 'off'}", latencies)
+        overhead = percentile(results[True], 50) / percentile(results[False], 50) - 1
+        print(f"ℹ️  p50 overhead {overhead * 100:+.1f}%")
+        for row in profiling.window.endpoints(limit=5):
+            print(f"   {row['endpoint']:<28} n={row['requests']:<3} p95={row['p95_ms']:6.1f}ms "
+                  f"queries={row['queries']:4.1f} sql={row['sql_ms']:5.1f}ms")
+    return 0
+
+
+def set_metrics(enabled):
+    middleware = [m for m in main.app.user_middleware if m.cls is not metrics.MetricsMiddleware]
+    if enabled:
+        middleware.insert(0, Middleware(metrics.MetricsMiddleware))
+    main.app.user_middleware = middleware
+    main.app.middleware_stack = main.app.build_middleware_stack()
+
+
+@command("metrics", "cost of recording metrics per request", models=60, requests=600)
+async def metrics_benchmark(args):
+    await main.startup_event()
+    seed_models(args.models)
+    failures = 0
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Overhead: the middleware around an app that does nothing, against a real request's time
+        latencies = await drive(client, PUBLIC_PAGES, args.requests, 1)
+
+        async def bare_app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def discard(message):
+            pass
+
+        async def per_call(app, rounds=50000):
+            started = time.perf_counter()
+            for _ in range(rounds):
+                await app({"type": "http", "method": "GET", "endpoint": main.models_page,
+                           "router": main.app.router}, None, discard)
+            return (time.perf_counter() - started) / rounds
+
+        instrumented, bare = [], []
+        for _ in range(3):
+            instrumented.append(await per_call(metrics.MetricsMiddleware(bare_app)))
+            bare.append(await per_call(bare_app))
+        per_request = min(instrumented) - min(bare)
+        share = per_request / percentile(latencies, 50)
+        failures += share >= 0.02
+        print(f"{'✅' if share < 0.02 else '❌'} recording costs {per_request * 1e6:.1f}µs per request, "
+              f"{share * 100:.2f}% of the p50 request ({percentile(latencies, 50) * 1000:.2f}ms)")
+
+        # End to end, alternating with and without the middleware; the median
+        # of per-round medians, since GC pauses and scheduling are larger than the effect
+        results, medians = {}, {}
+        for enabled in (False, True) * 10:
+            set_metrics(enabled)
+            samples = await drive(client, PUBLIC_PAGES, args.requests // 10, 1)
+            results.setdefault(enabled, []).extend(samples)
+            medians.setdefault(enabled, []).append(percentile(samples, 50))
+        set_metrics(True)
+        for enabled, samples in results.items():
+            summarize(f"metrics {'on' if enabled else 'off'}", samples)
+        print(f"ℹ️  end-to-end p50 difference "
+              f"{(percentile(medians[True], 50) / percentile(medians[False], 50) - 1) * 100:+.1f}% (noise included)")
+    return 1 if failures else 0
@@ -0,0 +1,294 @@
+"""
+Public page benchmarks: the threadpool under a slow query, the page and
+fragment caches, JSON decoding in templates and time to first byte.
+"""
+import asyncio
+import json
+import time
+
+# First, so DATABASE_URL points at the benchmark database before the app is imported
+from benchmarks.common import (
+    PUBLIC_PAGES, command, drive, option, percentile, seed_models,
+    server_timing, summarize,
+)
+
+import httpx
+from fastapi import Depends
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session, joinedload
+
+import fragments
+import images
+import main
+import models
+import page_cache
+from models import engine, get_db, SessionLocal, Model
+
+
+def install_slow_route(seconds):
+    # SQLite has no sleep(); register one so the slow query really blocks
+    # inside the driver, the way a slow Postgres statement would
+    @event.listens_for(engine, "connect")
+    def add_sleep(dbapi_connection, connection_record):
+        if hasattr(dbapi_connection, "create_function"):
+            dbapi_connection.create_function("bench_sleep", 1, lambda s: time.sleep(s) or 0)
+
+    engine.dispose()
+
+    @main.app.get("/__bench/slow")
+    def slow_query(db: Session = Depends(get_db)):
+        db.execute(text("SELECT bench_sleep(:seconds)"), {"seconds": seconds}).scalar()
+        return {"slept": seconds}
+
+
+@command("slow-query", "public page p99 while one slow query is in flight",
+         requests=300, concurrency=20, models=60, slow_seconds=2.0,
+         max_ratio=option(2.0, help="exit non-zero when the in-flight p99 exceeds baseline p99 by this factor"))
+async def slow_query_benchmark(args):
+    page_cache.set_backend(None)  # measure the DB path, not cache hits
+    install_slow_route(args.slow_seconds)
+    await main.startup_event()
+    seed_models(args.models)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await drive(client, PUBLIC_PAGES, len(PUBLIC_PAGES), 1)  # warm templates
+
+        baseline = await drive(client, PUBLIC_PAGES, args.requests, args.concurrency)
+
+        slow_started = time.perf_counter()
+        slow_task = asyncio.create_task(client.get("/__bench/slow"))
+        await asyncio.sleep(0.05)
+        loaded = await drive(client, PUBLIC_PAGES, args.requests, args.concurrency)
+        overlapped = not slow_task.done()
+        await slow_task
+        slow_elapsed = time.perf_counter() - slow_started
+
+    print(f"Public pages {PUBLIC_PAGES}, {args.models} approved models, concurrency {args.concurrency}")
+    summarize("baseline", baseline)
+    summarize(f"with {args.slow_seconds}s query in flight", loaded)
+    print(f"slow request took {slow_elapsed:.2f}s, overlapped whole run: {overlapped}")
+
+    ratio = percentile(loaded, 99) / percentile(baseline, 99)
+    print(f"p99 ratio (in flight / baseline): {ratio:.2f}")
+    return 0 if ratio < args.max_ratio else 1
+
+
+@command("json-decode", "JSON decode cost per profile render", renders=2000)
+async def json_decode_benchmark(args):
+    await main.startup_event()
+    seed_models(1)
+    db = SessionLocal()
+    model = db.query(Model).options(joinedload(Model.city)).first()
+    template = main.templates.get_template("model_profile.html")
+
+    decodes = 0
+    real_loads = json.loads
+
+    def counting_loads(*a, **kw):
+        nonlocal decodes
+        decodes += 1
+        return real_loads(*a, **kw)
+
+    json.loads = counting_loads
+    try:
+        started = time.perf_counter()
+        for _ in range(args.renders):
+            models._drop_json_cache(model)  # every request sees a fresh instance
+            template.render(model=model)
+        render_seconds = time.perf_counter() - started
+    finally:
+        json.loads = real_loads
+    db.close()
+
+    # Decode work alone: what the template used to do through the from_json
+    # filter (photos x2, rates x3, languages x1) against the cached accessors
+    legacy_columns = [model.photos] * 2 + [model.rates] * 3 + [model.languages]
+    started = time.perf_counter()
+    for _ in range(args.renders):
+        for value in legacy_columns:
+            main.from_json_filter(value)
+    legacy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(args.renders):
+        models._drop_json_cache(model)
+        model.photo_list, model.photo_list, model.rate_map, model.rate_map, model.rate_map, model.language_list
+    accessor_seconds = time.perf_counter() - started
+
+    print(f"model_profile.html: {decodes / args.renders:.1f} json decodes per render "
+          f"(was {len(legacy_columns)}), {render_seconds / args.renders * 1e6:.0f}µs per render")
+    print(f"decode cost per render: from_json filter {legacy_seconds / args.renders * 1e6:.1f}µs, "
+          f"cached accessors {accessor_seconds / args.renders * 1e6:.1f}µs")
+    return 0
+
+
+@command("page-cache", "cold vs warm public page throughput and invalidation",
+         requests=600, concurrency=10, models=60)
+async def page_cache_benchmark(args):
+    await main.startup_event()
+    seed_models(args.models)
+    paths = PUBLIC_PAGES + ["/models?city=Marbella", "/model/1", "/model/2"]
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 cookies={"admin_logged_in": "true"}) as client:
+        page_cache.set_backend(None)
+        await drive(client, paths, len(paths), 1)  # warm templates
+        started = time.perf_counter()
+        cold = await drive(client, paths, args.requests, args.concurrency)
+        cold_seconds = time.perf_counter() - started
+
+        page_cache.set_backend(page_cache.MemoryBackend())
+        await drive(client, paths, len(paths), 1)  # fill the cache
+        page_cache.reset_stats()
+        started = time.perf_counter()
+        warm = await drive(client, paths, args.requests, args.concurrency)
+        warm_seconds = time.perf_counter() - started
+        hit_stats = page_cache.stats()
+
+        # An admin edit must evict exactly the pages that show the model
+        await client.post("/admin/models/1/toggle-featured", json={"featured": False})
+        results = {path: (await client.get(path)).headers.get("X-Cache") for path in paths}
+
+    print(f"{len(paths)} public pages, {args.models} approved models, concurrency {args.concurrency}")
+    summarize("cold (cache off)", cold)
+    summarize("warm (cache on)", warm)
+    print(f"throughput: cold {args.requests / cold_seconds:7.0f} req/s, "
+          f"warm {args.requests / warm_seconds:7.0f} req/s "
+          f"({cold_seconds / warm_seconds:.1f}x), hit ratio {hit_stats['hit_ratio']:.0%}")
+    print("after toggling model 1 featured: " + ", ".join(f"{path} {state}" for path, state in results.items()))
+    expected_hits = {"/about", "/contact", "/model/2"}
+    ok = all((results[path] == "HIT") == (path in expected_hits) for path in paths)
+    print(f"{'✅' if ok else '❌'} invalidation evicted the listings and /model/1 only")
+    return 0 if ok else 1
+
+
+async def asgi_get(path, headers=()):
+    """GET through the ASGI app directly, timing the first body chunk.
+
+    Returns (status, seconds to first byte, seconds to last byte, wire bytes).
+    """
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "server": ("bench", 80), "client": ("127.0.0.1", 50000), "root_path": "",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+    result = {"first": None, "bytes": 0}
+    done = asyncio.Event()
+    requested = False
+
+    async def receive():
+        # The request body once, then block until the response is over like a
+        # connected client would (StreamingResponse listens for disconnects)
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            if result["first"] is None:
+                result["first"] = time.perf_counter() - started
+            result["bytes"] += len(message["body"])
+
+    started = time.perf_counter()
+    try:
+        await main.app(scope, receive, send)
+    finally:
+        done.set()
+    total = time.perf_counter() - started
+    return result["status"], result["first"] or total, total, result["bytes"]
+
+
+@command("ttfb", "time to first byte, buffered vs streamed, with and without compression",
+         models=300, requests=30)
+async def ttfb_benchmark(args):
+    page_cache.set_backend(None)
+    await main.startup_event()
+    seed_models(args.models)
+    main.ADMIN_PAGE_SIZE = args.models  # one long admin table, the worst case
+
+    admin = ("cookie", "admin_logged_in=true")
+    print(f"{args.models} models, {args.requests} sequential requests per row (page cache off)")
+    print(f"{'page':<16} {'render':<9} {'encoding':<9} {'TTFB p50':>10} {'total p50':>10} {'on the wire':>12}")
+    for path, modes in (("/admin/models", (False, True)), ("/models", (False,))):
+        for streaming in modes:
+            main.STREAM_TEMPLATES = streaming
+            for encoding in ("identity", "gzip", "br"):
+                headers = [admin, ("accept-encoding", encoding)]
+                await asgi_get(path, headers)  # warm templates
+                samples = [await asgi_get(path, headers) for _ in range(args.requests)]
+                if any(status != 200 for status, *_ in samples):
+                    raise RuntimeError(f"{path} returned {samples[0][0]}")
+                print(f"{path:<16} {'streamed' if streaming else 'buffered':<9} {encoding:<9} "
+                      f"{percentile([s[1] for s in samples], 50) * 1000:8.1f}ms "
+                      f"{percentile([s[2] for s in samples], 50) * 1000:8.1f}ms "
+                      f"{samples[-1][3] / 1024:9.1f} KB")
+    return 0
+
+
+FRAGMENT_PAGES = ["/", "/models", "/city/Marbella", "/model/1"]
+
+
+def seed_photo_meta():
+    # Derivative metadata like images.py records, so every card renders its full <picture>
+    db = SessionLocal()
+    try:
+        for model in db.query(Model):
+            model.photo_meta = json.dumps({url: {
+                "width": 1200, "height": 1800, "color": "#a05060", "blurhash": "LKO2?U%2Tw=w]~RBVZRi};RPxuwH",
+                "variants": [{"format": image_format, "width": width, "url": f"{url}.{width}.{image_format}"}
+                             for image_format in images.IMAGE_FORMATS for width in images.IMAGE_WIDTHS],
+            } for url in model.photo_list})
+        db.commit()
+    finally:
+        db.close()
+
+
+def set_fragment_cache(enabled):
+    fragments.FRAGMENT_CACHE = "on" if enabled else "off"
+    fragments.cache.clear()
+
+
+@command("fragments", "cached model cards, rates and galleries vs rendering them",
+         models=300, rounds=5, requests=option(20, help="per page, setting and round"))
+async def fragments_benchmark(args):
+    page_cache.set_backend(None)  # render every request
+    await main.startup_event()
+    seed_models(args.models)
+    seed_photo_meta()
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 cookies={"admin_logged_in": "true"}) as client:
+        await drive(client, FRAGMENT_PAGES, len(FRAGMENT_PAGES), 1)  # warm the facet index
+        set_fragment_cache(True)
+        await drive(client, FRAGMENT_PAGES, len(FRAGMENT_PAGES), 1)  # and the fragment cache
+        print(f"{len(fragments.cache._entries)} fragments cached")
+
+        # Alternating rounds; render time from Server-Timing, latency end to end
+        print(f"{args.models} approved models, page cache off, median of {args.rounds} rounds x {args.requests}")
+        print(f"{'':<16} {'render off':>11} {'render on':>10} {'latency off':>12} {'latency on':>11}")
+        for path in FRAGMENT_PAGES:
+            samples = {False: ([], []), True: ([], [])}
+            for _ in range(args.rounds):
+                for enabled in (False, True):
+                    fragments.FRAGMENT_CACHE = "on" if enabled else "off"
+                    renders, latencies = samples[enabled]
+                    for _ in range(args.requests):
+                        started = time.perf_counter()
+                        response = await client.get(path)
+                        latencies.append(time.perf_counter() - started)
+                        renders.append(server_timing(response).get("render", (0.0, None))[0])
+            (off_render, off_latency), (on_render, on_latency) = samples[False], samples[True]
+            print(f"{path:<16} {percentile(off_render, 50):>9.2f}ms {percentile(on_render, 50):>8.2f}ms "
+                  f"{percentile(off_latency, 50) * 1000:>10.2f}ms {percentile(on_latency, 50) * 1000:>9.2f}ms")
+        fragments.FRAGMENT_CACHE = "on"
+    return 0
@@ -0,0 +1,275 @@
+"""
+Listing, dashboard, facet and search queries on large seeded tables.
+"""
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+# First, so DATABASE_URL points at the benchmark database before the app is imported
+from benchmarks.common import command, count_queries, percentile, seed_models
+
+import httpx
+from sqlalchemy import or_
+
+import dashboard_stats
+import facets
+import main
+import models
+import search
+import tenants
+from models import SessionLocal, Agency, City, Model, Booking
+
+
+def bulk_seed_bookings(count):
+    # Core executemany, the way an import script would load them; such writes
+    # bypass the ORM, so the status counters are rebuilt afterwards
+    db = SessionLocal()
+    try:
+        agency = db.query(Agency).first()
+        model_ids = [model_id for (model_id,) in db.query(Model.id).filter(Model.agency_id == agency.id)]
+        for start in range(0, count, 10000):
+            db.execute(Booking.__table__.insert(), [{
+                "agency_id": agency.id,
+                "model_id": model_ids[i % len(model_ids)],
+                "client_name": f"Client {i}",
+                "client_email": f"client{i}@example.com",
+                "event_date": datetime(2026, 1, 1) + timedelta(days=i % 365),
+                "event_type": "Dinner",
+                "status": ["pending", "confirmed", "cancelled"][i % 3],
+                "created_at": datetime(2025, 1, 1) + timedelta(minutes=i),
+            } for i in range(start, min(start + 10000, count))])
+        dashboard_stats.rebuild(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+def legacy_dashboard_counts(db, agency_id):
+    # What admin_dashboard ran before: five separate COUNTs
+    models = db.query(Model).filter(Model.agency_id == agency_id)
+    bookings = db.query(Booking).filter(Booking.agency_id == agency_id)
+    return {
+        "total_models": models.count(),
+        "approved_models": models.filter(Model.status == "approved").count(),
+        "pending_models": models.filter(Model.status == "pending").count(),
+        "total_bookings": bookings.count(),
+        "pending_bookings": bookings.filter(Booking.status == "pending").count()
+    }
+
+
+@command("dashboard", "dashboard status counts on a large bookings table",
+         models=2000, bookings=100000, repeat=20)
+async def dashboard_benchmark(args):
+    await main.startup_event()
+    seed_models(args.models)
+    bulk_seed_bookings(args.bookings)
+    agency = tenants.resolve("bench")
+    print(f"{args.models} models, {args.bookings} bookings")
+
+    db = SessionLocal()
+    try:
+        expected = legacy_dashboard_counts(db, agency.id)
+        modes = [("5 x COUNT (before)", lambda: legacy_dashboard_counts(db, agency.id))]
+        for mode in ("query", "counters"):
+            def run(mode=mode):
+                dashboard_stats.DASHBOARD_STATS = mode
+                return dashboard_stats.dashboard_counts(db, agency)
+            modes.append((f"DASHBOARD_STATS={mode}", run))
+        failures = 0
+        for label, run in modes:
+            with count_queries() as statements:
+                result = run()
+            samples = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                run()
+                samples.append(time.perf_counter() - started)
+            failures += result != expected
+            print(f"{'✅' if result == expected else '❌'} {label:<26} {len(statements)} queries, "
+                  f"p50 {percentile(samples, 50) * 1000:8.2f}ms")
+    finally:
+        db.close()
+
+    # Handlers move the counters in the same transaction as the status change
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 cookies={"admin_logged_in": "true"}) as client:
+        await client.post("/admin/models/1/reject")
+        await client.post("/admin/models/2/reject")
+        await client.post("/admin/models/2/approve")
+        await client.post("/admin/bookings/1/confirm")
+        await client.post("/admin/bookings/2/cancel")
+        await client.post("/book/3", data={"client_name": "New", "client_email": "new@example.com",
+                                           "event_date": "2026-05-01", "event_type": "Dinner"})
+        await client.post("/apply", data={"name": "Applicant", "phone": "1", "age": "25", "height": "170",
+                                          "hair_color": "Red", "eye_color": "Green", "gender": "female",
+                                          "city_id": "1"},
+                          files=[("photos", ("a.jpg", b"", "image/jpeg"))])
+        with count_queries() as statements:
+            response = await client.get("/admin/dashboard")
+    db = SessionLocal()
+    try:
+        live, stored = dashboard_stats.grouped_counts(db), dashboard_stats.stored_counts(db)
+    finally:
+        db.close()
+    ok = live == stored
+    failures += not ok
+    print(f"{'✅' if ok else '❌'} counters match a live count after approve/reject/confirm/cancel/book/apply")
+    print(f"/admin/dashboard: status {response.status_code}, {len(statements)} queries")
+    return 1 if failures else 0
+
+
+FACET_QUERIES = [
+    {},
+    {"city": "Marbella"},
+    {"hair_color": "Blonde", "eye_color": "Green"},
+    {"city": "Malaga", "language": "French", "age_min": 25},
+    {"nationality": "Italian", "availability": "Local", "height_min": 175, "age_max": 30},
+]
+
+
+def time_per_call(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+@command("facets", "in-memory facet index vs SQL filtering", models=10000, repeat=50)
+async def facets_benchmark(args):
+    # Index correctness (same pages and counts as SQL) is tests/test_facets.py
+    await main.startup_event()
+    seed_models(args.models)
+    agency = tenants.resolve("bench")
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        facets.clear()
+        index = facets.index_for(db, agency.id)
+        print(f"index of {len(index)} approved models built in {(time.perf_counter() - started) * 1000:.0f}ms")
+        print(f"{'filters':<86} {'SQL page':>9} {'index page':>11} {'count':>8} {'facet counts':>13}")
+        for filters in FACET_QUERIES:
+            filled = dict.fromkeys(main.DIRECTORY_FILTERS, None) | filters
+            sql = time_per_call(lambda: main.keyset_page(
+                main.directory_query(db, agency, gender="female", **filled), main.DIRECTORY_ORDER), args.repeat)
+            page = time_per_call(lambda: facets.search(
+                db, agency.id, dict(filters, gender="female"), main.DIRECTORY_ORDER), args.repeat)
+            count = time_per_call(lambda: index.count(filters), args.repeat)
+            counts = time_per_call(lambda: index.facet_counts(filters), args.repeat)
+            print(f"{json.dumps(filters):<86} {sql * 1000:7.2f}ms {page * 1000:9.2f}ms "
+                  f"{count * 1e6:6.0f}µs {counts * 1e6:11.0f}µs")
+
+        # Cost of patching committed edits into the index, against a rebuild
+        model_ids = [model_id for (model_id,) in db.query(Model.id).filter(Model.agency_id == agency.id).limit(40)]
+        for model_id in model_ids:
+            model = db.get(Model, model_id)
+            model.hair_color = "Red" if model.hair_color != "Red" else "Blonde"
+        db.commit()
+        started = time.perf_counter()
+        facets.index_for(db, agency.id)
+        patched = time.perf_counter() - started
+        started = time.perf_counter()
+        facets.FacetIndex(agency.id).load(db)
+        rebuilt = time.perf_counter() - started
+        print(f"{len(model_ids)} edited models patched in {patched * 1000:.1f}ms, full rebuild {rebuilt * 1000:.0f}ms")
+    finally:
+        db.close()
+    return 0
+
+
+CORPUS_LANGUAGES = ["English", "Spanish", "French", "Italian", "German", "Portuguese", "Russian", "Arabic", "Dutch"]
+CORPUS_NATIONALITIES = ["Spanish", "Italian", "French", "Brazilian", "Russian", "Swedish", "Colombian", "Polish"]
+CORPUS_JOBS = ["Dancer", "Student", "Photographer", "Fitness coach", "Architect", "Actress", "Nurse", "Sommelier"]
+CORPUS_STYLES = ["Elegant evening wear", "Casual chic", "Sporty", "Bohemian", "Classic tailoring", "Streetwear"]
+CORPUS_CUISINES = ["Italian", "Japanese sushi", "Mediterranean", "Thai", "French pastry", "Mexican", "Indian curry"]
+CORPUS_HOBBIES = ["yoga", "sailing", "salsa dancing", "painting", "travelling", "wine tasting", "tennis", "reading poetry",
+                  "cooking", "horse riding", "skiing", "photography", "live jazz", "scuba diving"]
+
+
+def corpus_profile(rng, i):
+    languages = rng.sample(CORPUS_LANGUAGES, rng.randint(1, 4))
+    hobbies = rng.sample(CORPUS_HOBBIES, 3)
+    job = rng.choice(CORPUS_JOBS)
+    bio = f"{job} with a love for {hobbies[0]} and {hobbies[1]}. Weekends mean {hobbies[2]}."
+    if rng.random() < 0.5:
+        bio += f" I speak {' and '.join(languages)}."
+    return {
+        "name": f"Profile {i}",
+        "bio": bio,
+        "languages": json.dumps(languages),
+        "nationality": rng.choice(CORPUS_NATIONALITIES),
+        "job": job,
+        "clothing_style": rng.choice(CORPUS_STYLES),
+        "favorite_cuisine": rng.choice(CORPUS_CUISINES),
+    }
+
+
+def bulk_seed_profiles(count):
+    # Core executemany like an import script; that bypasses the ORM, so the
+    # search index is rebuilt afterwards
+    rng = random.Random(17)
+    db = SessionLocal()
+    try:
+        agency = db.query(Agency).first()
+        city_ids = [city_id for (city_id,) in db.query(City.id).filter(City.agency_id == agency.id)]
+        for start in range(0, count, 10000):
+            db.execute(Model.__table__.insert(), [{
+                **corpus_profile(rng, i),
+                "agency_id": agency.id,
+                "city_id": city_ids[i % len(city_ids)],
+                "age": 20 + i % 15,
+                "height": 160 + i % 25,
+                "gender": "female" if i % 5 else "male",
+                "photos": "[]",
+                # Every 10th profile is awaiting review and must never show up
+                "status": "pending" if i % 10 == 0 else "approved",
+                "created_at": datetime(2025, 1, 1) + timedelta(minutes=i),
+            } for i in range(start, min(start + 10000, count))])
+        started = time.perf_counter()
+        indexed = search.rebuild(db)
+        db.commit()
+        return indexed, time.perf_counter() - started
+    finally:
+        db.close()
+
+
+SEARCH_QUERIES = ["speaks French", "Italian cuisine", "yoga", "elegant evening wear", "Brazilian dancer",
+                  "sushi sailing", "photographer who loves live jazz"]
+
+
+def like_search_ids(db, agency, query, limit=search.PAGE_SIZE):
+    # The only option without an index: every word somewhere in the text columns, no ranking
+    columns = [getattr(Model, field) for field in search.FIELDS]
+    ids = tenants.scoped(db, agency, Model, Model.id).filter(Model.status == "approved")
+    for word in search.terms(query):
+        ids = ids.filter(or_(*(column.ilike(f"%{word}%") for column in columns)))
+    return [model_id for (model_id,) in ids.order_by(Model.id.desc()).limit(limit)]
+
+
+@command("search", "full-text search over a generated profile corpus", profiles=50000, repeat=50)
+async def search_benchmark(args):
+    await main.startup_event()
+    indexed, took = bulk_seed_profiles(args.profiles)
+    agency = tenants.resolve("bench")
+    print(f"{indexed} profiles indexed in {took:.1f}s ({models.engine.dialect.name})")
+
+    db = SessionLocal()
+    try:
+        print(f"{'query':<36} {'hits':>5} {'match':>6} {'LIKE scan':>10} {'full-text':>10} {'p95':>9}")
+        for query in SEARCH_QUERIES:
+            like = time_per_call(lambda: like_search_ids(db, agency, query), max(args.repeat // 10, 1))
+            samples = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                results = search.search(db, agency.id, query)
+                samples.append(time.perf_counter() - started)
+            print(f"{query:<36} {len(results.hits):>5} {results.match:>6} {like * 1000:8.1f}ms "
+                  f"{percentile(samples, 50) * 1000:8.2f}ms {percentile(samples, 95) * 1000:7.2f}ms")
+    finally:
+        db.close()
+    return 0
+
+
+# models as the first releases created it, before any of the migration scripts
@@ -0,0 +1,104 @@
+"""
+Photo uploads to media storage and the derivatives made from them.
+"""
+import asyncio
+import os
+import time
+
+# First, so DATABASE_URL points at the benchmark database before the app is imported
+from benchmarks.common import BENCH_DIR, command, sample_photo
+
+import httpx
+from sqlalchemy.orm import joinedload
+
+import images
+import jobs
+import main
+import media
+from models import SessionLocal, Model
+
+
+@command("uploads", "multi-photo application against a fake storage backend",
+         photos=10, photo_bytes=256 * 1024, latency=0.2, concurrency=media.UPLOAD_CONCURRENCY)
+async def upload_benchmark(args):
+    await main.startup_event()
+    form = {
+        "name": "Bench", "phone": "1", "age": "25", "height": "170", "hair_color": "Blonde",
+        "eye_color": "Blue", "gender": "female", "city_id": "1", "bio": ""
+    }
+    files = [("photos", (f"photo{n}.jpg", b"x" * args.photo_bytes, "image/jpeg")) for n in range(args.photos)]
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"POST /apply with {args.photos} photos of {args.photo_bytes} bytes, "
+              f"{args.latency * 1000:.0f}ms fake storage latency")
+        for concurrency in (1, args.concurrency):
+            media.set_storage(media.LocalStorage(root=os.path.join(BENCH_DIR, "uploads"), latency=args.latency),
+                              concurrency=concurrency)
+            started = time.perf_counter()
+            response = await client.post("/apply", data=form, files=files)
+            responded = time.perf_counter() - started
+            if not response.json().get("success"):
+                raise RuntimeError(response.text)
+            started = time.perf_counter()
+            while await asyncio.to_thread(jobs.process_due_jobs):
+                pass
+            drained = time.perf_counter() - started
+            print(f"upload concurrency {concurrency:<3} POST {responded * 1000:7.1f}ms  "
+                  f"worker upload {drained * 1000:8.1f}ms")
+    return 0
+
+
+@command("images", "photo derivatives through the local Pillow generator", photos=3, width=2400)
+async def image_benchmark(args):
+    if images.Image is None:
+        print("Pillow is not installed")
+        return 1
+    await main.startup_event()
+    root = os.path.join(BENCH_DIR, "uploads")
+    media.set_storage(media.LocalStorage(root=root, base_url="/bench-uploads"))
+    form = {
+        "name": "Bench", "phone": "1", "age": "25", "height": "170", "hair_color": "Blonde",
+        "eye_color": "Blue", "gender": "female", "city_id": "1", "bio": "", "status": "approved"
+    }
+    files = [("photos", (f"photo{n}.jpg", sample_photo(args.width, n), "image/jpeg")) for n in range(args.photos)]
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        response = await client.post("/admin/models/add", data=form, files=files)
+        if not response.json().get("success"):
+            raise RuntimeError(response.text)
+        started = time.perf_counter()
+        while await asyncio.to_thread(jobs.process_due_jobs):
+            pass
+        drained = time.perf_counter() - started
+
+        db = SessionLocal()
+        model = db.query(Model).options(joinedload(Model.city)).order_by(Model.id.desc()).first()
+        card = main.templates.get_template("model_cards.html").render(models=[model])
+        db.close()
+
+    def stored_size(url):
+        return os.path.getsize(os.path.join(root, url[len("/bench-uploads/"):]))
+
+    print(f"{args.photos} photos of {args.width}px, widths {images.IMAGE_WIDTHS}, formats {images.IMAGE_FORMATS}; "
+          f"worker took {drained * 1000:.0f}ms including derivatives")
+    failures = 0
+    for url in model.photo_list:
+        info = model.photo_info(url)
+        if not info:
+            print(f"❌ {url}: no metadata")
+            failures += 1
+            continue
+        print(f"✅ {url}: {info['width']}x{info['height']} color {info['color']} blurhash {info['blurhash']}")
+        original = stored_size(url)
+        for variant in info["variants"]:
+            size = stored_size(variant["url"])
+            print(f"      {variant['format']:<5} {variant['width']:>5}w {size / 1024:8.1f} KB "
+                  f"({size / original:6.1%} of the {original / 1024:.0f} KB original)")
+
+    sources = card.count("<source ")
+    ok = sources == len(images.IMAGE_FORMATS) and 'sizes="' in card
+    failures += not ok
+    print(f"{'✅' if ok else '❌'} model card renders {sources} <source> srcsets")
+    return 1 if failures else 0
@@ -0,0 +1,128 @@
+"""
+Brotli/gzip compression for dynamic responses.
+
+Pure ASGI middleware, so streamed pages keep streaming: every chunk is
+compressed and flushed as it is sent instead of after the whole body.
+Buffered responses under COMPRESS_MIN_SIZE bytes, non-text content types and
+responses that already carry a Content-Encoding (the precompressed static
+assets) pass through untouched.
+"""
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from assets import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+# Per-request compression: favour speed over the last few percent of size
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/javascript", "application/xml", "image/svg+xml"
+)
+
+
+class _GzipStream:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def chunk(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data):
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def chunk(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data):
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+
+class _CompressingSend:
+    def __init__(self, send, encoding, minimum_size):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.stream = None  # set once we decide to compress
+        self.decided = False
+
+    def _new_stream(self):
+        return _BrotliStream(BROTLI_QUALITY) if self.encoding == "br" else _GzipStream(GZIP_LEVEL)
+
+    def _compressible(self, headers):
+        content_type = headers.get("content-type", "")
+        return (
+            self.start["status"] not in (204, 304)
+            and "content-encoding" not in headers
+            and content_type.startswith(COMPRESSIBLE_TYPES)
+        )
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            # Hold the headers until the first body chunk says how big it is
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.decided:
+            self.decided = True
+            headers = MutableHeaders(raw=self.start["headers"])
+            if self._compressible(headers):
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    # Streamed: length unknown, compress and flush chunk by chunk
+                    self.stream = self._new_stream()
+                    headers["Content-Encoding"] = self.encoding
+                    del headers["Content-Length"]
+                    message = {**message, "body": self.stream.chunk(body)}
+                elif len(body) >= self.minimum_size:
+                    body = self._new_stream().finish(body)
+                    headers["Content-Encoding"] = self.encoding
+                    headers["Content-Length"] = str(len(body))
+                    message = {**message, "body": body}
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        if self.stream is not None:
+            body = self.stream.chunk(body) if more_body else self.stream.finish(body)
+            message = {**message, "body": body}
+        await self.send(message)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Model and booking counts per status for the admin dashboard.
+
+status_counts holds one row per (agency, table, status). Every ORM flush
+that inserts, deletes or re-statuses a Model or Booking adjusts those rows
+in the same transaction, so reading the dashboard costs one small query
+however large the tables grow. DASHBOARD_STATS=query counts live instead,
+with one GROUP BY status query per table.
+
+Writes that bypass the ORM (raw SQL, bulk imports) don't move the counters.
+Recount after them, or whenever `--check` reports drift:
+
+    python dashboard_stats.py --check
+    python dashboard_stats.py --rebuild
+"""
+import os
+import sys
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event, func, inspect, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import SessionLocal, Model, Booking, StatusCount
+
+DASHBOARD_STATS = os.environ.get("DASHBOARD_STATS", "counters")
+
+COUNTED = {Model: "models", Booking: "bookings"}
+
+
+def grouped_counts(db, agency_id=None):
+    """{(agency_id, table, status): rows} straight from the tables, one GROUP BY each."""
+    counts = {}
+    for entity, table in COUNTED.items():
+        query = db.query(entity.agency_id, entity.status, func.count())
+        if agency_id is not None:
+            query = query.filter(entity.agency_id == agency_id)
+        for row_agency, status, count in query.group_by(entity.agency_id, entity.status):
+            if status is not None:
+                counts[(row_agency, table, status)] = count
+    return counts
+
+
+def stored_counts(db, agency_id=None):
+    query = db.query(StatusCount).filter(StatusCount.count != 0)
+    if agency_id is not None:
+        query = query.filter(StatusCount.agency_id == agency_id)
+    return {(row.agency_id, row.table_name, row.status): row.count for row in query}
+
+
+def dashboard_counts(db, agency):
+    """The numbers on the dashboard cards for `agency`."""
+    if DASHBOARD_STATS == "query":
+        counts = grouped_counts(db, agency.id)
+    else:
+        counts = stored_counts(db, agency.id)
+    models = {status: count for (_, table, status), count in counts.items() if table == "models"}
+    bookings = {status: count for (_, table, status), count in counts.items() if table == "bookings"}
+    return {
+        "total_models": sum(models.values()),
+        "approved_models": models.get("approved", 0),
+        "pending_models": models.get("pending", 0),
+        "total_bookings": sum(bookings.values()),
+        "pending_bookings": bookings.get("pending", 0)
+    }
+
+
+def rebuild(db):
+    """Recount status_counts from the tables; the caller commits."""
+    db.query(StatusCount).delete()
+    counts = grouped_counts(db)
+    db.add_all(
+        StatusCount(agency_id=agency_id, table_name=table, status=status, count=count)
+        for (agency_id, table, status), count in counts.items()
+    )
+    return counts
+
+
+def ensure_counters(db):
+    """Fill status_counts when it is empty but the tables are not; the caller commits."""
+    if db.query(StatusCount).first() is None and (db.query(Model.id).first() or db.query(Booking.id).first()):
+        counts = rebuild(db)
+        print(f"✅ Counted {sum(counts.values())} models and bookings into status_counts")
+
+
+def _upsert(connection, agency_id, table, status, delta):
+    values = {"agency_id": agency_id, "table_name": table, "status": status, "count": delta}
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = (postgresql if dialect == "postgresql" else sqlite).insert(StatusCount).values(**values)
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=["agency_id", "table_name", "status"],
+            set_={"count": StatusCount.count + delta}
+        ))
+        return
+    result = connection.execute(update(StatusCount).where(
+        StatusCount.agency_id == agency_id, StatusCount.table_name == table, StatusCount.status == status
+    ).values(count=StatusCount.count + delta))
+    if not result.rowcount:
+        connection.execute(StatusCount.__table__.insert().values(**values))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _count_status_changes(session, flush_context):
+    # Attribute history still shows the previous status at this point
+    deltas = Counter()
+    for obj in session.new:
+        if type(obj) in COUNTED and obj.status is not None:
+            deltas[(obj.agency_id, COUNTED[type(obj)], obj.status)] += 1
+    for obj in session.deleted:
+        if type(obj) in COUNTED:
+            history = inspect(obj).attrs.status.history
+            status = history.deleted[0] if history.deleted else obj.status
+            if status is not None:
+                deltas[(obj.agency_id, COUNTED[type(obj)], status)] -= 1
+    for obj in session.dirty:
+        if type(obj) in COUNTED:
+            history = inspect(obj).attrs.status.history
+            if history.added and history.deleted and history.added[0] != history.deleted[0]:
+                if history.deleted[0] is not None:
+                    deltas[(obj.agency_id, COUNTED[type(obj)], history.deleted[0])] -= 1
+                if history.added[0] is not None:
+                    deltas[(obj.agency_id, COUNTED[type(obj)], history.added[0])] += 1
+
+    if any(deltas.values()):
+        connection = session.connection()
+        # Fixed order so concurrent transactions lock counter rows alike
+        for (agency_id, table, status), delta in sorted(deltas.items()):
+            if delta:
+                _upsert(connection, agency_id, table, status, delta)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Dashboard status counters")
+    parser.add_argument("--rebuild", action="store_true", help="recount status_counts from the tables")
+    parser.add_argument("--check", action="store_true", help="compare status_counts with a live count")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.rebuild:
+            counts = rebuild(db)
+            db.commit()
+            print(f"✅ Rebuilt status_counts: {len(counts)} rows")
+        if args.check or not args.rebuild:
+            live, stored = grouped_counts(db), stored_counts(db)
+            drift = {key: (stored.get(key, 0), live.get(key, 0))
+                     for key in set(live) | set(stored) if stored.get(key, 0) != live.get(key, 0)}
+            for (agency_id, table, status), (counted, actual) in sorted(drift.items()):
+                print(f"❌ agency {agency_id} {table} {status}: counter {counted}, actual {actual}")
+            if not drift:
+                print("✅ status_counts matches the tables")
+            sys.exit(1 if drift else 0)
+    finally:
+        db.close()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Bulk data migrations: rewrite rows in place without a round-trip per row.
+
+A migration is one or more passes over a table. Each pass walks the table in
+primary-key ranges of --chunk-size ids and commits every range on its own, so
+no lock is held for longer than one chunk. A range is changed by one UPDATE
+where the backend can express the change in SQL (jsonb on Postgres, the json1
+functions on SQLite). Elsewhere, or when that UPDATE fails on odd data, the
+rows are read and passed through a Python transform, then written back with a
+single executemany.
+
+The last finished id of every pass is stored in data_migration_checkpoints
+together with that chunk's update. An interrupted run therefore resumes where
+it stopped. Passes only touch rows that still need the change, so running a
+finished migration again (--restart) changes nothing.
+
+    python data_migrations.py list
+    python data_migrations.py status
+    python data_migrations.py run detailed_rates --dry-run     # counts and a timed sample, rolled back
+    python data_migrations.py run detailed_rates [--chunk-size 5000] [--pause 0.1] [--restart] [--python]
+
+These are Core statements. ORM listeners don't see them, so the page cache,
+fragment cache, facet index and search index only catch up after their TTL
+or a rebuild (search.py --rebuild when searched columns change).
+"""
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import delete, insert, select, text, update
+from sqlalchemy.exc import DBAPIError
+
+from models import engine, DataMigrationCheckpoint
+
+CHUNK_SIZE = int(os.environ.get("DATA_MIGRATION_CHUNK_SIZE", "5000"))
+
+# table: name with an integer `id` primary key
+# where / assignments: {dialect or "default": SQL}; rows needing the change, and the SET list
+# columns / transform: Python fallback; transform(row) -> {column: value}, or None when
+#   the row is already done. Without a transform the pass requires its SQL.
+Pass = namedtuple("Pass", "table where assignments params columns transform")
+Migration = namedtuple("Migration", "description passes")
+
+
+class Interrupted(Exception):
+    """Raised by a progress callback to stop after the current chunk."""
+
+
+# --- detailed_rates (was migrate_detailed_rates.py) ---
+
+LEGACY_DETAILED_RATES = {
+    "short_price": "On Request",
+    "gentleman_price": "1400.- / 1300.- (Member)",
+    "overnight_price": "2200.- / 2000.- (Member)",
+    "luxury_price": "3200.- / 3000.- (Member)",
+    "detailed": {
+        "1_short_hour": "Members Only / On Request",
+        "1_5_short_hours": "Members Only / On Request",
+        "2_hours_passion": "900.- / 800.- (Member)",
+        "3_unforgettable": "1200.- / 1100.- (Member)",
+        "4_intimate_dinner": "1400.- / 1300.- (Member)",
+        "5_intimate_dinner": "1600.- / 1500.- (Member)",
+        "short_overnight_8h": "2200.- / 2000.- (Member)",
+        "long_overnight_12h": "2400.- / 2200.- (Member)",
+        "long_overnight_18h": "2800.- / 2600.- (Member)",
+        "one_day_24h": "3200.- / 3000.- (Member)",
+        "two_days_48h": "4500.- / 4300.- (Member)",
+        "additional_day": "1400.- / 1200.- (Member)"
+    }
+}
+
+
+def _reject_constant(name):
+    raise ValueError(f"{name} is not JSON")
+
+
+def detailed_rates(row):
+    # Defaults under the model's own keys; rates that aren't a JSON object are
+    # replaced. NaN/Infinity count as not JSON, as they do for the SQL passes.
+    try:
+        existing = json.loads(row["rates"], parse_constant=_reject_constant) if row["rates"] else None
+    except ValueError:
+        existing = None
+    if isinstance(existing, dict) and "detailed" in existing:
+        return None
+    rates = dict(LEGACY_DETAILED_RATES)
+    if isinstance(existing, dict):
+        rates.update(existing)
+    return {"rates": json.dumps(rates)}
+
+
+# CASE keeps the JSON functions away from text that isn't JSON
+_RATES_TODO = {
+    "sqlite": """CASE WHEN rates IS NULL OR NOT json_valid(rates) THEN 1
+                      WHEN json_type(rates) <> 'object' THEN 1
+                      WHEN json_type(rates, '$.detailed') IS NULL THEN 1 ELSE 0 END = 1""",
+    "postgresql": r"""CASE WHEN rates IS NULL OR rates !~ '^\s*\{' THEN true
+                           ELSE NOT jsonb_exists(CAST(rates AS jsonb), 'detailed') END""",
+}
+# Both a shallow merge like dict.update: the model's keys win, its nulls and
+# nested objects are kept as they are. (SQLite's json_patch is RFC 7396,
+# which deletes keys set to null and merges nested objects.)
+_RATES_MERGED = {
+    "sqlite": """rates = CASE WHEN rates IS NULL OR NOT json_valid(rates) THEN :defaults
+                              WHEN json_type(rates) = 'object' THEN (
+                                  SELECT json_group_object(key, CASE type
+                                      WHEN 'true' THEN json('true') WHEN 'false' THEN json('false')
+                                      WHEN 'object' THEN json(value) WHEN 'array' THEN json(value) ELSE value END)
+                                  FROM (SELECT key, value, type FROM json_each(:defaults)
+                                        WHERE key NOT IN (SELECT key FROM json_each(models.rates))
+                                        UNION ALL
+                                        SELECT key, value, type FROM json_each(models.rates)))
+                              ELSE :defaults END""",
+    # jsonb || keeps the right-hand value for keys present on both sides, nulls included
+    "postgresql": r"""rates = CAST(CASE WHEN rates IS NULL OR rates !~ '^\s*\{' THEN CAST(:defaults AS jsonb)
+                                        ELSE CAST(:defaults AS jsonb) || CAST(rates AS jsonb) END AS text)""",
+}
+
+
+# --- merge_duplicate_cities (was fix_duplicate_cities.py) ---
+
+# The city kept for each (agency, name): the first active one, else the
+# first one. The same subquery picks it in both passes, so models never move
+# to a city that is then renamed. uq_cities_agency_name can be created once
+# no duplicates are left (python add_indexes.py)
+_KEPT_CITY = ("(SELECT kept.id FROM cities kept "
+              "WHERE kept.agency_id = {city}.agency_id AND kept.name = {city}.name "
+              "ORDER BY CASE WHEN kept.active THEN 0 ELSE 1 END, kept.id LIMIT 1)")
+_DUPLICATE_CITY = f"id <> {_KEPT_CITY.format(city='cities')}"
+
+MIGRATIONS = {
+    "detailed_rates": Migration(
+        "merge the legacy detailed price list into models.rates, keeping each model's own prices",
+        [Pass("models", _RATES_TODO, _RATES_MERGED, {"defaults": json.dumps(LEGACY_DETAILED_RATES)},
+              ["rates"], detailed_rates)],
+    ),
+    "merge_duplicate_cities": Migration(
+        "move models to the kept city of each duplicated name (the first active one), "
+        "then rename and deactivate the copies",
+        [
+            Pass("models", {"default": f"city_id IN (SELECT id FROM cities WHERE {_DUPLICATE_CITY})"},
+                 {"default": f"city_id = (SELECT {_KEPT_CITY.format(city='dup')} FROM cities dup "
+                             "WHERE dup.id = models.city_id)"},
+                 {}, [], None),
+            Pass("cities", {"default": _DUPLICATE_CITY},
+                 {"default": "name = name || ' (' || id || ')', active = false"},
+                 {}, [], None),
+        ],
+    ),
+}
+
+
+def _for_dialect(sql, dialect):
+    return sql.get(dialect, sql.get("default"))
+
+
+def _next_upper(conn, table, last_id, chunk_size):
+    """The highest id of the next chunk after `last_id`, or None when the table is done."""
+    upper = conn.execute(text(f"SELECT id FROM {table} WHERE id > :last ORDER BY id LIMIT 1 OFFSET :skip"),
+                         {"last": last_id, "skip": chunk_size - 1}).scalar()
+    if upper is None:
+        upper = conn.execute(text(f"SELECT max(id) FROM {table} WHERE id > :last"), {"last": last_id}).scalar()
+    return upper
+
+
+def _apply_chunk(conn, step, low, high, set_based=True):
+    """Change the rows of ids (low, high] that need it; returns how many changed."""
+    dialect = conn.dialect.name
+    where, assignments = _for_dialect(step.where, dialect), _for_dialect(step.assignments, dialect)
+    bounds = {"low": low, "high": high}
+    if set_based and assignments and where:
+        statement = text(f"UPDATE {step.table} SET {assignments} WHERE id > :low AND id <= :high AND ({where})")
+        if step.transform is None or dialect != "postgresql":
+            return conn.execute(statement, {**step.params, **bounds}).rowcount
+        # A bad value (say, rates text that only looks like JSON) fails the
+        # cast; redo just this chunk row by row in Python
+        savepoint = conn.begin_nested()
+        try:
+            changed = conn.execute(statement, {**step.params, **bounds}).rowcount
+            savepoint.commit()
+            return changed
+        except DBAPIError:
+            savepoint.rollback()
+    if step.transform is None:
+        raise ValueError(f"{step.table} pass has no SQL for {dialect} and no Python transform")
+
+    rows = conn.execute(text(f"SELECT id, {', '.join(step.columns)} FROM {step.table} "
+                             "WHERE id > :low AND id <= :high"), bounds).mappings()
+    updates = [dict(changes, id=row["id"]) for row in rows if (changes := step.transform(row)) is not None]
+    if updates:
+        columns = [column for column in updates[0] if column != "id"]
+        conn.execute(text(f"UPDATE {step.table} SET {', '.join(f'{c} = :{c}' for c in columns)} WHERE id = :id"),
+                     updates)
+    return len(updates)
+
+
+def _checkpoint(conn, key):
+    return conn.execute(select(DataMigrationCheckpoint).where(DataMigrationCheckpoint.name == key)).first()
+
+
+def count_pending(conn, step):
+    """Rows the pass would change, or None when only its Python transform can tell."""
+    where = _for_dialect(step.where, conn.dialect.name)
+    if not where:
+        return None
+    try:
+        return conn.execute(text(f"SELECT count(*) FROM {step.table} WHERE {where}"), step.params).scalar()
+    except DBAPIError:
+        conn.rollback()
+        return None
+
+
+def _report(key, scanned, total, changed, started, done=False):
+    elapsed = time.perf_counter() - started
+    rate = scanned / elapsed if elapsed else 0
+    remaining = f", ~{(total - scanned) / rate:.0f}s left" if rate and not done else ""
+    print(f"{'✅' if done else '⏳'} {key}: {scanned:,}/{total:,} rows ({scanned * 100 // max(total, 1)}%), "
+          f"{changed:,} changed, {rate:,.0f} rows/s{remaining}")
+
+
+def run_pass(key, step, chunk_size=CHUNK_SIZE, pause=0.0, restart=False, set_based=True, progress=_report):
+    """Run one pass to the end, resuming from its checkpoint. Returns (rows changed, seconds)."""
+    with engine.begin() as conn:
+        checkpoint = _checkpoint(conn, key)
+        if restart and checkpoint:
+            conn.execute(delete(DataMigrationCheckpoint).where(DataMigrationCheckpoint.name == key))
+            checkpoint = None
+        if checkpoint and checkpoint.finished_at:
+            print(f"ℹ️  {key} finished {checkpoint.finished_at:%Y-%m-%d %H:%M}; --restart to run it again")
+            return 0, 0.0
+        if checkpoint is None:
+            conn.execute(insert(DataMigrationCheckpoint).values(name=key, last_id=0, rows_changed=0))
+        last_id = checkpoint.last_id if checkpoint else 0
+        changed = checkpoint.rows_changed if checkpoint else 0
+        total = conn.execute(text(f"SELECT count(*) FROM {step.table}")).scalar()
+        scanned = conn.execute(text(f"SELECT count(*) FROM {step.table} WHERE id <= :last"),
+                               {"last": last_id}).scalar()
+    if last_id:
+        print(f"ℹ️  {key}: resuming after id {last_id}")
+
+    started = time.perf_counter()
+    while True:
+        with engine.begin() as conn:
+            high = _next_upper(conn, step.table, last_id, chunk_size)
+            values = {"updated_at": datetime.utcnow()}
+            if high is None:
+                values["finished_at"] = values["updated_at"]
+            else:
+                chunk_changed = _apply_chunk(conn, step, last_id, high, set_based)
+                changed += chunk_changed
+                values.update(last_id=high, rows_changed=changed)
+            # Committed with the chunk, so a crash never skips or repeats one
+            conn.execute(update(DataMigrationCheckpoint).where(DataMigrationCheckpoint.name == key).values(**values))
+        if high is None:
+            progress(key, total, total, changed, started, done=True)
+            return changed, time.perf_counter() - started
+        scanned = min(scanned + chunk_size, total)
+        last_id = high
+        progress(key, scanned, total, changed, started)
+        if pause:
+            time.sleep(pause)
+
+
+def dry_run(key, step, chunk_size=CHUNK_SIZE, sample_chunks=3, set_based=True):
+    """Count pending rows and time a few chunks, then roll everything back."""
+    with engine.connect() as conn:
+        total = conn.execute(text(f"SELECT count(*) FROM {step.table}")).scalar()
+        pending = count_pending(conn, step)
+        try:
+            started = time.perf_counter()
+            last_id, scanned, changed = 0, 0, 0
+            for _ in range(sample_chunks):
+                high = _next_upper(conn, step.table, last_id, chunk_size)
+                if high is None:
+                    break
+                changed += _apply_chunk(conn, step, last_id, high, set_based)
+                scanned, last_id = min(scanned + chunk_size, total), high
+            took = time.perf_counter() - started
+        finally:
+            conn.rollback()
+    estimate = took * total / scanned if scanned else 0.0
+    print(f"🔎 {key}: {total:,} rows, {'unknown' if pending is None else f'{pending:,}'} to change; "
+          f"sample of {scanned:,} rows changed {changed:,} in {took * 1000:.0f}ms (rolled back), "
+          f"~{estimate:.1f}s for the table at --chunk-size {chunk_size}")
+    return {"rows": total, "pending": pending, "sampled": scanned, "sample_changed": changed,
+            "sample_seconds": took, "estimated_seconds": estimate}
+
+
+def run(name, dry=False, **options):
+    """Run (or dry-run) every pass of migration `name` in order."""
+    migration = MIGRATIONS[name]
+    results = []
+    for index, step in enumerate(migration.passes):
+        key = f"{name}:{index}"
+        if dry:
+            results.append(dry_run(key, step, options.get("chunk_size", CHUNK_SIZE),
+                                   set_based=options.get("set_based", True)))
+        else:
+            results.append(run_pass(key, step, **options))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk data migrations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="available migrations")
+    subparsers.add_parser("status", help="checkpoints of started migrations")
+    runner = subparsers.add_parser("run", help="run or resume a migration")
+    runner.add_argument("name", choices=sorted(MIGRATIONS))
+    runner.add_argument("--dry-run", action="store_true", help="count rows and time a sample, then roll back")
+    runner.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    runner.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between chunks")
+    runner.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first row")
+    runner.add_argument("--python", action="store_true", help="skip the set-based SQL, use the Python transform")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for name, migration in sorted(MIGRATIONS.items()):
+            print(f"{name}: {migration.description}")
+    elif args.command == "status":
+        with engine.connect() as conn:
+            for row in conn.execute(select(DataMigrationCheckpoint).order_by(DataMigrationCheckpoint.name)):
+                state = f"finished {row.finished_at:%Y-%m-%d %H:%M}" if row.finished_at else f"at id {row.last_id}"
+                print(f"{'✅' if row.finished_at else '⏳'} {row.name}: {state}, {row.rows_changed:,} rows changed")
+    elif args.dry_run:
+        run(args.name, dry=True, chunk_size=args.chunk_size, set_based=not args.python)
+    else:
+        run(args.name, chunk_size=args.chunk_size, pause=args.pause, restart=args.restart,
+            set_based=not args.python)
@@ -0,0 +1,192 @@
+"""
+Engine factory and connection pool statistics.
+
+Every database-backed handler runs on FastAPI's threadpool and holds one
+pooled connection for the life of its Session, so the pool bounds how many
+requests reach the database at once (models.DB_THREADS follows it).
+
+Postgres gets a QueuePool of DB_POOL_SIZE connections. Under load up to
+DB_MAX_OVERFLOW more are opened, and they are closed again when returned.
+Each uvicorn worker process (WEB_CONCURRENCY, set by Heroku) has its own
+pool. When DB_MAX_CONNECTIONS (the plan's connection limit) is set, each
+worker is capped at its share, after DB_RESERVED_CONNECTIONS for the release
+phase, the media worker and psql sessions. Connections are pinged before
+use and recycled after DB_POOL_RECYCLE seconds, so one dropped by the
+server or a failover is replaced instead of failing a request.
+
+SQLite uses the same pool over one file (connections move between threads,
+hence check_same_thread=False), and sets these pragmas on every new
+connection:
+
+  * journal_mode=WAL: readers no longer block the writer, or the other way round
+  * synchronous=NORMAL: fsync at checkpoints only; still crash-safe with WAL
+  * mmap_size / cache_size: reads come from memory instead of read() calls
+  * busy_timeout: a second writer waits for the lock instead of failing
+
+An in-memory SQLite database keeps SQLAlchemy's default pool, since every
+new connection would be a new, empty database.
+
+The pool records checkout waits, connections in use and overflow
+connections (see stats(), served per process at /admin/db-pool). A growing
+checkout wait means requests are queueing for connections, not for the
+database.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+# 0 = no limit known; size the pool from DB_POOL_SIZE/DB_MAX_OVERFLOW alone
+MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "0"))
+RESERVED_CONNECTIONS = int(os.environ.get("DB_RESERVED_CONNECTIONS", "3"))
+
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "cache_size": os.environ.get("SQLITE_CACHE_SIZE", "-16000"),  # negative: KiB per connection
+    "busy_timeout": os.environ.get("SQLITE_BUSY_TIMEOUT", "5000"),  # ms
+}
+
+# Checkouts slower than this count as waits for a connection
+SLOW_CHECKOUT_SECONDS = 0.01
+
+
+def pool_limits(size=POOL_SIZE, overflow=MAX_OVERFLOW):
+    """(pool size, max overflow) for one worker process, within its share of DB_MAX_CONNECTIONS."""
+    if MAX_CONNECTIONS:
+        share = max((MAX_CONNECTIONS - RESERVED_CONNECTIONS) // max(WEB_CONCURRENCY, 1), 1)
+        size = min(size, share)
+        overflow = min(overflow, share - size)
+    return size, overflow
+
+
+class PoolStats:
+    """Checkout counters of one pool; samples keep the last 1000 checkout waits."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.overflow_opened = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self.peak_in_use = 0
+        self.samples = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def record(self, waited, in_use, opened_overflow):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.slow_checkouts += waited >= SLOW_CHECKOUT_SECONDS
+            self.overflow_opened += opened_overflow
+            self.peak_in_use = max(self.peak_in_use, in_use)
+            self.samples.append(waited)
+
+    def timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def wait_percentile(self, fraction):
+        with self._lock:
+            ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that times how long each checkout waited for a connection."""
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kwargs):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+        # QueuePool keeps this to itself; connection_limit() and stats() report it
+        self.max_overflow = max_overflow
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        overflow = self.overflow()
+        try:
+            connection = super()._do_get()
+        except PoolTimeout:
+            self.stats.timed_out()
+            raise
+        self.stats.record(time.perf_counter() - started, self.checkedout(),
+                          self.overflow() > max(overflow, 0))
+        return connection
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        if value:
+            cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def make_engine(url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "sqlite" and url.database in (None, "", ":memory:"):
+        return create_engine(url)
+
+    pool_size, max_overflow = pool_limits(pool_size, max_overflow)
+    options = {"poolclass": TimedQueuePool, "pool_size": pool_size, "max_overflow": max_overflow,
+               "pool_timeout": pool_timeout}
+    if backend == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        options["pool_pre_ping"] = os.environ.get("DB_POOL_PRE_PING", "off") == "on"
+        options["pool_recycle"] = int(os.environ.get("DB_POOL_RECYCLE", "-1"))
+    else:
+        options["pool_pre_ping"] = os.environ.get("DB_POOL_PRE_PING", "on") == "on"
+        options["pool_recycle"] = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+
+    engine = create_engine(url, **options)
+    if backend == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+
+def connection_limit(engine):
+    """Most connections the engine's pool hands out at once (its size, when the overflow isn't known)."""
+    pool = engine.pool
+    if isinstance(pool, TimedQueuePool):
+        return pool.size() + pool.max_overflow
+    return pool.size() if isinstance(pool, QueuePool) else 1
+
+
+def stats(engine):
+    pool = engine.pool
+    if not isinstance(pool, TimedQueuePool):
+        return {"pool": type(pool).__name__}
+    recorded = pool.stats
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "max_overflow": pool.max_overflow,
+        "in_use": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow_in_use": max(pool.overflow(), 0),
+        "peak_in_use": recorded.peak_in_use,
+        "checkouts": recorded.checkouts,
+        "overflow_opened": recorded.overflow_opened,
+        "timeouts": recorded.timeouts,
+        "slow_checkouts": recorded.slow_checkouts,
+        "checkout_wait_ms": {
+            "mean": round(recorded.wait_seconds * 1000 / max(recorded.checkouts, 1), 3),
+            "p50": round(recorded.wait_percentile(0.50) * 1000, 3),
+            "p95": round(recorded.wait_percentile(0.95) * 1000, 3),
+            "p99": round(recorded.wait_percentile(0.99) * 1000, 3),
+            "max": round(recorded.max_wait * 1000, 3),
+        },
+    }
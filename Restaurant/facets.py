@@ -0,0 +1,317 @@
+"""
+In-memory faceted search over approved models, for /models.
+
+Each agency gets a FacetIndex. For every value of every facet (city, hair
+and eye colour, nationality, language, availability, gender, plus age and
+height for the range filters) it keeps a Python int used as a bitset over
+model ids. A combined filter is an AND of those ints. A facet count is a
+popcount. Neither touches the database; only the page of cards on screen
+is loaded, by primary key.
+
+Committed Model changes mark their ids (after_commit, like page_cache). The
+next lookup patches just those rows into this process's index. City changes
+drop the agency's index for a rebuild. Edits committed by other processes
+are picked up by a rebuild every FACET_INDEX_TTL seconds. That rebuild runs
+on a background thread while requests keep using the old index. A missing
+index is built once, with concurrent requests waiting for it rather than
+building their own. FACET_INDEX=off filters in SQL as before, without facet
+counts.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+
+from models import SessionLocal, City, Model
+from pagination import PAGE_SIZE, decode_cursor, encode_cursor
+
+FACET_INDEX = os.environ.get("FACET_INDEX", "on")
+TTL_SECONDS = int(os.environ.get("FACET_INDEX_TTL", "60"))
+
+# Shown with counts on /models, in this order
+FACETS = ("city", "hair_color", "eye_color", "nationality", "language", "availability", "gender")
+# Query-string filter -> (indexed attribute, keep values >= or <= the bound)
+RANGE_FILTERS = {"age_min": ("age", "min"), "age_max": ("age", "max"), "height_min": ("height", "min")}
+
+_COLUMNS = (Model.id, Model.city_id, Model.hair_color, Model.eye_color, Model.gender, Model.nationality,
+            Model.languages, Model.availability, Model.age, Model.height, Model.featured, Model.created_at)
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def sort_key(featured, created_at, model_id):
+    # Ascending tuples == ORDER BY featured DESC, created_at DESC, id DESC.
+    # Whole microseconds: a float timestamp would round ties the database keeps apart
+    created = (created_at - _EPOCH) // timedelta(microseconds=1) if created_at else 0
+    return (not featured, -created, -model_id)
+
+
+def _languages(value):
+    try:
+        languages = json.loads(value) if value else []
+    except ValueError:
+        return []
+    return [language for language in languages if isinstance(language, str) and language] \
+        if isinstance(languages, list) else []
+
+
+def _pairs(row, city_names):
+    values = {
+        "city": city_names.get(row.city_id),
+        "hair_color": row.hair_color,
+        "eye_color": row.eye_color,
+        "nationality": row.nationality,
+        "availability": row.availability,
+        # The directory lists a blank gender under female
+        "gender": "male" if row.gender == "male" else "female",
+        "age": row.age,
+        "height": row.height,
+    }
+    pairs = [(facet, value) for facet, value in values.items() if value not in (None, "")]
+    return pairs + [("language", language) for language in _languages(row.languages)]
+
+
+class FacetIndex:
+    """Bitsets over model ids for one agency's approved models."""
+
+    def __init__(self, agency_id):
+        self.agency_id = agency_id
+        self.built_at = time.monotonic()
+        self.all = 0
+        self._bits = {}  # facet -> value -> bitset of model ids
+        self._pairs = {}  # model id -> its (facet, value) pairs
+        self._keys = []  # sort keys, directory order
+        self._key_of = {}  # model id -> sort key
+        self._city_names = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def _rows(self, db, ids=None):
+        query = db.query(*_COLUMNS).filter(Model.agency_id == self.agency_id, Model.status == "approved")
+        if ids is not None:
+            query = query.filter(Model.id.in_(ids))
+        return query.all()
+
+    def load(self, db):
+        self._city_names = dict(db.query(City.id, City.name).filter(City.agency_id == self.agency_id))
+        rows = self._rows(db)
+        with self._lock:
+            for row in rows:
+                self._add(row)
+        return self
+
+    def update(self, db, ids):
+        """Re-read `ids`; rows no longer approved (or deleted) drop out."""
+        rows = self._rows(db, list(ids))
+        with self._lock:
+            for model_id in ids:
+                self._remove(model_id)
+            for row in rows:
+                self._add(row)
+
+    def _add(self, row):
+        bit = 1 << row.id
+        pairs = _pairs(row, self._city_names)
+        for facet, value in pairs:
+            values = self._bits.setdefault(facet, {})
+            values[value] = values.get(value, 0) | bit
+        self._pairs[row.id] = pairs
+        self.all |= bit
+        key = sort_key(row.featured, row.created_at, row.id)
+        self._key_of[row.id] = key
+        insort(self._keys, key)
+
+    def _remove(self, model_id):
+        pairs = self._pairs.pop(model_id, None)
+        if pairs is None:
+            return
+        bit = 1 << model_id
+        for facet, value in pairs:
+            remaining = self._bits[facet][value] & ~bit
+            if remaining:
+                self._bits[facet][value] = remaining
+            else:
+                del self._bits[facet][value]
+        self.all &= ~bit
+        del self._keys[bisect_left(self._keys, self._key_of.pop(model_id))]
+
+    def _mask(self, filters, exclude=None):
+        mask = self.all
+        for name, value in filters.items():
+            if value in (None, "") or name == exclude:
+                continue
+            if name in RANGE_FILTERS:
+                facet, bound = RANGE_FILTERS[name]
+                mask &= reduce(or_, (
+                    bits for indexed, bits in self._bits.get(facet, {}).items()
+                    if (indexed >= value if bound == "min" else indexed <= value)
+                ), 0)
+            else:
+                mask &= self._bits.get(name, {}).get(value, 0)
+        return mask
+
+    def count(self, filters):
+        with self._lock:
+            return self._mask(filters).bit_count()
+
+    def facet_counts(self, filters):
+        """{facet: {value: matches}}; each facet ignores its own filter, so its options stay selectable."""
+        counts = {}
+        with self._lock:
+            for facet in FACETS:
+                base = self._mask(filters, exclude=facet)
+                counts[facet] = {
+                    value: (bits & base).bit_count()
+                    for value, bits in sorted(self._bits.get(facet, {}).items())
+                    if bits & base or value == filters.get(facet)
+                }
+        return counts
+
+    def page_ids(self, filters, order, cursor=None, limit=PAGE_SIZE):
+        """Up to limit + 1 matching ids in directory order, after `cursor`."""
+        with self._lock:
+            mask = self._mask(filters)
+            start = bisect_right(self._keys, sort_key(*decode_cursor(cursor, order))) if cursor else 0
+            # One C-level conversion, then O(1) membership per id
+            member = format(mask, "b")[::-1]
+            ids = []
+            for key in islice(self._keys, start, None):
+                model_id = -key[2]
+                if model_id < len(member) and member[model_id] == "1":
+                    ids.append(model_id)
+                    if len(ids) > limit:
+                        break
+            return ids
+
+
+_indexes = {}  # agency id -> FacetIndex
+_pending = {}  # agency id -> model ids changed since the index was built
+_building = set()  # agencies whose index is loading; their changes are kept too
+_build_locks = {}  # agency id -> lock held while its index loads
+_refreshing = set()  # agencies with a background rebuild under way
+_generation = 0
+_lock = threading.Lock()
+
+
+def _stale(index):
+    return index.built_at + TTL_SECONDS < time.monotonic()
+
+
+def _build(db, agency_id):
+    """Load the agency's index; one build at a time per agency, the others reuse it."""
+    with _lock:
+        build_lock = _build_locks.setdefault(agency_id, threading.Lock())
+    with build_lock:
+        index = _indexes.get(agency_id)
+        if index is not None and not _stale(index):
+            return index
+        with _lock:
+            _building.add(agency_id)
+            generation = _generation
+        try:
+            index = FacetIndex(agency_id).load(db)
+        finally:
+            with _lock:
+                _building.discard(agency_id)
+        with _lock:
+            # A City changed while we were loading; serve this one, build again next time
+            if generation == _generation:
+                _indexes[agency_id] = index
+        return index
+
+
+def _refresh(agency_id):
+    db = SessionLocal()
+    try:
+        _build(db, agency_id)
+    except Exception as e:
+        print(f"Facet index rebuild failed: {e}")
+    finally:
+        db.close()
+        with _lock:
+            _refreshing.discard(agency_id)
+
+
+def index_for(db, agency_id):
+    """The agency's index, built on first use and refreshed with pending changes."""
+    index = _indexes.get(agency_id)
+    if index is None:
+        index = _build(db, agency_id)
+    elif _stale(index):
+        with _lock:
+            start = agency_id not in _refreshing
+            _refreshing.add(agency_id)
+        if start:
+            threading.Thread(target=_refresh, args=(agency_id,), name="facet-index", daemon=True).start()
+    # Models committed since (or while) the index was built. A build in
+    # progress may have read them before the commit, so they stay pending
+    # for the index it produces.
+    with _lock:
+        changed = set(_pending.get(agency_id, ())) if agency_id in _building else _pending.pop(agency_id, None)
+    if changed:
+        index.update(db, changed)
+    return index
+
+
+def search(db, agency_id, filters, order, cursor=None, limit=PAGE_SIZE):
+    """(models, next_cursor) like keyset_page, with the filtering done by the index."""
+    ids = index_for(db, agency_id).page_ids(filters, order, cursor, limit)
+    shown = ids[:limit]
+    rows = {model.id: model for model in db.query(Model).options(joinedload(Model.city)).filter(
+        Model.id.in_(shown), Model.status == "approved"
+    )} if shown else {}
+    models = [rows[model_id] for model_id in shown if model_id in rows]
+    next_cursor = encode_cursor(models[-1], order) if len(ids) > limit and models else None
+    return models, next_cursor
+
+
+def clear():
+    global _generation
+    with _lock:
+        _generation += 1
+        _indexes.clear()
+        _pending.clear()
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault("facet_changes", {"models": {}, "agencies": set()})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Model):
+            changes["models"].setdefault(obj.agency_id, set()).add(obj.id)
+        elif isinstance(obj, City):
+            changes["agencies"].add(obj.agency_id)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_committed(session):
+    global _generation
+    changes = session.info.pop("facet_changes", None)
+    if not changes:
+        return
+    with _lock:
+        for agency_id, ids in changes["models"].items():
+            if agency_id in _indexes or agency_id in _building:
+                _pending.setdefault(agency_id, set()).update(ids)
+        if changes["agencies"]:
+            # City names are baked into the city facet
+            _generation += 1
+            for agency_id in changes["agencies"]:
+                _indexes.pop(agency_id, None)
+                _pending.pop(agency_id, None)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("facet_changes", None)
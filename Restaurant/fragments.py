@@ -0,0 +1,166 @@
+"""
+Rendered-fragment cache for the model markup that pages repeat.
+
+A model's listing card, its home-page teaser and the rate table and photo
+gallery of its profile only change when the model does. Templates wrap them
+in a cache block named after the fragment:
+
+    {% cache "card", model, model.city.name %} ... {% endcache %}
+
+The rendered HTML is kept in a per-process LRU keyed by the name, model.id,
+model.created_at, model.version and any further arguments (anything else the
+block shows, like the city name). created_at is there because SQLite hands
+the id of a deleted newest row to the next insert, which starts again at
+version 1. Every flush that changes a model bumps its version (see
+_bump_versions), so an edit from any process, the admin form or the media
+worker, changes the key and the old HTML is never looked up again. Edits
+committed in this process also drop the model's entries straight away
+rather than leaving them for the LRU to push out.
+
+Set-based updates (data_migrations.py) don't bump versions; their fragments
+expire after FRAGMENT_CACHE_TTL seconds. FRAGMENT_CACHE_MAX_ENTRIES bounds
+the LRU; FRAGMENT_CACHE=off renders every block.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from sqlalchemy import event
+
+from models import SessionLocal, Model
+
+FRAGMENT_CACHE = os.environ.get("FRAGMENT_CACHE", "on")
+MAX_ENTRIES = int(os.environ.get("FRAGMENT_CACHE_MAX_ENTRIES", "5000"))
+TTL_SECONDS = int(os.environ.get("FRAGMENT_CACHE_TTL", "3600"))
+
+
+class FragmentCache:
+    """LRU of rendered fragments with a TTL and an index by model id."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (name, model id, created_at, version, *args) -> (expires_at, html)
+        self._by_model = {}  # model id -> keys
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def set(self, key, html):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, html)
+            self._by_model.setdefault(key[1], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, model_ids):
+        with self._lock:
+            keys = set()
+            for model_id in model_ids:
+                keys |= self._by_model.get(model_id, set())
+            for key in keys:
+                self._remove(key)
+            self._stats["invalidations"] += 1
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_model.clear()
+            for name in self._stats:
+                self._stats[name] = 0
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats, entries=len(self._entries))
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_ratio"] = round(snapshot["hits"] / lookups, 4) if lookups else 0.0
+        return snapshot
+
+    def _remove(self, key):
+        if self._entries.pop(key, None) is None:
+            return
+        keys = self._by_model.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_model[key[1]]
+
+
+cache = FragmentCache()
+
+
+def stats():
+    snapshot = cache.stats()
+    snapshot["enabled"] = FRAGMENT_CACHE == "on"
+    return snapshot
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache "name", model[, more key values] %} ... {% endcache %}"""
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(self.call_method("_render", [nodes.List(args)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, args, caller):
+        name, model, *extra = args
+        version = getattr(model, "version", None)
+        if FRAGMENT_CACHE != "on" or version is None:
+            return caller()
+        key = (name, model.id, getattr(model, "created_at", None), version, *extra)
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            cache.set(key, html)
+        return html
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _bump_versions(session, flush_context, instances):
+    for obj in session.dirty:
+        if isinstance(obj, Model) and session.is_modified(obj, include_collections=False):
+            # In SQL, so two concurrent edits can't both write the same version
+            obj.version = Model.version + 1
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_changes(session, flush_context):
+    changed = session.info.setdefault("fragment_changes", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Model):
+            changed.add(obj.id)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_committed(session):
+    changed = session.info.pop("fragment_changes", None)
+    if changed:
+        cache.invalidate(changed)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("fragment_changes", None)
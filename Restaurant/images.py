@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Responsive image derivatives for model photos.
+
+When the media worker finishes uploading a photo it describes the staged
+original (size, dominant color, blurhash) and records resized AVIF/WebP
+variants at IMAGE_WIDTHS. Cloudinary renders variants on demand from a
+transformation URL, so nothing extra is uploaded. Storage backends without
+transformations (LocalStorage) get the variants generated here with Pillow
+and uploaded next to the original, which keeps the pipeline usable offline.
+
+The result is stored per photo URL in Model.photo_meta. Templates render it
+through the picture() macro in templates/_images.html.
+
+Photos uploaded before this existed can be described afterwards:
+
+    python images.py --backfill [--limit 100]
+"""
+import io
+import json
+import math
+import os
+import sys
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow missing: photos are stored without derivatives
+    Image = None
+
+# Descending preference; browsers take the first <source> type they support
+IMAGE_FORMATS = [f.strip() for f in os.environ.get("IMAGE_FORMATS", "avif,webp").split(",") if f.strip()]
+IMAGE_WIDTHS = sorted(int(w) for w in os.environ.get("IMAGE_WIDTHS", "320,640,960,1440").split(","))
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "70"))
+
+# Card grid: three columns on desktop, two on tablets, one on phones
+CARD_SIZES = "(min-width: 992px) 33vw, (min-width: 768px) 50vw, 100vw"
+GALLERY_SIZES = "(min-width: 768px) 33vw, 100vw"
+
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _open(source):
+    image = Image.open(source)
+    image = ImageOps.exif_transpose(image)  # phone photos carry their rotation in EXIF
+    return image.convert("RGB")
+
+
+def dominant_color(image):
+    small = image.copy()
+    small.thumbnail((64, 64))
+    palette_image = small.quantize(colors=5)
+    palette = palette_image.getpalette()
+    count, index = max(palette_image.getcolors())
+    return "#%02x%02x%02x" % tuple(palette[index * 3:index * 3 + 3])
+
+
+def _base83(value, length):
+    return "".join(_BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def _srgb_to_linear(value):
+    value = value / 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image, x_components=4, y_components=3):
+    """Encode `image` as a BlurHash (https://blurha.sh) placeholder string."""
+    # The hash only keeps the lowest frequencies; 32x32 samples are plenty
+    small = image.resize((32, 32), Image.Resampling.BILINEAR)
+    width, height = small.size
+    pixels = [tuple(_srgb_to_linear(channel) for channel in pixel) for pixel in small.getdata()]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                basis_y = math.cos(math.pi * j * y / height)
+                for x in range(width):
+                    basis = normalisation * math.cos(math.pi * i * x / width) * basis_y
+                    pr, pg, pb = pixels[y * width + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = 1 / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(math.floor(max(abs(v) for f in ac for v in f) * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    result += _base83(quantised_max, 1)
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        r, g, b = (
+            max(0, min(18, int(math.floor(math.copysign(abs(v / max_value) ** 0.5, v) * 9 + 9.5))))
+            for v in factor
+        )
+        result += _base83(r * 19 * 19 + g * 19 + b, 2)
+    return result
+
+
+def variant_widths(width):
+    # Never upscale; an original narrower than every step is its own variant
+    return [w for w in IMAGE_WIDTHS if w < width] or [width]
+
+
+def _generate_variants(storage, image, url, folder):
+    stem = os.path.splitext(os.path.basename(url))[0]
+    variants = []
+    for width in variant_widths(image.width):
+        resized = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+        for image_format in IMAGE_FORMATS:
+            if not features.check(image_format):
+                continue
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format.upper(), quality=IMAGE_QUALITY)
+            buffer.seek(0)
+            derived = storage.upload(buffer, f"{folder}/derived", resource_type="image",
+                                     filename=f"{stem}-{width}w.{image_format}")
+            variants.append({"url": derived, "width": width, "format": image_format})
+    return variants
+
+
+def describe(storage, source, url, folder="models"):
+    """Metadata and derivatives for the photo stored at `url`; None if it can't be read.
+
+    `source` is a path or file object holding the original bytes.
+    """
+    if Image is None:
+        return None
+    try:
+        image = _open(source)
+        if hasattr(storage, "derivative_url"):
+            variants = [
+                {"url": storage.derivative_url(url, width, image_format), "width": width, "format": image_format}
+                for width in variant_widths(image.width) for image_format in IMAGE_FORMATS
+            ]
+        else:
+            variants = _generate_variants(storage, image, url, folder)
+        return {
+            "width": image.width,
+            "height": image.height,
+            "color": dominant_color(image),
+            "blurhash": blurhash(image),
+            "variants": variants,
+        }
+    except Exception as e:
+        print(f"Image derivatives failed for {url}: {e}")
+        return None
+
+
+def srcset(info, image_format):
+    """`srcset` attribute value for one format of a described photo."""
+    if not info:
+        return ""
+    return ", ".join(f"{v['url']} {v['width']}w" for v in info.get("variants", []) if v["format"] == image_format)
+
+
+def variant_url(info, url, width, image_format="webp"):
+    """Smallest variant at least `width` wide (or the largest one), else `url`."""
+    candidates = sorted((v for v in (info or {}).get("variants", []) if v["format"] == image_format),
+                        key=lambda v: v["width"])
+    for variant in candidates:
+        if variant["width"] >= width:
+            return variant["url"]
+    return candidates[-1]["url"] if candidates else url
+
+
+def _fetch(url):
+    if url.startswith("/static/"):
+        static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+        return open(os.path.join(static_dir, url[len("/static/"):]), "rb")
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return io.BytesIO(response.read())
+
+
+def backfill(limit=None):
+    """Describe photos stored before derivatives existed; returns how many were added."""
+    import media
+    from models import SessionLocal, Model
+
+    db = SessionLocal()
+    described = 0
+    try:
+        for model in db.query(Model).filter(Model.photos != None).order_by(Model.id):
+            meta = dict(model.photo_meta_map)
+            for url in model.photo_list:
+                if url in meta or (limit is not None and described >= limit):
+                    continue
+                try:
+                    source = _fetch(url)
+                except Exception as e:
+                    print(f"Could not fetch {url}: {e}")
+                    continue
+                info = describe(media.storage, source, url)
+                if info:
+                    meta[url] = info
+                    described += 1
+            if meta != model.photo_meta_map:
+                model.photo_meta = json.dumps(meta)
+                db.commit()
+                print(f"✅ {model.name}: {len(meta)} photo(s) described")
+    finally:
+        db.close()
+    return described
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Model photo derivatives")
+    parser.add_argument("--backfill", action="store_true", help="describe photos that have no metadata yet")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+    if Image is None:
+        sys.exit("Pillow is not installed")
+    if args.backfill:
+        print(f"Described {backfill(args.limit)} photo(s)")
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Background media ingestion.
+
+Form handlers stream each file to the storage backend's staging area (a
+private raw asset on Cloudinary, a directory for LocalStorage) and queue a
+MediaJob holding only its reference, so the request never holds a whole
+video in memory and the jobs table stays small. Staged files of a request
+that rolls back are discarded again. Queued jobs survive restarts and
+deploys, and any web process can take them. A worker claims due jobs,
+uploads them through the media pipeline and patches Model.photos /
+Model.profile_video (plus Model.photo_meta, see images.py), then discards
+the staged copy. Failed uploads are retried with exponential backoff.
+
+Every web process runs the worker as an asyncio task (MEDIA_WORKER=inprocess,
+the default). Its commits go through the same session events as an admin
+edit, so this process's page cache (hooked up by main.startup_event),
+facet index and fragment cache catch up at once. MEDIA_WORKER=off leaves the worker out, e.g. for benchmarks that
+drain the queue themselves.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, update
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import images
+import media
+import profiling
+from models import SessionLocal, MediaJob, Model
+
+WORKER_MODE = os.environ.get("MEDIA_WORKER", "inprocess")
+MAX_ATTEMPTS = int(os.environ.get("MEDIA_JOB_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.environ.get("MEDIA_JOB_RETRY_SECONDS", "5"))
+POLL_SECONDS = float(os.environ.get("MEDIA_JOB_POLL_SECONDS", "2"))
+BATCH_SIZE = int(os.environ.get("MEDIA_JOB_BATCH_SIZE", "20"))
+# A running job older than this belongs to a worker that died; requeue it
+LEASE_SECONDS = int(os.environ.get("MEDIA_JOB_LEASE_SECONDS", "600"))
+
+ACTIVE_STATUSES = ("pending", "running")
+
+
+def enqueue_uploads(db, model, photos=(), video=None):
+    """Stage uploads and queue a job for each; the caller commits."""
+    uploads = [(photo, "photo", "models", "image") for photo in photos if photo.filename]
+    if video is not None and video.filename:
+        uploads.append((video, "video", "models/videos", "video"))
+    if not uploads:
+        return []
+    with profiling.timed("upload"):
+        refs = media.stage_batch([upload for upload, *_ in uploads])
+    # Until the commit; see _discard_uncommitted
+    db.info.setdefault("staged_uploads", []).extend(refs)
+    jobs = [MediaJob(kind=kind, staged_ref=ref, filename=upload.filename, folder=folder, resource_type=resource_type)
+            for (upload, kind, folder, resource_type), ref in zip(uploads, refs)]
+    model.media_jobs.extend(jobs)
+    model.media_status = "processing"
+    return jobs
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _keep_committed(session):
+    session.info.pop("staged_uploads", None)
+
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _discard_uncommitted(session, transaction):
+    # Rolled back, or closed without a commit: no job will ever read these
+    if transaction.parent is None:
+        media.discard_staged(session.info.pop("staged_uploads", ()))
+
+
+def _claim_due_jobs(db, now, limit):
+    candidates = db.query(MediaJob.id).filter(
+        MediaJob.status == "pending",
+        MediaJob.run_after <= now
+    ).order_by(MediaJob.id).limit(limit).all()
+
+    claimed = []
+    for (job_id,) in candidates:
+        # Conditional update so two workers never upload the same file
+        result = db.execute(
+            update(MediaJob)
+            .where(MediaJob.id == job_id, MediaJob.status == "pending")
+            .values(status="running", locked_at=now, attempts=MediaJob.attempts + 1)
+        )
+        if result.rowcount:
+            claimed.append(job_id)
+    db.commit()
+    return claimed
+
+
+def _upload_jobs(jobs, staged):
+    outcomes = {}
+    for job in jobs:
+        try:
+            staged[job.id] = media.storage.open_staged(job.staged_ref)
+        except Exception as e:
+            outcomes[job.id] = e
+    readable = [job for job in jobs if job.id in staged]
+    results = media.upload_batch([
+        (UploadFile(staged[job.id], filename=job.filename), job.folder, job.resource_type)
+        for job in readable
+    ])
+    outcomes.update((job.id, result) for job, result in zip(readable, results))
+    return outcomes
+
+
+def process_due_jobs(limit=BATCH_SIZE):
+    """Upload one batch of due jobs; returns how many were attempted."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        claimed = _claim_due_jobs(db, now, limit)
+        if not claimed:
+            return 0
+
+        jobs = db.query(MediaJob).filter(MediaJob.id.in_(claimed)).order_by(MediaJob.id).all()
+        staged = {}
+        try:
+            outcomes = _upload_jobs(jobs, staged)
+            stored = _record_outcomes(db, jobs, outcomes, staged, now)
+        finally:
+            for handle in staged.values():
+                handle.close()
+        # Failed jobs keep their staged copy for a retry
+        media.discard_staged(stored)
+        return len(jobs)
+    finally:
+        db.close()
+
+
+def _record_outcomes(db, jobs, outcomes, staged, now):
+    """Apply a batch's results and commit; returns the staged refs no longer needed."""
+    stored = []
+    described = {}
+    for job in jobs:
+        outcome = outcomes[job.id]
+        if isinstance(outcome, Exception):
+            job.last_error = str(outcome)[:1000]
+            if job.attempts >= MAX_ATTEMPTS:
+                job.status = "failed"
+                print(f"Media job {job.id} failed permanently: {outcome}")
+            else:
+                job.status = "pending"
+                job.run_after = now + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+                print(f"Media job {job.id} failed (attempt {job.attempts}), retrying: {outcome}")
+            continue
+
+        job.status = "done"
+        job.last_error = None
+        if job.kind == "photo":
+            # Size, placeholder color and resized variants for srcset
+            source = staged[job.id]
+            source.seek(0)
+            described[job.id] = images.describe(media.storage, source, outcome, job.folder)
+        stored.append(job.staged_ref)
+        job.staged_ref = None
+
+    db.flush()
+    # The rows as they are now, locked until this commit: an admin edit
+    # committed during the uploads is kept, and one in progress waits
+    # (SQLite has no row locks; its writers already take turns)
+    for model_id in sorted({job.model_id for job in jobs}):
+        model = db.query(Model).filter(Model.id == model_id).with_for_update().populate_existing().one()
+        for job in sorted(model.media_jobs, key=lambda job: job.id):
+            if job.id not in outcomes or job.status != "done":
+                continue
+            url = outcomes[job.id]
+            if job.kind == "video":
+                model.profile_video = url
+            else:
+                model.photos = json.dumps(model.photo_list + [url])
+                if described[job.id]:
+                    model.photo_meta = json.dumps({**model.photo_meta_map, url: described[job.id]})
+        statuses = [job.status for job in model.media_jobs]
+        if not any(status in ACTIVE_STATUSES for status in statuses):
+            model.media_status = "failed" if "failed" in statuses else "ready"
+    db.commit()
+    return stored
+
+
+def recover_stale_jobs():
+    """Requeue jobs left running by a worker that crashed or was restarted."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        recovered = db.query(MediaJob).filter(
+            MediaJob.status == "running",
+            MediaJob.locked_at < now - timedelta(seconds=LEASE_SECONDS)
+        ).update({"status": "pending", "run_after": now}, synchronize_session=False)
+        db.commit()
+        if recovered:
+            print(f"Requeued {recovered} interrupted media job(s)")
+        return recovered
+    finally:
+        db.close()
+
+
+async def run_worker():
+    last_recovery = 0.0
+    while True:
+        processed = 0
+        try:
+            if time.monotonic() - last_recovery > 60:
+                await run_in_threadpool(recover_stale_jobs)
+                last_recovery = time.monotonic()
+            processed = await run_in_threadpool(process_due_jobs)
+        except Exception as e:
+            print(f"Media worker error: {e}")
+        if not processed:
+            await asyncio.sleep(POLL_SECONDS)
@@ -1,21 +1,50 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, Form, UploadFile, File
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Depends, HTTPException, Request, Form, UploadFile, File, Body
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, or_
 from typing import List, Optional
+from urllib.parse import quote
 import os
+import asyncio
 import json
 import shutil
 from datetime import datetime
 import cloudinary
-import cloudinary.uploader
 
-from models import create_tables, get_db, Agency, User, Model, City, Booking
+import assets
+import compression
+import dashboard_stats
+import db_pool
+import facets
+import fragments
+import images
+import jobs
+import metrics
+import migrations
+import page_cache
+import profiling
+import search
+import tenants
+import templating
+from models import engine, get_db, SessionLocal, DB_THREADS, Agency, User, Model, City, Booking
+from pagination import keyset_page, next_page_url, ADMIN_PAGE_SIZE
 
 app = FastAPI(title="RED MARBS")
 
+# Brotli/gzip for HTML and JSON above COMPRESS_MIN_SIZE; streamed pages stay streamed
+app.add_middleware(compression.CompressionMiddleware)
+
+# Query count, SQL/render/upload time per request: Server-Timing header, logs, /admin/profiling
+if profiling.PROFILING == "on":
+    profiling.instrument(engine)
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+# Route latency, error, DB pool and upload metrics for Prometheus at /metrics
+if metrics.METRICS == "on":
+    metrics.watch_pool(engine)
+    app.add_middleware(metrics.MetricsMiddleware)
+
 # Configure Cloudinary
 cloudinary.config(
     cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME", ""),
@@ -27,6 +56,12 @@ cloudinary.config(
 templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
 static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
 templates = Jinja2Templates(directory=templates_dir)
+if profiling.PROFILING == "on":
+    templates.env.template_class = profiling.TimedTemplate
+# No per-render stat of template files; compiled bytecode cached on disk
+templating.configure(templates.env)
+# {% cache "card", model %}: rendered model fragments keyed by model.version
+templates.env.add_extension(fragments.FragmentCacheExtension)
 
 # Add custom filter for JSON parsing
 import json
@@ -38,57 +73,55 @@ def from_json_filter(value):
 
 templates.env.filters['from_json'] = from_json_filter
 
+# Responsive photo helpers for templates/_images.html
+templates.env.globals['photo_srcset'] = images.srcset
+templates.env.globals['photo_variant'] = images.variant_url
+templates.env.globals['image_formats'] = images.IMAGE_FORMATS
+templates.env.globals['CARD_SIZES'] = images.CARD_SIZES
+templates.env.globals['GALLERY_SIZES'] = images.GALLERY_SIZES
+
 # Create uploads directory for model photos
 uploads_dir = os.path.join(static_dir, "uploads")
 os.makedirs(uploads_dir, exist_ok=True)
 
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+# Hashed asset names (static_url) are served from the build, immutable
+app.mount("/static", assets.AssetFiles(directory=static_dir), name="static")
+templates.env.globals['static_url'] = assets.static_url
+
+# Cache-Control per page. Browsers revalidate data pages on every visit (a
+# cheap 304 from the page cache while nothing changed) so admin edits show up
+# at once; a CDN may serve them for a minute. Admin pages are never stored.
+DATA_PAGE_CACHE_CONTROL = "public, max-age=0, s-maxage=60"
+INFO_PAGE_CACHE_CONTROL = "public, max-age=3600"
+ADMIN_HEADERS = {"Cache-Control": "private, no-store"}
 
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
+    # Commits from here on, the handlers' and the media worker's, invalidate cached pages
+    page_cache.install()
     
-    # Add featured column migration
+    # Fingerprint and precompress static assets if they changed since the last build
     try:
-        from sqlalchemy import text
-        db = next(get_db())
-        # Check if featured column exists, if not add it
-        result = db.execute(text("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name='models' AND column_name='featured'
-        """))
-        
-        if not result.fetchone():
-            db.execute(text("ALTER TABLE models ADD COLUMN featured BOOLEAN DEFAULT FALSE"))
-            db.commit()
-            print("✅ Added featured column to models table")
-        else:
-            print("ℹ️  Featured column already exists")
-        
-        # Add profile_video column if missing
+        assets.load()
+    except Exception as e:
+        print(f"Static asset build error: {e}")
+    
+    # Compile every template now instead of on the first visitors' requests
+    if templating.TEMPLATE_PRECOMPILE == "on":
         try:
-            result2 = db.execute(text("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name='models' AND column_name='profile_video'
-            """))
-            if not result2.fetchone():
-                db.execute(text("ALTER TABLE models ADD COLUMN profile_video VARCHAR(500)"))
-                db.commit()
-                print("✅ Added profile_video column to models table")
-        except Exception as e2:
-            print(f"profile_video migration error: {e2}")
-        
-        db.close()
-    except Exception as migration_error:
-        print(f"Migration error: {migration_error}")
-        if 'db' in locals():
-            db.close()
+            templating.precompile(templates.env)
+        except Exception as e:
+            print(f"Template error: {e}")
+    
+    # Schema changes run at release (python migrations.py migrate); this only checks the version
+    try:
+        migrations.check()
+    except Exception as e:
+        print(f"Migration error: {e}")
     
     # Create sample data if database is empty
-    db = next(get_db())
+    db = SessionLocal()
     try:
         if db.query(Agency).count() == 0:
             init_sample_data(db)
@@ -96,7 +129,7 @@ async def startup_event():
         # Add Marbella city if it doesn't exist
         agency = db.query(Agency).first()
         if agency:
-            marbella = db.query(City).filter(City.name == "Marbella").first()
+            marbella = db.query(City).filter(City.agency_id == agency.id, City.name == "Marbella").first()
             if not marbella:
                 marbella = City(
                     agency_id=agency.id,
@@ -110,8 +143,18 @@ async def startup_event():
         print(f"Startup error: {e}")
     finally:
         db.close()
+    
+    metrics.start()
+    if jobs.WORKER_MODE == "inprocess":
+        app.state.media_worker = asyncio.create_task(jobs.run_worker())
     print("🚀 RED MARBS Agency started successfully")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    worker = getattr(app.state, "media_worker", None)
+    if worker:
+        worker.cancel()
+
 def init_sample_data(db: Session):
     try:
         # Create sample agency
@@ -161,38 +204,76 @@ def init_sample_data(db: Session):
 # Routes
 
 @app.get("/", response_class=HTMLResponse)
-async def home(request: Request, db: Session = Depends(get_db)):
-    agency = db.query(Agency).first()
+def home(request: Request, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+    cached = page_cache.lookup(request)
+    if cached:
+        return cached
+    
     try:
-        models = db.query(Model).filter(
+        models = tenants.scoped(db, agency, Model).filter(
             Model.status == "approved"
         ).order_by(Model.featured.desc(), Model.created_at.desc()).limit(6).all()
     except Exception:
         # Fallback if featured column doesn't exist yet
-        models = db.query(Model).filter(
+        models = tenants.scoped(db, agency, Model).filter(
             Model.status == "approved"
         ).order_by(Model.created_at.desc()).limit(6).all()
     
-    return templates.TemplateResponse("home.html", {
+    return page_cache.store(request, templates.TemplateResponse("home.html", {
         "request": request,
         "agency": agency,
         "featured_models": models
-    })
+    }), tags=["agency", "models"], cache_control=DATA_PAGE_CACHE_CONTROL)
 
-@app.get("/models", response_class=HTMLResponse)
-async def models_page(
-    request: Request, 
-    city: Optional[str] = None,
-    age_min: Optional[int] = None,
-    age_max: Optional[int] = None,
-    height_min: Optional[int] = None,
-    hair_color: Optional[str] = None,
-    db: Session = Depends(get_db)
-):
-    query = db.query(Model).filter(
+# Keyset orderings; each ends in a unique column so pages never overlap
+DIRECTORY_ORDER = [(Model.featured, True), (Model.created_at, True), (Model.id, True)]
+ADMIN_MODELS_ORDER = [(Model.created_at, True), (Model.id, True)]
+ADMIN_BOOKINGS_ORDER = [(Booking.created_at, True), (Booking.id, True)]
+
+# Query parameters /models reads; anything else is left out of its cache key
+DIRECTORY_FILTERS = ("city", "age_min", "age_max", "height_min", "hair_color", "eye_color", "nationality",
+                     "language", "availability")
+
+# Admin lists grow with every row; send them as Jinja renders them so <head>
+# (styles, fonts) reaches the browser before the table is done. Pages that go
+# through page_cache need the whole body and stay buffered.
+STREAM_TEMPLATES = os.environ.get("STREAM_TEMPLATES", "1") == "1"
+STREAM_CHUNK_BYTES = int(os.environ.get("STREAM_CHUNK_BYTES", "8192"))
+
+def _batched(chunks, size):
+    # generate() yields per template node; group them into sensible writes
+    buffer, buffered = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield "".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+def render_streaming(template_name, context, headers=None):
+    if not STREAM_TEMPLATES:
+        return templates.TemplateResponse(template_name, context, headers=headers)
+    chunks = templates.get_template(template_name).generate(context)
+    return StreamingResponse(_batched(chunks, STREAM_CHUNK_BYTES), media_type="text/html", headers=headers)
+
+def render_fragment(template_name, next_url, **context):
+    # Infinite-scroll response: the rendered rows plus where to fetch more
+    html = templates.get_template(template_name).render(**context)
+    return JSONResponse({"html": html, "next_url": next_url})
+
+def directory_query(db, agency, city, age_min, age_max, height_min, hair_color, eye_color, nationality,
+                    language, availability, gender):
+    # Cards show model.city.name; load it in the same query
+    query = tenants.scoped(db, agency, Model).options(joinedload(Model.city)).filter(
         Model.status == "approved"
     )
     
+    if gender == "male":
+        query = query.filter(Model.gender == "male")
+    else:
+        query = query.filter(or_(Model.gender == "female", Model.gender == None, Model.gender == ""))
     if city:
         query = query.join(City).filter(City.name == city)
     if age_min:
@@ -203,26 +284,166 @@ async def models_page(
         query = query.filter(Model.height >= height_min)
     if hair_color:
         query = query.filter(Model.hair_color == hair_color)
+    if eye_color:
+        query = query.filter(Model.eye_color == eye_color)
+    if nationality:
+        query = query.filter(Model.nationality == nationality)
+    if language:
+        # languages is a JSON array of strings
+        query = query.filter(Model.languages.like(f'%{json.dumps(language)}%'))
+    if availability:
+        query = query.filter(Model.availability == availability)
+    return query
+
+def directory_page(db, agency, filters, gender, cursor=None):
+    # Filtering and paging come from the in-memory facet index unless it's off
+    if facets.FACET_INDEX == "on":
+        return facets.search(db, agency.id, dict(filters, gender=gender), DIRECTORY_ORDER, cursor)
+    return keyset_page(directory_query(db, agency, gender=gender, **filters), DIRECTORY_ORDER, cursor)
+
+@app.get("/models", response_class=HTMLResponse)
+def models_page(
+    request: Request, 
+    city: Optional[str] = None,
+    age_min: Optional[int] = None,
+    age_max: Optional[int] = None,
+    height_min: Optional[int] = None,
+    hair_color: Optional[str] = None,
+    eye_color: Optional[str] = None,
+    nationality: Optional[str] = None,
+    language: Optional[str] = None,
+    availability: Optional[str] = None,
+    agency: tenants.Tenant = Depends(tenants.current_agency),
+    db: Session = Depends(get_db)
+):
+    cached = page_cache.lookup(request, params=DIRECTORY_FILTERS)
+    if cached:
+        return cached
     
-    models = query.all()
-    cities = db.query(City).filter(City.active == True).all()
+    filters = {
+        "city": city,
+        "age_min": age_min,
+        "age_max": age_max,
+        "height_min": height_min,
+        "hair_color": hair_color,
+        "eye_color": eye_color,
+        "nationality": nationality,
+        "language": language,
+        "availability": availability
+    }
     
-    return templates.TemplateResponse("models.html", {
-        "request": request,
-        "models": models,
-        "cities": cities,
-        "filters": {
-            "city": city,
-            "age_min": age_min,
-            "age_max": age_max,
-            "height_min": height_min,
-            "hair_color": hair_color
-        }
+    # First page of each gender tab; the rest arrives through /models/page
+    context = {"request": request, "filters": filters, "facets": None}
+    for gender in ("female", "male"):
+        models, cursor = directory_page(db, agency, filters, gender)
+        context[f"{gender}_models"] = models
+        context[f"{gender}_next_url"] = next_page_url("/models/page", cursor, gender=gender, **filters)
+    if facets.FACET_INDEX == "on":
+        # Options with how many models each would leave, given the other filters
+        context["facets"] = facets.index_for(db, agency.id).facet_counts(filters)
+    
+    return page_cache.store(request, templates.TemplateResponse("models.html", context),
+                            tags=["models", "cities"], cache_control=DATA_PAGE_CACHE_CONTROL)
+
+@app.get("/models/page")
+def models_page_fragment(
+    gender: str = "female",
+    cursor: Optional[str] = None,
+    city: Optional[str] = None,
+    age_min: Optional[int] = None,
+    age_max: Optional[int] = None,
+    height_min: Optional[int] = None,
+    hair_color: Optional[str] = None,
+    eye_color: Optional[str] = None,
+    nationality: Optional[str] = None,
+    language: Optional[str] = None,
+    availability: Optional[str] = None,
+    agency: tenants.Tenant = Depends(tenants.current_agency),
+    db: Session = Depends(get_db)
+):
+    filters = {
+        "city": city,
+        "age_min": age_min,
+        "age_max": age_max,
+        "height_min": height_min,
+        "hair_color": hair_color,
+        "eye_color": eye_color,
+        "nationality": nationality,
+        "language": language,
+        "availability": availability
+    }
+    models, next_cursor = directory_page(db, agency, filters, gender, cursor)
+    next_url = next_page_url("/models/page", next_cursor, gender=gender, **filters)
+    return render_fragment("model_cards.html", next_url, models=models)
+
+@app.get("/models/facets")
+def models_facets(
+    city: Optional[str] = None,
+    age_min: Optional[int] = None,
+    age_max: Optional[int] = None,
+    height_min: Optional[int] = None,
+    hair_color: Optional[str] = None,
+    eye_color: Optional[str] = None,
+    nationality: Optional[str] = None,
+    language: Optional[str] = None,
+    availability: Optional[str] = None,
+    gender: Optional[str] = None,
+    agency: tenants.Tenant = Depends(tenants.current_agency),
+    db: Session = Depends(get_db)
+):
+    if facets.FACET_INDEX != "on":
+        raise HTTPException(status_code=404, detail="Facet index is disabled")
+    filters = {
+        "city": city,
+        "age_min": age_min,
+        "age_max": age_max,
+        "height_min": height_min,
+        "hair_color": hair_color,
+        "eye_color": eye_color,
+        "nationality": nationality,
+        "language": language,
+        "availability": availability,
+        "gender": gender
+    }
+    index = facets.index_for(db, agency.id)
+    return JSONResponse({"total": index.count(filters), "facets": index.facet_counts(filters)})
+
+@app.get("/search", response_class=HTMLResponse)
+def search_page(request: Request, q: str = "", page: int = 1, agency: tenants.Tenant = Depends(tenants.current_agency),
+                db: Session = Depends(get_db)):
+    if search.SEARCH != "on":
+        raise HTTPException(status_code=404, detail="Search is disabled")
+    results = search.search(db, agency.id, q, page)
+    return templates.TemplateResponse("search.html", {"request": request, "q": q, "results": results})
+
+@app.get("/models/search")
+def models_search(q: str, page: int = 1, agency: tenants.Tenant = Depends(tenants.current_agency),
+                  db: Session = Depends(get_db)):
+    if search.SEARCH != "on":
+        raise HTTPException(status_code=404, detail="Search is disabled")
+    results = search.search(db, agency.id, q, page)
+    return JSONResponse({
+        "query": q,
+        "match": results.match,
+        "page": results.page,
+        "has_more": results.has_more,
+        "results": [{
+            "id": hit.model.id,
+            "name": hit.model.name,
+            "city": hit.model.city.name if hit.model.city else None,
+            "url": f"/model/{hit.model.id}",
+            "snippet": str(hit.snippet),
+            "rank": hit.rank
+        } for hit in results.hits]
     })
 
 @app.get("/model/{model_id}", response_class=HTMLResponse)
-async def model_profile(request: Request, model_id: int, db: Session = Depends(get_db)):
-    model = db.query(Model).filter(
+def model_profile(request: Request, model_id: int, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+    cached = page_cache.lookup(request)
+    if cached:
+        return cached
+    
+    model = tenants.scoped(db, agency, Model).options(joinedload(Model.city)).filter(
         Model.id == model_id,
         Model.status == "approved"
     ).first()
@@ -230,67 +451,95 @@ async def model_profile(request: Request, model_id: int, db: Session = Depends(g
     if not model:
         raise HTTPException(status_code=404, detail="Model not found")
     
-    return templates.TemplateResponse("model_profile.html", {
+    return page_cache.store(request, templates.TemplateResponse("model_profile.html", {
         "request": request,
         "model": model
-    })
+    }), tags=[f"model:{model.id}", "cities"], cache_control=DATA_PAGE_CACHE_CONTROL)
 
 @app.get("/cities", response_class=HTMLResponse)
-async def cities_page(request: Request, db: Session = Depends(get_db)):
-    cities = db.query(City).filter(City.active == True).all()
-    
-    # Get model count per city
-    city_stats = []
-    for city in cities:
-        model_count = db.query(Model).filter(
-            Model.city_id == city.id,
-            Model.status == "approved"
-        ).count()
-        city_stats.append({
-            "city": city,
-            "model_count": model_count
-        })
+def cities_page(request: Request, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+    cached = page_cache.lookup(request)
+    if cached:
+        return cached
+    
+    cities = tenants.scoped(db, agency, City).filter(City.active == True).all()
+    
+    # Get model count per city in one grouped query
+    counts = dict(tenants.scoped(db, agency, Model, Model.city_id, func.count(Model.id)).filter(
+        Model.status == "approved"
+    ).group_by(Model.city_id).all())
+    
+    city_stats = [
+        {"city": city, "model_count": counts.get(city.id, 0)}
+        for city in cities
+    ]
     
-    return templates.TemplateResponse("cities.html", {
+    return page_cache.store(request, templates.TemplateResponse("cities.html", {
         "request": request,
         "city_stats": city_stats
-    })
+    }), tags=["cities", "models"], cache_control=DATA_PAGE_CACHE_CONTROL)
 
 @app.get("/city/{city_name}", response_class=HTMLResponse)
-async def city_models(request: Request, city_name: str, db: Session = Depends(get_db)):
-    city = db.query(City).filter(City.name == city_name).first()
+def city_models(request: Request, city_name: str, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+    cached = page_cache.lookup(request)
+    if cached:
+        return cached
+    
+    city = tenants.scoped(db, agency, City).filter(City.name == city_name).first()
     if not city:
         raise HTTPException(status_code=404, detail="City not found")
     
-    models = db.query(Model).filter(
+    # model.city resolves from the identity map to the city loaded above
+    models, cursor = keyset_page(tenants.scoped(db, agency, Model).filter(
         Model.city_id == city.id,
         Model.status == "approved"
-    ).all()
+    ), DIRECTORY_ORDER)
     
-    return templates.TemplateResponse("city_models.html", {
+    return page_cache.store(request, templates.TemplateResponse("city_models.html", {
         "request": request,
         "city": city,
-        "models": models
-    })
+        "models": models,
+        "next_url": next_page_url(f"/city/{quote(city.name)}/page", cursor)
+    }), tags=["cities", "models"], cache_control=DATA_PAGE_CACHE_CONTROL)
+
+@app.get("/city/{city_name}/page")
+def city_models_fragment(city_name: str, cursor: Optional[str] = None, agency: tenants.Tenant = Depends(tenants.current_agency),
+                         db: Session = Depends(get_db)):
+    city = tenants.scoped(db, agency, City).filter(City.name == city_name).first()
+    if not city:
+        raise HTTPException(status_code=404, detail="City not found")
+    
+    models, next_cursor = keyset_page(tenants.scoped(db, agency, Model).filter(
+        Model.city_id == city.id,
+        Model.status == "approved"
+    ), DIRECTORY_ORDER, cursor)
+    next_url = next_page_url(f"/city/{quote(city.name)}/page", next_cursor)
+    return render_fragment("city_model_cards.html", next_url, models=models)
 
 @app.get("/about", response_class=HTMLResponse)
-async def about_page(request: Request, db: Session = Depends(get_db)):
-    agency = db.query(Agency).first()
-    return templates.TemplateResponse("about.html", {
+def about_page(request: Request, agency: tenants.Tenant = Depends(tenants.current_agency)):
+    cached = page_cache.lookup(request)
+    if cached:
+        return cached
+    
+    return page_cache.store(request, templates.TemplateResponse("about.html", {
         "request": request,
         "agency": agency
-    })
+    }), tags=["agency"], cache_control=INFO_PAGE_CACHE_CONTROL)
 
 @app.get("/contact", response_class=HTMLResponse)
-async def contact_page(request: Request, db: Session = Depends(get_db)):
-    agency = db.query(Agency).first()
-    return templates.TemplateResponse("contact.html", {
+def contact_page(request: Request, agency: tenants.Tenant = Depends(tenants.current_agency)):
+    cached = page_cache.lookup(request)
+    if cached:
+        return cached
+    
+    return page_cache.store(request, templates.TemplateResponse("contact.html", {
         "request": request,
         "agency": agency
-    })
+    }), tags=["agency"], cache_control=INFO_PAGE_CACHE_CONTROL)
 
 @app.post("/contact")
-async def submit_contact(
+def submit_contact(
     name: str = Form(...),
     email: str = Form(...),
     phone: str = Form(""),
@@ -305,15 +554,15 @@ async def submit_contact(
     })
 
 @app.get("/apply", response_class=HTMLResponse)
-async def apply_page(request: Request, db: Session = Depends(get_db)):
-    cities = db.query(City).filter(City.active == True).all()
+def apply_page(request: Request, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+    cities = tenants.scoped(db, agency, City).filter(City.active == True).all()
     return templates.TemplateResponse("apply.html", {
         "request": request,
         "cities": cities
     })
 
 @app.post("/apply")
-async def submit_application(
+def submit_application(
     name: str = Form(...),
     phone: str = Form(...),
     age: int = Form(...),
@@ -324,19 +573,11 @@ async def submit_application(
     city_id: int = Form(...),
     bio: str = Form(""),
     photos: List[UploadFile] = File(...),
+    agency: tenants.Tenant = Depends(tenants.current_agency),
     db: Session = Depends(get_db)
 ):
     try:
-        # Upload photos to Cloudinary
-        photo_urls = []
-        for photo in photos:
-            if photo.filename:
-                photo.file.seek(0)
-                result = cloudinary.uploader.upload(photo.file, folder="models")
-                photo_urls.append(result['secure_url'])
-        
         # Create model application with default values for extended fields
-        agency = db.query(Agency).first()
         model = Model(
             agency_id=agency.id,
             city_id=city_id,
@@ -348,7 +589,7 @@ async def submit_application(
             eye_color=eye_color,
             gender=gender,
             bio=bio,
-            photos=json.dumps(photo_urls),
+            photos=json.dumps([]),
             status="pending",
             # Default values for extended fields
             residence=None,
@@ -370,6 +611,8 @@ async def submit_application(
             featured=False
         )
         
+        # Photos are uploaded by the media worker once the row is saved
+        jobs.enqueue_uploads(db, model, photos=photos)
         db.add(model)
         db.commit()
         
@@ -379,13 +622,14 @@ async def submit_application(
         })
         
     except Exception as e:
+        metrics.handled_error(e)
         return JSONResponse({
             "success": False,
             "message": f"Error submitting application: {str(e)}"
         })
 
 @app.post("/book/{model_id}")
-async def book_model(
+def book_model(
     model_id: int,
     client_name: str = Form(...),
     client_email: str = Form(...),
@@ -393,10 +637,11 @@ async def book_model(
     event_date: str = Form(...),
     event_type: str = Form(...),
     message: str = Form(""),
+    agency: tenants.Tenant = Depends(tenants.current_agency),
     db: Session = Depends(get_db)
 ):
     try:
-        model = db.query(Model).filter(Model.id == model_id).first()
+        model = tenants.scoped(db, agency, Model).filter(Model.id == model_id).first()
         if not model:
             raise HTTPException(status_code=404, detail="Model not found")
         
@@ -423,6 +668,7 @@ async def book_model(
         })
         
     except Exception as e:
+        metrics.handled_error(e)
         return JSONResponse({
             "success": False,
             "message": f"Error submitting booking: {str(e)}"
@@ -436,30 +682,29 @@ async def admin_login_page(request: Request):
     })
 
 @app.post("/admin/login")
-async def admin_login(
+def admin_login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
+    agency: tenants.Tenant = Depends(tenants.current_agency),
     db: Session = Depends(get_db)
 ):
     try:
         # Simple hardcoded authentication to avoid bcrypt issues
         if username == "admin" and password == "admin":
             # Check if admin user exists, create if not
-            user = db.query(User).filter(User.username == username).first()
+            user = tenants.scoped(db, agency, User).filter(User.username == username).first()
             
             if not user:
                 # Create admin user if it doesn't exist
-                agency = db.query(Agency).first()
-                if agency:
-                    user = User(
-                        agency_id=agency.id,
-                        username="admin",
-                        password_hash="simple_hash",  # Simple placeholder
-                        role="admin"
-                    )
-                    db.add(user)
-                    db.commit()
+                user = User(
+                    agency_id=agency.id,
+                    username="admin",
+                    password_hash="simple_hash",  # Simple placeholder
+                    role="admin"
+                )
+                db.add(user)
+                db.commit()
             
             response = RedirectResponse(url="/admin/dashboard", status_code=302)
             response.set_cookie("admin_logged_in", "true")
@@ -471,39 +716,79 @@ async def admin_login(
         })
         
     except Exception as e:
+        metrics.handled_error(e)
         return templates.TemplateResponse("admin_login.html", {
             "request": request,
             "error": f"Login error: {str(e)}"
         })
 
 @app.get("/admin/dashboard", response_class=HTMLResponse)
-async def admin_dashboard(request: Request, db: Session = Depends(get_db)):
+def admin_dashboard(request: Request, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
     # Simple auth check
     if not request.cookies.get("admin_logged_in"):
         return RedirectResponse(url="/admin/login")
     
-    stats = {
-        "total_models": db.query(Model).count(),
-        "approved_models": db.query(Model).filter(Model.status == "approved").count(),
-        "pending_models": db.query(Model).filter(Model.status == "pending").count(),
-        "total_bookings": db.query(Booking).count(),
-        "pending_bookings": db.query(Booking).filter(Booking.status == "pending").count()
-    }
+    # One row per status from status_counts, whatever the table sizes
+    stats = dashboard_stats.dashboard_counts(db, agency)
     
-    recent_applications = db.query(Model).filter(
+    recent_applications = tenants.scoped(db, agency, Model).options(joinedload(Model.city)).filter(
         Model.status == "pending"
     ).order_by(Model.created_at.desc()).limit(5).all()
     
-    recent_bookings = db.query(Booking).order_by(
+    recent_bookings = tenants.scoped(db, agency, Booking).options(joinedload(Booking.model)).order_by(
         Booking.created_at.desc()
     ).limit(5).all()
     
-    return templates.TemplateResponse("admin_dashboard.html", {
+    return render_streaming("admin_dashboard.html", {
         "request": request,
         "stats": stats,
         "recent_applications": recent_applications,
         "recent_bookings": recent_bookings
-    })
+    }, headers=ADMIN_HEADERS)
+
+@app.get("/admin/page-cache")
+def page_cache_stats(request: Request):
+    if not request.cookies.get("admin_logged_in"):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    # Hit/miss counters are per process; entries are shared with Redis
+    return JSONResponse({**page_cache.stats(), "fragments": fragments.stats()})
+
+@app.get("/metrics")
+def metrics_exposition(request: Request):
+    if metrics.METRICS != "on":
+        raise HTTPException(status_code=404)
+    if metrics.METRICS_TOKEN:
+        if request.headers.get("authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+            raise HTTPException(status_code=401, detail="Unauthorized")
+    elif engine.dialect.name != "sqlite":
+        # Route names, error counts and traffic are not for anonymous visitors
+        raise HTTPException(status_code=403, detail="Set METRICS_TOKEN to serve /metrics")
+    
+    # Summed over the uvicorn workers when METRICS_DIR is set
+    return PlainTextResponse(metrics.exposition(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/profiling", response_class=HTMLResponse)
+def admin_profiling_page(request: Request):
+    if not request.cookies.get("admin_logged_in"):
+        return RedirectResponse(url="/admin/login")
+    
+    return templates.TemplateResponse("admin_profiling.html", {
+        "request": request,
+        "enabled": profiling.PROFILING == "on",
+        "window_minutes": profiling.WINDOW_SECONDS // 60,
+        "repeat_threshold": profiling.REPEAT_THRESHOLD,
+        "endpoints": profiling.window.endpoints(),
+        "offenders": profiling.window.repeated_statements()
+    }, headers=ADMIN_HEADERS)
+
+@app.get("/admin/db-pool")
+def db_pool_stats(request: Request):
+    if not request.cookies.get("admin_logged_in"):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    # This process's pool: checkout waits, connections in use, overflow
+    return JSONResponse({**db_pool.stats(engine), "threads": DB_THREADS})
 
 @app.get("/admin/logout")
 async def admin_logout():
@@ -512,57 +797,60 @@ async def admin_logout():
     return response
 
 @app.post("/admin/models/{model_id}/approve")
-async def approve_model(model_id: int, db: Session = Depends(get_db)):
-    model = db.query(Model).filter(Model.id == model_id).first()
+def approve_model(model_id: int, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+    model = tenants.scoped(db, agency, Model).filter(Model.id == model_id).first()
     if model:
         model.status = "approved"
         db.commit()
     return JSONResponse({"success": True})
 
 @app.post("/admin/models/{model_id}/reject")
-async def reject_model(model_id: int, db: Session = Depends(get_db)):
-    model = db.query(Model).filter(Model.id == model_id).first()
+def reject_model(model_id: int, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+    model = tenants.scoped(db, agency, Model).filter(Model.id == model_id).first()
     if model:
         model.status = "rejected"
         db.commit()
     return JSONResponse({"success": True})
 
 @app.post("/admin/bookings/{booking_id}/confirm")
-async def confirm_booking(booking_id: int, db: Session = Depends(get_db)):
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+def confirm_booking(booking_id: int, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+    booking = tenants.scoped(db, agency, Booking).filter(Booking.id == booking_id).first()
     if booking:
         booking.status = "confirmed"
         db.commit()
     return JSONResponse({"success": True})
 
 @app.get("/admin/models", response_class=HTMLResponse)
-async def admin_models_page(request: Request, db: Session = Depends(get_db)):
+def admin_models_page(request: Request, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
     if not request.cookies.get("admin_logged_in"):
         return RedirectResponse(url="/admin/login")
     
-    try:
-        models = db.query(Model).order_by(Model.created_at.desc()).all()
-    except Exception:
-        # If there's an issue with the query, try to add featured column
-        try:
-            from sqlalchemy import text
-            db.execute(text("ALTER TABLE models ADD COLUMN featured BOOLEAN DEFAULT FALSE"))
-            db.commit()
-            models = db.query(Model).order_by(Model.created_at.desc()).all()
-        except:
-            # If that fails too, just get models without featured ordering
-            models = db.query(Model).order_by(Model.created_at.desc()).all()
+    models_query = tenants.scoped(db, agency, Model).options(joinedload(Model.city))
+    models, cursor = keyset_page(models_query, ADMIN_MODELS_ORDER, limit=ADMIN_PAGE_SIZE)
     
-    cities = db.query(City).filter(City.active == True).all()
+    cities = tenants.scoped(db, agency, City).filter(City.active == True).all()
     
-    return templates.TemplateResponse("admin_models.html", {
+    return render_streaming("admin_models.html", {
         "request": request,
         "models": models,
-        "cities": cities
-    })
+        "cities": cities,
+        "next_url": next_page_url("/admin/models/page", cursor)
+    }, headers=ADMIN_HEADERS)
+
+@app.get("/admin/models/page")
+def admin_models_fragment(request: Request, cursor: Optional[str] = None, agency: tenants.Tenant = Depends(tenants.current_agency),
+                          db: Session = Depends(get_db)):
+    if not request.cookies.get("admin_logged_in"):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    models, next_cursor = keyset_page(
+        tenants.scoped(db, agency, Model).options(joinedload(Model.city)), ADMIN_MODELS_ORDER, cursor,
+        limit=ADMIN_PAGE_SIZE
+    )
+    return render_fragment("admin_model_rows.html", next_page_url("/admin/models/page", next_cursor), models=models)
 
 @app.post("/admin/models/add")
-async def add_model_admin(
+def add_model_admin(
     name: str = Form(...),
     phone: str = Form(""),
     age: int = Form(...),
@@ -588,20 +876,10 @@ async def add_model_admin(
     rate_two_hours_passion: str = Form(""),
     rate_overnight: str = Form(""),
     photos: List[UploadFile] = File(...),
+    agency: tenants.Tenant = Depends(tenants.current_agency),
     db: Session = Depends(get_db)
 ):
     try:
-        # Upload photos to Cloudinary
-        photo_urls = []
-        for photo in photos:
-            if photo.filename:
-                photo.file.seek(0)
-                result = cloudinary.uploader.upload(photo.file, folder="models")
-                photo_urls.append(result['secure_url'])
-        
-        # Create model with all fields
-        agency = db.query(Agency).first()
-        
         # Convert languages to JSON if provided
         languages_json = None
         if languages:
@@ -627,7 +905,7 @@ async def add_model_admin(
             eye_color=eye_color,
             gender=gender,
             bio=bio,
-            photos=json.dumps(photo_urls),
+            photos=json.dumps([]),
             status=status,
             available=True,
             residence=residence,
@@ -645,6 +923,7 @@ async def add_model_admin(
             featured=False
         )
         
+        jobs.enqueue_uploads(db, model, photos=photos)
         db.add(model)
         db.commit()
         
@@ -654,58 +933,75 @@ async def add_model_admin(
         })
         
     except Exception as e:
+        metrics.handled_error(e)
         return JSONResponse({
             "success": False,
             "message": f"Error adding model: {str(e)}"
         })
 
 @app.delete("/admin/models/{model_id}/delete")
-async def delete_model_admin(model_id: int, db: Session = Depends(get_db)):
-    model = db.query(Model).filter(Model.id == model_id).first()
+def delete_model_admin(model_id: int, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+    model = tenants.scoped(db, agency, Model).filter(Model.id == model_id).first()
     if model:
         db.delete(model)
         db.commit()
     return JSONResponse({"success": True})
 
 @app.get("/admin/bookings", response_class=HTMLResponse)
-async def admin_bookings_page(request: Request, db: Session = Depends(get_db)):
+def admin_bookings_page(request: Request, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
     if not request.cookies.get("admin_logged_in"):
         return RedirectResponse(url="/admin/login")
     
-    bookings = db.query(Booking).order_by(Booking.created_at.desc()).all()
+    bookings, cursor = keyset_page(
+        tenants.scoped(db, agency, Booking).options(joinedload(Booking.model)), ADMIN_BOOKINGS_ORDER,
+        limit=ADMIN_PAGE_SIZE
+    )
     
-    return templates.TemplateResponse("admin_bookings.html", {
+    return render_streaming("admin_bookings.html", {
         "request": request,
-        "bookings": bookings
-    })
+        "bookings": bookings,
+        "next_url": next_page_url("/admin/bookings/page", cursor)
+    }, headers=ADMIN_HEADERS)
+
+@app.get("/admin/bookings/page")
+def admin_bookings_fragment(request: Request, cursor: Optional[str] = None, agency: tenants.Tenant = Depends(tenants.current_agency),
+                            db: Session = Depends(get_db)):
+    if not request.cookies.get("admin_logged_in"):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    
+    bookings, next_cursor = keyset_page(
+        tenants.scoped(db, agency, Booking).options(joinedload(Booking.model)), ADMIN_BOOKINGS_ORDER, cursor,
+        limit=ADMIN_PAGE_SIZE
+    )
+    return render_fragment("admin_booking_rows.html", next_page_url("/admin/bookings/page", next_cursor), bookings=bookings)
 
 @app.post("/admin/bookings/{booking_id}/cancel")
-async def cancel_booking(booking_id: int, db: Session = Depends(get_db)):
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+def cancel_booking(booking_id: int, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+    booking = tenants.scoped(db, agency, Booking).filter(Booking.id == booking_id).first()
     if booking:
         booking.status = "cancelled"
         db.commit()
     return JSONResponse({"success": True})
 
 @app.get("/admin/models/{model_id}/edit", response_class=HTMLResponse)
-async def edit_model_page(request: Request, model_id: int, db: Session = Depends(get_db)):
+def edit_model_page(request: Request, model_id: int, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
     if not request.cookies.get("admin_logged_in"):
         return RedirectResponse(url="/admin/login")
     
-    model = db.query(Model).filter(Model.id == model_id).first()
+    model = tenants.scoped(db, agency, Model).filter(Model.id == model_id).first()
     if not model:
         raise HTTPException(status_code=404, detail="Model not found")
     
-    cities = db.query(City).filter(City.active == True).all()
+    cities = tenants.scoped(db, agency, City).filter(City.active == True).all()
     
     return templates.TemplateResponse("admin_edit_model.html", {
         "request": request,
         "model": model,
         "cities": cities
-    })
+    }, headers=ADMIN_HEADERS)
 
 @app.post("/admin/models/{model_id}/edit")
-async def update_model_admin(
+def update_model_admin(
     model_id: int,
     name: str = Form(...),
     phone: str = Form(""),
@@ -736,10 +1032,13 @@ async def update_model_admin(
     profile_video_file: UploadFile = File(default=None),
     remove_video: str = Form(""),
     new_photos: List[UploadFile] = File(default=[]),
+    agency: tenants.Tenant = Depends(tenants.current_agency),
     db: Session = Depends(get_db)
 ):
     try:
-        model = db.query(Model).filter(Model.id == model_id).first()
+        # Locked until the commit, like the media worker's append (jobs.py), so
+        # neither overwrites the other's photos
+        model = tenants.scoped(db, agency, Model).filter(Model.id == model_id).with_for_update().first()
         if not model:
             return JSONResponse({"success": False, "message": "Model not found"})
         
@@ -782,12 +1081,7 @@ async def update_model_admin(
         model.rates = rates_json
         
         # Handle photo updates
-        current_photos = []
-        if model.photos:
-            try:
-                current_photos = json.loads(model.photos)
-            except:
-                current_photos = []
+        current_photos = list(model.photo_list)
         
         # Remove deleted photos
         if removed_photos:
@@ -797,18 +1091,6 @@ async def update_model_admin(
             except:
                 pass
         
-        # Add new photos to Cloudinary
-        for photo in new_photos:
-            if photo.filename:
-                try:
-                    photo.file.seek(0)
-                    print(f"Uploading {photo.filename} to Cloudinary...")
-                    result = cloudinary.uploader.upload(photo.file, folder="models")
-                    print(f"Upload result: {result.get('secure_url', 'NO URL')}")
-                    current_photos.append(result['secure_url'])
-                except Exception as upload_error:
-                    print(f"Cloudinary upload error: {upload_error}")
-        
         # Apply photo order if provided (from reordering)
         if photo_order:
             try:
@@ -822,17 +1104,19 @@ async def update_model_admin(
         # Update photos
         model.photos = json.dumps(current_photos)
         
+        # Drop size/variant metadata of removed photos
+        photo_meta = {url: info for url, info in model.photo_meta_map.items() if url in current_photos}
+        if photo_meta != model.photo_meta_map:
+            model.photo_meta = json.dumps(photo_meta)
+        
         # Update profile video
         if remove_video == "1":
             model.profile_video = None
-        elif profile_video_file and profile_video_file.filename:
-            profile_video_file.file.seek(0)
-            video_result = cloudinary.uploader.upload(
-                profile_video_file.file,
-                folder="models/videos",
-                resource_type="video"
-            )
-            model.profile_video = video_result['secure_url']
+            profile_video_file = None
+        
+        # New photos and video are uploaded by the media worker; they are
+        # appended to model.photos / set as profile_video when done
+        jobs.enqueue_uploads(db, model, photos=new_photos, video=profile_video_file)
         
         db.commit()
         
@@ -842,41 +1126,45 @@ async def update_model_admin(
         })
         
     except Exception as e:
+        metrics.handled_error(e)
         return JSONResponse({
             "success": False,
             "message": f"Error updating model: {str(e)}"
         })
 
 @app.post("/admin/models/{model_id}/toggle-available")
-async def toggle_model_available(model_id: int, request: Request, db: Session = Depends(get_db)):
+def toggle_model_available(model_id: int, request: Request, data: dict = Body(...),
+                           agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
     if not request.cookies.get("admin_logged_in"):
         raise HTTPException(status_code=401, detail="Unauthorized")
     
-    data = await request.json()
-    model = db.query(Model).filter(Model.id == model_id).first()
+    model = tenants.scoped(db, agency, Model).filter(Model.id == model_id).first()
     if model:
         model.available = data.get('available', True)
         db.commit()
     return JSONResponse({"success": True})
 
 @app.post("/admin/models/{model_id}/toggle-featured")
-async def toggle_model_featured(model_id: int, request: Request, db: Session = Depends(get_db)):
+def toggle_model_featured(model_id: int, request: Request, data: dict = Body(...),
+                          agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
     if not request.cookies.get("admin_logged_in"):
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     try:
-        data = await request.json()
-        model = db.query(Model).filter(Model.id == model_id).first()
+        model = tenants.scoped(db, agency, Model).filter(Model.id == model_id).first()
         if model:
-            model.featured = data.get('featured', False)
+            model.featured = bool(data.get('featured', False))
             db.commit()
         return JSONResponse({"success": True})
     except Exception as e:
+        metrics.handled_error(e)
         return JSONResponse({"success": False, "message": str(e)})
 
 @app.get("/admin/bookings/{booking_id}/details")
-async def get_booking_details(booking_id: int, db: Session = Depends(get_db)):
-    booking = db.query(Booking).filter(Booking.id == booking_id).first()
+def get_booking_details(booking_id: int, agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+    booking = tenants.scoped(db, agency, Booking).options(joinedload(Booking.model)).filter(
+        Booking.id == booking_id
+    ).first()
     if booking:
         return JSONResponse({
             "success": True,
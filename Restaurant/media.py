@@ -0,0 +1,178 @@
+import os
+import shutil
+import tempfile
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cloudinary.uploader
+import cloudinary.utils
+
+import metrics
+
+# Uploads run on their own bounded pool so a 10-photo application costs roughly
+# the slowest upload instead of the sum of all of them, and so concurrent
+# requests can't open more than UPLOAD_CONCURRENCY storage connections per worker
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "4"))
+
+uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "uploads")
+# Queued uploads wait here (LocalStorage) until the media worker stores them
+staging_dir = os.environ.get("MEDIA_STAGING_DIR", os.path.join(tempfile.gettempdir(), "agency-media-staging"))
+# Staged uploads read back by the worker stay in memory up to this size
+SPOOL_MAX_BYTES = 1024 * 1024
+
+
+def _spool(stream):
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    with stream:
+        shutil.copyfileobj(stream, spooled)
+    spooled.seek(0)
+    return spooled
+
+
+class CloudinaryStorage:
+    def upload(self, fileobj, folder, resource_type="image", filename=None):
+        # Cloudinary streams the spooled file itself; no need to read() it first
+        result = cloudinary.uploader.upload(fileobj, folder=folder, resource_type=resource_type)
+        return result['secure_url']
+    
+    def derivative_url(self, url, width, image_format):
+        # Cloudinary renders the variant on its first request and caches it
+        return url.replace("/upload/", f"/upload/c_limit,w_{width},f_{image_format},q_auto/", 1)
+
+    # Staging: a private raw asset, readable by any worker and never served
+    def stage(self, fileobj, filename=None):
+        result = cloudinary.uploader.upload(fileobj, folder="staging", resource_type="raw", type="private")
+        return result['public_id']
+
+    def open_staged(self, ref):
+        url = cloudinary.utils.private_download_url(ref, "", resource_type="raw", type="private")
+        return _spool(urllib.request.urlopen(url, timeout=60))
+
+    def discard_staged(self, ref):
+        cloudinary.uploader.destroy(ref, resource_type="raw", type="private")
+
+
+class LocalStorage:
+    """Stores uploads under static/uploads; `latency` fakes a network round-trip."""
+
+    def __init__(self, root=uploads_dir, base_url="/static/uploads", latency=0.0, staging_root=staging_dir):
+        self.root = root
+        self.base_url = base_url
+        self.latency = latency
+        self.staging_root = staging_root
+
+    def upload(self, fileobj, folder, resource_type="image", filename=None):
+        if self.latency:
+            time.sleep(self.latency)
+        extension = os.path.splitext(filename or "")[1].lower()
+        name = f"{uuid.uuid4().hex}{extension}"
+        target_dir = os.path.join(self.root, folder)
+        os.makedirs(target_dir, exist_ok=True)
+        with open(os.path.join(target_dir, name), "wb") as out:
+            shutil.copyfileobj(fileobj, out)
+        return f"{self.base_url}/{folder}/{name}"
+
+    # Staging: outside root, so nothing queued is served under /static
+    def stage(self, fileobj, filename=None):
+        os.makedirs(self.staging_root, exist_ok=True)
+        ref = f"{uuid.uuid4().hex}{os.path.splitext(filename or '')[1].lower()}"
+        with open(os.path.join(self.staging_root, ref), "wb") as out:
+            shutil.copyfileobj(fileobj, out)
+        return ref
+
+    def open_staged(self, ref):
+        return open(os.path.join(self.staging_root, ref), "rb")
+
+    def discard_staged(self, ref):
+        try:
+            os.remove(os.path.join(self.staging_root, ref))
+        except FileNotFoundError:
+            pass
+
+
+def storage_from_env():
+    if os.environ.get("MEDIA_STORAGE", "cloudinary") == "local":
+        return LocalStorage(latency=float(os.environ.get("MEDIA_LOCAL_LATENCY", "0")))
+    return CloudinaryStorage()
+
+
+storage = storage_from_env()
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix="upload")
+
+
+def set_storage(backend, concurrency=None):
+    """Swap the storage backend (and optionally the pool size), e.g. for benchmarks."""
+    global storage, _executor
+    storage = backend
+    if concurrency:
+        _executor.shutdown(wait=True)
+        _executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="upload")
+
+
+def _upload_one(upload, folder, resource_type):
+    backend = storage
+    upload.file.seek(0, os.SEEK_END)
+    size = upload.file.tell()
+    upload.file.seek(0)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        url = backend.upload(upload.file, folder, resource_type=resource_type, filename=upload.filename)
+        outcome = "ok"
+        return url
+    finally:
+        metrics.observe_upload(type(backend).__name__.replace("Storage", "").lower(), resource_type, outcome,
+                               time.perf_counter() - started, size)
+
+
+def _stage_one(upload):
+    upload.file.seek(0)
+    return storage.stage(upload.file, filename=upload.filename)
+
+
+def stage_batch(uploads):
+    """Stream UploadFiles to the storage backend's staging area, concurrently.
+
+    Returns their references in order. If any of them fails, the others are
+    discarded again and the first error is raised.
+    """
+    futures = [_executor.submit(_stage_one, upload) for upload in uploads]
+    refs, error = [], None
+    for future in futures:
+        try:
+            refs.append(future.result())
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        discard_staged(refs)
+        raise error
+    return refs
+
+
+def discard_staged(refs):
+    """Delete staged uploads; failures are only logged, a leftover costs storage, not correctness."""
+    for ref in refs:
+        try:
+            storage.discard_staged(ref)
+        except Exception as e:
+            print(f"Could not discard staged upload {ref}: {e}")
+
+
+def upload_batch(items):
+    """Upload (UploadFile, folder, resource_type) items concurrently.
+
+    Returns one entry per item, in order: the stored URL, or the exception the
+    upload raised, so callers decide which failures are fatal.
+    """
+    futures = [_executor.submit(_upload_one, upload, folder, resource_type)
+               for upload, folder, resource_type in items]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    return results
+
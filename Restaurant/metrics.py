@@ -0,0 +1,377 @@
+"""
+Prometheus metrics, served in the text exposition format at /metrics.
+
+  * http_requests_total / http_request_duration_seconds per method, route
+    template and status
+  * app_errors_total: 5xx responses, plus exceptions the handlers catch and
+    turn into {"success": false} JSON (see handled_error)
+  * db_pool_*: the connection pool of this process (db_pool.py)
+  * media_upload_duration_seconds / media_upload_bytes per storage backend
+    (Cloudinary or local) and resource type
+
+Recording takes no lock. Every thread updates its own shard (a plain dict
+only that thread writes to), and a scrape adds the shards up. Pool numbers
+are read from the pool when scraped.
+
+Each uvicorn worker is its own process with its own counters. With
+METRICS_DIR set to a directory the workers share (e.g. /tmp/agency-metrics),
+every worker writes a snapshot there every METRICS_FLUSH_SECONDS. A scrape
+of any worker then sums all snapshots. When a worker exits (or is found
+dead by a scrape) its counters and histograms are added to retired.json and
+its snapshot is deleted, so totals never go backwards, not even when a new
+worker gets the same PID. Gauges of exited workers are dropped. Without
+METRICS_DIR, each process only reports itself.
+
+METRICS=off leaves the middleware and endpoint out. With METRICS_TOKEN set,
+/metrics requires "Authorization: Bearer <token>"; without it the endpoint
+is only served on SQLite (local development).
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import db_pool
+import profiling
+
+try:
+    import fcntl
+except ImportError:  # Windows; METRICS_DIR is for several uvicorn workers on one Linux dyno
+    fcntl = None
+
+METRICS = os.environ.get("METRICS", "on")
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UPLOAD_SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+UPLOAD_BYTES_BUCKETS = tuple(float(2 ** power) for power in range(16, 30, 2))  # 64 KiB .. 256 MiB
+
+_registry = []
+_shards = []
+_shards_lock = threading.Lock()  # only taken when a thread makes its first shard
+_local = threading.local()
+_request_scope = ContextVar("metrics_scope", default=None)
+
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name, self.documentation, self.labels = name, documentation, labels
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        shard = _shard()
+        key = (self.name, label_values)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.documentation, self.labels, self.buckets = name, documentation, labels, buckets
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        shard = _shard()
+        key = (self.name, label_values)
+        counts = shard.get(key)
+        if counts is None:
+            # one count per bucket and +Inf (not cumulative), then sum and count
+            counts = shard[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+
+class Collected:
+    """Values read at scrape time: collect() -> {label values: number}."""
+
+    def __init__(self, name, documentation, kind, labels, collect):
+        self.name, self.documentation, self.kind, self.labels = name, documentation, kind, labels
+        self.collect = collect
+        _registry.append(self)
+
+
+REQUESTS = Counter("http_requests_total", "Requests by route template and status.",
+                   ("method", "route", "status"))
+LATENCY = Histogram("http_request_duration_seconds", "Time to the last byte of the response.",
+                    ("method", "route"))
+ERRORS = Counter("app_errors_total", "5xx responses and exceptions handlers turned into error JSON.",
+                 ("method", "route", "error"))
+UPLOAD_SECONDS = Histogram("media_upload_duration_seconds", "Duration of one upload to media storage.",
+                           ("backend", "resource_type", "outcome"), UPLOAD_SECONDS_BUCKETS)
+UPLOAD_BYTES = Histogram("media_upload_bytes", "Size of files uploaded to media storage.",
+                         ("backend", "resource_type"), UPLOAD_BYTES_BUCKETS)
+
+
+def watch_pool(engine):
+    """Export the engine's pool numbers (db_pool.TimedQueuePool) with every scrape."""
+    def read(*fields):
+        def collect():
+            stats = db_pool.stats(engine)
+            return {(field,): stats[field] for field in fields if field in stats}
+        return collect
+
+    def wait_seconds():
+        pool = engine.pool
+        return {(): pool.stats.wait_seconds} if isinstance(pool, db_pool.TimedQueuePool) else {}
+
+    Collected("db_pool_connections", "Pool connections by state.", "gauge", ("state",),
+              read("in_use", "idle", "overflow_in_use"))
+    Collected("db_pool_size", "Configured pool size and max overflow.", "gauge", ("setting",),
+              read("size", "max_overflow"))
+    Collected("db_pool_events_total", "Pool checkouts, overflow connections opened and checkout timeouts.",
+              "counter", ("event",), read("checkouts", "overflow_opened", "timeouts"))
+    Collected("db_pool_checkout_wait_seconds_total", "Time spent waiting for a pool connection.",
+              "counter", (), wait_seconds)
+
+
+def observe_upload(backend, resource_type, outcome, seconds, size):
+    UPLOAD_SECONDS.observe(seconds, backend, resource_type, outcome)
+    if size is not None:
+        UPLOAD_BYTES.observe(size, backend, resource_type)
+
+
+def handled_error(exc):
+    """Count an exception a handler caught and answered with error JSON."""
+    scope = _request_scope.get()
+    if scope is not None:
+        ERRORS.inc(scope["method"], profiling.route_template(scope), type(exc).__name__)
+
+
+# --- collection ---
+
+def snapshot():
+    """This process's values: {(name, label values): number or histogram counts}."""
+    values = {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        for key, value in dict(shard).items():  # dict() copies in one step; the owner may be writing
+            if isinstance(value, list):
+                merged = values.setdefault(key, [0] * len(value))
+                for index, count in enumerate(list(value)):
+                    merged[index] += count
+            else:
+                values[key] = values.get(key, 0) + value
+    for metric in _registry:
+        if isinstance(metric, Collected):
+            for label_values, value in metric.collect().items():
+                values[(metric.name, tuple(label_values))] = value
+    return values
+
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f"metrics-{pid}.json")
+
+
+def _retired_path():
+    return os.path.join(METRICS_DIR, "retired.json")
+
+
+def _read(path):
+    with open(path) as snapshot_file:
+        return {(name, tuple(labels)): value for name, labels, value in json.load(snapshot_file)}
+
+
+def _write(path, values):
+    with open(f"{path}.tmp", "w") as out:
+        json.dump([[name, list(labels), value] for (name, labels), value in values.items()], out)
+    os.replace(f"{path}.tmp", path)
+
+
+def _add(totals, values, skip=()):
+    for key, value in values.items():
+        if key[0] in skip:
+            continue
+        if isinstance(value, list):
+            merged = totals.setdefault(key, [0] * len(value))
+            for index, count in enumerate(value):
+                merged[index] += count
+        else:
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+@contextmanager
+def _shared_lock():
+    # Retiring a snapshot and reading the others must not interleave, or a
+    # scrape could count a worker twice, or not at all
+    with open(os.path.join(METRICS_DIR, "metrics.lock"), "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _retire(paths):
+    """Add the counters and histograms of these snapshots to retired.json, then delete them."""
+    gauges = {metric.name for metric in _registry if metric.kind == "gauge"}
+    retired = _read(_retired_path()) if os.path.exists(_retired_path()) else {}
+    for path in paths:
+        try:
+            _add(retired, _read(path), skip=gauges)
+        except (OSError, ValueError):
+            pass  # gone or truncated: dropped rather than failing every later scrape
+    _write(_retired_path(), retired)
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def flush():
+    """Write this process's snapshot to METRICS_DIR for the other workers' scrapes."""
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _write(_snapshot_path(os.getpid()), snapshot())
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect_all():
+    """Values of every worker sharing METRICS_DIR, or of this process alone."""
+    if not METRICS_DIR:
+        return snapshot()
+    with _shared_lock():
+        flush()
+        paths = glob.glob(os.path.join(METRICS_DIR, "metrics-*.json"))
+        pids = {path: int(os.path.basename(path)[len("metrics-"):-len(".json")]) for path in paths}
+        dead = [path for path in paths if pids[path] != os.getpid() and not _alive(pids[path])]
+        if dead:
+            _retire(dead)
+        totals = _read(_retired_path()) if os.path.exists(_retired_path()) else {}
+        for path in set(paths) - set(dead):
+            try:
+                _add(totals, _read(path))
+            except (OSError, ValueError):
+                continue  # its worker is retiring it right now
+    return totals
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r'\"').replace("\n", r"\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(values=None):
+    """Prometheus text format (version 0.0.4)."""
+    values = collect_all() if values is None else values
+    by_name = {}
+    for (name, label_values), value in values.items():
+        by_name.setdefault(name, []).append((label_values, value))
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for label_values, value in sorted(by_name.get(metric.name, []), key=lambda item: item[0]):
+            if metric.kind != "histogram":
+                lines.append(f"{metric.name}{_labels(metric.labels, label_values)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ("+Inf",), value):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(float(bound))
+                lines.append(f"{metric.name}_bucket{_labels(metric.labels, label_values, [('le', le)])} {cumulative}")
+            lines.append(f"{metric.name}_sum{_labels(metric.labels, label_values)} {_number(float(value[-2]))}")
+            lines.append(f"{metric.name}_count{_labels(metric.labels, label_values)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = _request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_scope.reset(token)
+            method, route = scope["method"], profiling.route_template(scope)
+            REQUESTS.inc(method, route, str(status))
+            LATENCY.observe(time.perf_counter() - started, method, route)
+            if status >= 500:
+                ERRORS.inc(method, route, "5xx")
+
+
+_flusher = None
+_stopped = threading.Event()
+
+
+def _exit():
+    # Hand this process's counts to retired.json on the way out
+    with _shared_lock():
+        _stopped.set()
+        flush()
+        _retire([_snapshot_path(os.getpid())])
+
+
+def start():
+    """Begin writing snapshots to METRICS_DIR (no-op without it)."""
+    global _flusher
+    if not METRICS_DIR or _flusher is not None:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with _shared_lock():
+        # Left by an earlier process with this PID, killed before its exit hook
+        if os.path.exists(_snapshot_path(os.getpid())):
+            _retire([_snapshot_path(os.getpid())])
+
+    def loop():
+        while not _stopped.wait(FLUSH_SECONDS):
+            try:
+                with _shared_lock():
+                    if not _stopped.is_set():
+                        flush()
+            except OSError as e:
+                print(f"⚠️  Metrics snapshot failed: {e}")
+
+    _flusher = threading.Thread(target=loop, name="metrics-flush", daemon=True)
+    _flusher.start()
+    atexit.register(_exit)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations.
+
+schema_migrations records which of STEPS have been applied. Each step runs
+in its own transaction together with its version row, and checks the schema
+before changing anything. That way a database already patched by hand, or by
+the old one-off scripts (add_featured_column.py, heroku_migrate.py,
+fix_field_lengths.py, ...), ends up in the same place as a fresh one.
+
+Production applies them once per release (Procfile `release:`):
+
+    python migrations.py migrate   # apply pending steps
+    python migrations.py status    # list steps, applied or pending
+
+At startup the app only reads the current version. If steps are pending it
+applies them itself when MIGRATE_ON_STARTUP=on (the default on SQLite, i.e.
+local development). Otherwise it prints a warning and carries on.
+
+Schema changes go in as new steps at the end of STEPS; applied steps are
+never edited. Step 1 runs create_all(), which only creates the tables
+missing at that point, so a table added later needs its own step.
+"""
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.orm import Session
+
+import add_indexes
+import dashboard_stats
+import search
+from models import Base, engine, DataMigrationCheckpoint, SchemaMigration
+
+MIGRATE_ON_STARTUP = os.environ.get(
+    "MIGRATE_ON_STARTUP", "on" if engine.dialect.name == "sqlite" else "off"
+)
+
+
+def _add_columns(conn, table, columns):
+    existing = {column["name"] for column in inspect(conn).get_columns(table)}
+    for name, ddl in columns:
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+            print(f"✅ Added {name} column to {table} table")
+
+
+def create_tables(conn):
+    Base.metadata.create_all(bind=conn)
+
+
+def models_profile_columns(conn):
+    # migrate_db.py, heroku_migrate.py, migrate_rates.py. The old scripts also
+    # filled NULL rates with a legacy price list that no template reads any more
+    # (profiles fall back to "On Request"), so that part is not carried over.
+    _add_columns(conn, "models", [
+        ("residence", "VARCHAR(100)"),
+        ("availability", "VARCHAR(50)"),
+        ("nationality", "VARCHAR(50)"),
+        ("job", "VARCHAR(100)"),
+        ("body_measurements", "VARCHAR(50)"),
+        ("bra_size", "VARCHAR(20)"),
+        ("languages", "TEXT"),
+        ("clothing_style", "TEXT"),
+        ("lingerie_style", "TEXT"),
+        ("favorite_cuisine", "TEXT"),
+        ("favorite_perfume", "VARCHAR(100)"),
+        ("rates", "TEXT"),
+    ])
+
+
+def models_gender(conn):
+    # add_gender_migration.py, heroku_gender_migration.py
+    _add_columns(conn, "models", [("gender", "VARCHAR(10) DEFAULT 'female'")])
+    conn.execute(text("UPDATE models SET gender = 'female' WHERE gender IS NULL"))
+
+
+def models_phone(conn):
+    # add_phone_column.py
+    _add_columns(conn, "models", [("phone", "VARCHAR(20)")])
+
+
+def models_featured_and_video(conn):
+    # add_featured_column.py and the ALTERs startup_event used to run
+    _add_columns(conn, "models", [("featured", "BOOLEAN DEFAULT FALSE"), ("profile_video", "VARCHAR(500)")])
+
+
+def models_media_columns(conn):
+    _add_columns(conn, "models", [("media_status", "VARCHAR(20) DEFAULT 'ready'"), ("photo_meta", "TEXT")])
+
+
+def models_field_lengths(conn):
+    # fix_field_lengths.py. SQLite doesn't enforce VARCHAR lengths, so only
+    # Postgres needs the wider types; its old table copy for SQLite is not needed.
+    if conn.dialect.name != "postgresql":
+        return
+    lengths = {"residence": 200, "nationality": 100, "job": 200, "favorite_perfume": 200,
+               "body_measurements": 100, "bra_size": 50}
+    current = {column["name"]: getattr(column["type"], "length", None)
+               for column in inspect(conn).get_columns("models")}
+    for name, length in lengths.items():
+        if current.get(name) is not None and current[name] < length:
+            conn.execute(text(f"ALTER TABLE models ALTER COLUMN {name} TYPE VARCHAR({length})"))
+            print(f"✅ Widened models.{name} to VARCHAR({length})")
+
+
+def composite_indexes(conn):
+    add_indexes.migrate(conn)
+
+
+def status_counters(conn):
+    with Session(bind=conn) as db:
+        dashboard_stats.ensure_counters(db)
+        db.flush()
+
+
+def model_search_index(conn):
+    with Session(bind=conn) as db:
+        search.ensure_index(db)
+        db.flush()
+
+
+def data_migration_checkpoints(conn):
+    DataMigrationCheckpoint.__table__.create(bind=conn, checkfirst=True)
+
+
+def models_version(conn):
+    _add_columns(conn, "models", [("version", "INTEGER NOT NULL DEFAULT 1")])
+
+
+def media_jobs_staged_ref(conn):
+    _add_columns(conn, "media_jobs", [("staged_ref", "VARCHAR(500)")])
+
+
+def keyset_columns_not_null(conn):
+    # Keyset pagination compares these columns, and a NULL compares as unknown.
+    # Legacy NULL dates take the table's oldest date, so those rows page last.
+    # SQLite can't add NOT NULL to an existing column without copying the
+    # table; there the backfill and the models' defaults have to do.
+    for table, column in (("models", "featured"), ("models", "created_at"), ("bookings", "created_at")):
+        fill = "false" if column == "featured" else f"COALESCE((SELECT min({column}) FROM {table}), CURRENT_TIMESTAMP)"
+        filled = conn.execute(text(f"UPDATE {table} SET {column} = {fill} WHERE {column} IS NULL")).rowcount
+        if filled:
+            print(f"✅ Filled {filled} NULL {table}.{column} values")
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL"))
+
+
+# (version, name, step) in the order they apply; append only
+STEPS = [
+    (1, "create_tables", create_tables),
+    (2, "models_profile_columns", models_profile_columns),
+    (3, "models_gender", models_gender),
+    (4, "models_phone", models_phone),
+    (5, "models_featured_and_video", models_featured_and_video),
+    (6, "models_media_columns", models_media_columns),
+    (7, "models_field_lengths", models_field_lengths),
+    (8, "composite_indexes", composite_indexes),
+    (9, "status_counters", status_counters),
+    (10, "model_search_index", model_search_index),
+    (11, "data_migration_checkpoints", data_migration_checkpoints),
+    (12, "models_version", models_version),
+    (13, "media_jobs_staged_ref", media_jobs_staged_ref),
+    (14, "keyset_columns_not_null", keyset_columns_not_null),
+]
+LATEST = STEPS[-1][0]
+
+
+def current_version():
+    """Highest applied version; 0 for a new database or one from before this table."""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(SchemaMigration.__tablename__):
+            return 0
+        return conn.execute(select(func.max(SchemaMigration.version))).scalar() or 0
+
+
+def migrate(target=LATEST):
+    """Apply pending steps up to `target`, each in its own transaction. Returns how many ran."""
+    with engine.begin() as conn:
+        SchemaMigration.__table__.create(bind=conn, checkfirst=True)
+    applied = 0
+    for version, name, step in STEPS:
+        if version > target:
+            break
+        with engine.begin() as conn:
+            if conn.dialect.name == "sqlite":
+                # pysqlite only opens a transaction before DML; without this a
+                # step's DDL would commit as it runs, even if the step then fails
+                conn.exec_driver_sql("BEGIN")
+            if conn.execute(select(SchemaMigration.version).where(SchemaMigration.version == version)).first():
+                continue
+            step(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+        print(f"✅ Migration {version} {name} applied")
+        applied += 1
+    return applied
+
+
+def check():
+    """Startup: read the version; migrate or warn when the schema is behind."""
+    version = current_version()
+    if version >= LATEST:
+        return version
+    if MIGRATE_ON_STARTUP == "on":
+        migrate()
+        return LATEST
+    print(f"⚠️  Database schema is at version {version}, this release expects {LATEST}. "
+          f"Run: python migrations.py migrate")
+    return version
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    parser.add_argument("command", choices=["migrate", "status"])
+    parser.add_argument("--to", type=int, default=LATEST, help="stop after this version")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        applied = migrate(args.to)
+        print(f"✅ Schema at version {current_version()} ({applied} applied)")
+    else:
+        version = current_version()
+        for number, name, _ in STEPS:
+            print(f"{'✅' if number <= version else '⏳'} {number:>3} {name}")
+        sys.exit(0 if version >= LATEST else 1)
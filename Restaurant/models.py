@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, create_engine
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Index, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from datetime import datetime
+import json
 
 Base = declarative_base()
 
@@ -52,6 +53,18 @@ class City(Base):
     
     agency = relationship("Agency", back_populates="cities")
     models = relationship("Model", back_populates="city")
+    
+    __table_args__ = (
+        # city names are unique per agency; also serves /city/{name} lookups
+        Index('uq_cities_agency_name', 'agency_id', 'name', unique=True),
+    )
+
+def _decode_json(value, default):
+    try:
+        decoded = json.loads(value) if value else default
+    except ValueError:
+        return default
+    return decoded if isinstance(decoded, type(default)) else default
 
 class Model(Base):
     __tablename__ = "models"
@@ -69,34 +82,91 @@ class Model(Base):
     photos = Column(Text)  # JSON array of photo URLs
     status = Column(String(20), default='pending')  # pending, approved, rejected
     available = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
     # New fields from screenshots
     phone = Column(String(20))  # Model contact phone
-    residence = Column(String(100))
+    residence = Column(String(200))
     availability = Column(String(50))  # Worldwide, Local, etc
-    nationality = Column(String(50))
-    job = Column(String(100))
-    body_measurements = Column(String(50))  # e.g., "170cm / S (34)"
-    bra_size = Column(String(20))  # e.g., "75B (Natural)"
+    nationality = Column(String(100))
+    job = Column(String(200))
+    body_measurements = Column(String(100))  # e.g., "170cm / S (34)"
+    bra_size = Column(String(50))  # e.g., "75B (Natural)"
     languages = Column(Text)  # JSON array of languages
     clothing_style = Column(Text)
     lingerie_style = Column(Text)
     favorite_cuisine = Column(Text)
-    favorite_perfume = Column(String(100))
+    favorite_perfume = Column(String(200))
     
     # Rate fields
     rates = Column(Text)  # JSON object with all rate information
     
     # Featured field for homepage display
-    featured = Column(Boolean, default=False)
+    featured = Column(Boolean, default=False, nullable=False)
     
     # Profile video URL (loops in hero section like home page)
     profile_video = Column(String(500))
     
+    # ready, processing (uploads queued in media_jobs), failed
+    media_status = Column(String(20), default='ready')
+    
+    # JSON object: photo URL -> width, height, color, blurhash, variants (see images.py)
+    photo_meta = Column(Text)
+    
+    # Bumped by every change; keys the rendered-fragment cache (fragments.py)
+    version = Column(Integer, default=1, nullable=False)
+    
     agency = relationship("Agency", back_populates="models")
     city = relationship("City", back_populates="models")
     bookings = relationship("Booking", back_populates="model")
+    media_jobs = relationship("MediaJob", back_populates="model", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Every query is scoped to one agency (tenants.py), so agency_id leads
+        # home: approved, ORDER BY featured DESC, created_at DESC
+        Index('ix_models_agency_status_featured_created', 'agency_id', 'status', 'featured', 'created_at'),
+        # models_page / city_models / cities_page: approved models in a city
+        Index('ix_models_agency_status_city', 'agency_id', 'status', 'city_id'),
+        # dashboard: recent pending applications
+        Index('ix_models_agency_status_created', 'agency_id', 'status', 'created_at'),
+        # admin model list
+        Index('ix_models_agency_created', 'agency_id', 'created_at'),
+    )
+    
+    # Decoded views of the JSON text columns. Each column is parsed at most once
+    # per instance; assigning the column, expiring or refreshing the row drops it.
+    def _json_column(self, name, default):
+        cache = self.__dict__.setdefault('_json_cache', {})
+        if name not in cache:
+            cache[name] = _decode_json(getattr(self, name), default)
+        return cache[name]
+    
+    @property
+    def photo_list(self):
+        return self._json_column('photos', [])
+    
+    @property
+    def language_list(self):
+        return self._json_column('languages', [])
+    
+    @property
+    def rate_map(self):
+        return self._json_column('rates', {})
+    
+    @property
+    def photo_meta_map(self):
+        return self._json_column('photo_meta', {})
+    
+    def photo_info(self, url):
+        return self.photo_meta_map.get(url)
+
+def _drop_json_cache(target, *args):
+    target.__dict__.pop('_json_cache', None)
+
+for _column in (Model.photos, Model.languages, Model.rates, Model.photo_meta):
+    event.listen(_column, 'set', _drop_json_cache)
+event.listen(Model, 'expire', _drop_json_cache)
+event.listen(Model, 'refresh', _drop_json_cache)
 
 class Booking(Base):
     __tablename__ = "bookings"
@@ -111,10 +181,68 @@ class Booking(Base):
     event_type = Column(String(100))
     message = Column(Text)
     status = Column(String(20), default='pending')  # pending, confirmed, cancelled
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
     agency = relationship("Agency", back_populates="bookings")
     model = relationship("Model", back_populates="bookings")
+    
+    __table_args__ = (
+        # dashboard / admin list: filter by status, newest first
+        Index('ix_bookings_agency_status_created', 'agency_id', 'status', 'created_at'),
+        Index('ix_bookings_agency_created', 'agency_id', 'created_at'),
+        Index('ix_bookings_model', 'model_id'),
+    )
+
+class MediaJob(Base):
+    __tablename__ = "media_jobs"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    model_id = Column(Integer, ForeignKey('models.id'), nullable=False)
+    kind = Column(String(10), nullable=False)  # 'photo', 'video'
+    staged_ref = Column(String(500))  # the upload in the storage backend's staging area (media.stage_batch)
+    filename = Column(String(255))
+    folder = Column(String(100), nullable=False)
+    resource_type = Column(String(10), default='image')
+    status = Column(String(20), default='pending')  # pending, running, done, failed
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+    run_after = Column(DateTime, default=datetime.utcnow)  # retry backoff
+    locked_at = Column(DateTime)  # when a worker claimed it
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    model = relationship("Model", back_populates="media_jobs")
+    
+    __table_args__ = (
+        # worker poll: due pending jobs
+        Index('ix_media_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+class StatusCount(Base):
+    __tablename__ = "status_counts"
+    
+    # Rows per agency, table and status; kept in step by dashboard_stats.py
+    agency_id = Column(Integer, ForeignKey('agencies.id'), primary_key=True)
+    table_name = Column(String(20), primary_key=True)  # 'models', 'bookings'
+    status = Column(String(20), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    
+    # One row per applied step of migrations.py
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(100), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+class DataMigrationCheckpoint(Base):
+    __tablename__ = "data_migration_checkpoints"
+    
+    # Progress of one pass of a data_migrations.py migration, for resuming
+    name = Column(String(100), primary_key=True)  # "<migration>:<pass>"
+    last_id = Column(Integer, nullable=False, default=0)  # rows up to this id are done
+    rows_changed = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
 
 # Legacy tables for compatibility (can be removed later)
 class Table(Base):
@@ -144,6 +272,12 @@ class AnalyticsRecord(Base):
 # Database setup
 import os
 
+from anyio import CapacityLimiter
+from anyio.lowlevel import RunVar
+from starlette.concurrency import run_in_threadpool
+
+import db_pool
+
 # Use PostgreSQL on Heroku, SQLite locally
 DATABASE_URL = os.environ.get("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
@@ -152,15 +286,44 @@ if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
 if not DATABASE_URL:
     DATABASE_URL = "sqlite:///./agency.db"
 
-engine = create_engine(DATABASE_URL)
+# Pool sizing, pre-ping and SQLite pragmas come from the environment; see db_pool.py
+engine = db_pool.make_engine(DATABASE_URL)
+
+# Route handlers that touch the database are plain `def` functions, so FastAPI
+# runs them on its worker threadpool instead of the event loop. That pool also
+# serves static files, upload reads and streamed bodies, so it keeps anyio's
+# default size; instead get_db holds one of DB_THREADS slots (the connection
+# pool size plus overflow) for as long as the handler has its Session. A burst
+# of requests queues on the event loop for a slot rather than for a
+# connection, and nothing else waits behind it.
+DB_THREADS = int(os.environ.get("DB_THREADS", str(db_pool.connection_limit(engine))))
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# One limiter per event loop, like anyio's own default thread limiter
+_db_limiter = RunVar("_db_limiter")
+
 def create_tables():
     Base.metadata.create_all(bind=engine)
 
-def get_db():
+def db_limiter():
+    """The DB_THREADS slots shared by this event loop's DB-backed handlers."""
+    try:
+        return _db_limiter.get()
+    except LookupError:
+        limiter = CapacityLimiter(DB_THREADS)
+        _db_limiter.set(limiter)
+        return limiter
+
+async def get_db():
+    # Scripts outside the app open SessionLocal() themselves
+    limiter, slot = db_limiter(), object()
+    await limiter.acquire_on_behalf_of(slot)
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        try:
+            await run_in_threadpool(db.close)
+        finally:
+            limiter.release_on_behalf_of(slot)
\ No newline at end of file
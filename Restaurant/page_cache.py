@@ -0,0 +1,412 @@
+"""
+Rendered-page cache for the public HTML routes.
+
+Public pages only change when an admin (or the media worker) edits data, so
+the rendered body is kept per agency, path and normalized query string and
+served without touching the database. Every entry carries tags such as "models",
+"model:12", "cities" and "agency", scoped to its agency ("3:models"), so a
+committed change only invalidates that agency's pages. install() hooks that
+into SessionLocal at startup, for the handlers and the media worker alike;
+see _collect_tags below.
+
+Entries also keep their validators: a weak ETag of the body and the time it
+was rendered. A conditional request for a cached page gets its 304 before
+any query or template work.
+
+PAGE_CACHE=memory (default) keeps an LRU per process, bounded by
+PAGE_CACHE_MAX_ENTRIES and PAGE_CACHE_TTL seconds. PAGE_CACHE=redis shares
+one cache between processes and dynos through PAGE_CACHE_REDIS_URL (needs the
+redis package). PAGE_CACHE=off disables it.
+
+Invalidation reaches only the cache of the process that committed the change.
+With the memory backend and more than one worker (WEB_CONCURRENCY > 1), or
+more than one dyno, the other workers keep serving the old page until it
+expires, i.e. for up to PAGE_CACHE_TTL seconds after an edit. Run those with
+PAGE_CACHE=redis (or off); install() warns at startup when it sees this.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlencode
+
+from fastapi.responses import HTMLResponse, Response
+from sqlalchemy import event, inspect
+
+from models import SessionLocal, Agency, City, Model
+
+PAGE_CACHE = os.environ.get("PAGE_CACHE", "memory")
+TTL_SECONDS = int(os.environ.get("PAGE_CACHE_TTL", "300"))
+MAX_ENTRIES = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", "1000"))
+REDIS_URL = os.environ.get("PAGE_CACHE_REDIS_URL", os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+# uvicorn worker processes, as Heroku sets it; each has its own MemoryBackend
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+
+class MemoryBackend:
+    """Per-process LRU of rendered pages with a TTL and a tag index."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, page, tags)
+        self._tags = {}  # tag -> keys
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, page, tags, generation):
+        with self._lock:
+            # Data changed while this page rendered; the body may be stale
+            if generation != self._generation:
+                return False
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, page, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._generation += 1
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def size(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisBackend:
+    """Cache shared by every web process; pages are hashes, tags are sets of page keys."""
+
+    def __init__(self, url=REDIS_URL, ttl=TTL_SECONDS, prefix="pagecache:"):
+        import redis
+        self._redis = redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = 0  # Redis evicts on its own (maxmemory-policy)
+
+    def _generation_key(self):
+        return self.prefix + "generation"
+
+    def generation(self):
+        return int(self.client.get(self._generation_key()) or 0)
+
+    def get(self, key):
+        fields = self.client.hgetall(self.prefix + "page:" + key)
+        if not fields:
+            return None
+        return {
+            "body": fields[b"body"],
+            "etag": fields[b"etag"].decode(),
+            "last_modified": float(fields[b"last_modified"]),
+            "cache_control": fields[b"cache_control"].decode(),
+        }
+
+    def set(self, key, page, tags, generation):
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self._generation_key())
+                if int(pipe.get(self._generation_key()) or 0) != generation:
+                    return False
+                pipe.multi()
+                pipe.hset(self.prefix + "page:" + key, mapping=page)
+                pipe.expire(self.prefix + "page:" + key, self.ttl)
+                for tag in tags:
+                    pipe.sadd(self.prefix + "tag:" + tag, key)
+                    pipe.expire(self.prefix + "tag:" + tag, self.ttl)
+                pipe.execute()
+                return True
+            except self._redis.WatchError:
+                return False
+
+    def invalidate(self, tags):
+        tag_keys = [self.prefix + "tag:" + tag for tag in tags]
+        keys = set()
+        for tag_key in tag_keys:
+            keys |= self.client.smembers(tag_key)
+        pipe = self.client.pipeline()
+        pipe.incr(self._generation_key())
+        pipe.delete(*tag_keys, *[self.prefix + "page:" + key.decode() for key in keys])
+        pipe.execute()
+        return len(keys)
+
+    def clear(self):
+        pipe = self.client.pipeline()
+        pipe.incr(self._generation_key())
+        for key in self.client.scan_iter(self.prefix + "page:*"):
+            pipe.delete(key)
+        for key in self.client.scan_iter(self.prefix + "tag:*"):
+            pipe.delete(key)
+        pipe.execute()
+
+    def size(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + "page:*"))
+
+
+def backend_from_env():
+    if PAGE_CACHE == "off":
+        return None
+    if PAGE_CACHE == "redis":
+        try:
+            backend = RedisBackend()
+            backend.client.ping()
+            return backend
+        except Exception as e:
+            print(f"⚠️  Redis page cache unavailable ({e}), using in-process cache")
+    return MemoryBackend()
+
+
+backend = backend_from_env()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "stale_stores": 0, "invalidations": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def set_backend(new_backend):
+    """Swap the cache backend (None disables caching), e.g. for benchmarks."""
+    global backend
+    backend = new_backend
+    reset_stats()
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_ratio"] = round(snapshot["hits"] / lookups, 4) if lookups else 0.0
+    snapshot["backend"] = type(backend).__name__ if backend else "off"
+    try:
+        snapshot["entries"] = backend.size() if backend else 0
+        snapshot["evictions"] = backend.evictions if backend else 0
+    except Exception:
+        snapshot["entries"] = None
+    return snapshot
+
+
+def cache_key(request, params=()):
+    # Only the query parameters the page actually reads, sorted and without
+    # blanks, so ?utm_source=... or a reordered query can't fork the cache
+    query = sorted(
+        (name, value) for name, value in request.query_params.multi_items()
+        if name in params and value != ""
+    )
+    key = request.url.path + ("?" + urlencode(query) if query else "")
+    # Every agency renders its own copy of a path (see tenants.py)
+    agency = getattr(request.state, "agency", None)
+    return f"{agency.id}:{key}" if agency is not None else key
+
+
+def agency_tags(agency_id, tags):
+    """Scope cache tags to one agency, as cache_key() does for paths."""
+    return {f"{agency_id}:{tag}" for tag in tags} if agency_id is not None else set(tags)
+
+
+def _validators(page):
+    headers = {"ETag": page["etag"], "Cache-Control": page["cache_control"]}
+    if page["last_modified"]:
+        headers["Last-Modified"] = formatdate(page["last_modified"], usegmt=True)
+    return headers
+
+
+def not_modified(request, page):
+    """True when the request's validators still match `page` (RFC 9110 13.2.2)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison; If-Modified-Since is ignored when this is present
+        if if_none_match.strip() == "*":
+            return True
+        etag = page["etag"].removeprefix("W/")
+        return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and page["last_modified"]:
+        try:
+            return int(page["last_modified"]) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _respond(request, page, cache_state):
+    headers = _validators(page)
+    headers["X-Cache"] = cache_state
+    if not_modified(request, page):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(page["body"], headers=headers)
+
+
+def lookup(request, params=()):
+    """Return the cached response (or a 304) for this page, or None after noting a miss."""
+    if backend is None:
+        return None
+    key = cache_key(request, params)
+    try:
+        # Taken before the handler queries anything; store() refuses the body
+        # if an invalidation happened in between
+        request.state.page_cache = (key, backend.generation())
+        page = backend.get(key)
+    except Exception as e:
+        _count("errors")
+        print(f"Page cache error: {e}")
+        return None
+    if page is None:
+        _count("misses")
+        return None
+    _count("hits")
+    return _respond(request, page, "HIT")
+
+
+def store(request, response, tags, cache_control="no-cache"):
+    """Cache a freshly rendered 200 response under the key lookup() computed.
+
+    Returns the response to send: the rendered page with its validators, or
+    a 304 when the client already had this exact body.
+    """
+    if response.status_code != 200:
+        return response
+    page = {
+        "body": response.body,
+        "etag": 'W/"%s"' % hashlib.blake2b(response.body, digest_size=16).hexdigest(),
+        "last_modified": 0.0,
+        "cache_control": cache_control,
+    }
+    pending = getattr(request.state, "page_cache", None)
+    if backend is None or pending is None:
+        # Nothing remembers when this body was rendered; the ETag alone still
+        # saves the transfer
+        return _respond(request, page, "OFF")
+
+    key, generation = pending
+    agency = getattr(request.state, "agency", None)
+    tags = agency_tags(agency.id if agency is not None else None, tags)
+    page["last_modified"] = time.time()
+    try:
+        if backend.set(key, page, tuple(sorted(tags)), generation):
+            _count("stores")
+        else:
+            _count("stale_stores")
+            page["last_modified"] = 0.0
+    except Exception as e:
+        _count("errors")
+        print(f"Page cache error: {e}")
+    return _respond(request, page, "MISS")
+
+
+def invalidate(*tags):
+    if backend is None or not tags:
+        return 0
+    try:
+        removed = backend.invalidate(tags)
+    except Exception as e:
+        _count("errors")
+        print(f"Page cache error: {e}")
+        return 0
+    _count("invalidations")
+    return removed
+
+
+def clear():
+    if backend is not None:
+        backend.clear()
+
+
+def _model_tags(model, state):
+    tags = {f"model:{model.id}"}
+    # Listings only show approved models; a pending application changing
+    # doesn't touch them
+    history = state.attrs.status.history
+    statuses = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    if "approved" in statuses or model.status == "approved":
+        tags.add("models")
+    return agency_tags(model.agency_id, tags)
+
+
+def _collect_tags(session, flush_context):
+    # new/dirty/deleted and attribute history still show what this flush wrote
+    tags = session.info.setdefault("page_cache_tags", set())
+    dirty = [obj for obj in session.dirty if session.is_modified(obj)]
+    for obj in list(session.new) + dirty + list(session.deleted):
+        if isinstance(obj, Model):
+            tags |= _model_tags(obj, inspect(obj))
+        elif isinstance(obj, City):
+            tags |= agency_tags(obj.agency_id, ("cities", "models"))
+        elif isinstance(obj, Agency):
+            tags |= agency_tags(obj.id, ("agency",))
+
+
+def _invalidate_committed(session):
+    tags = session.info.pop("page_cache_tags", None)
+    if tags:
+        invalidate(*sorted(tags))
+
+
+def _forget_rolled_back(session):
+    session.info.pop("page_cache_tags", None)
+
+
+_HOOKS = (("after_flush", _collect_tags), ("after_commit", _invalidate_committed),
+          ("after_rollback", _forget_rolled_back))
+
+
+def install(session_factory=SessionLocal):
+    """Invalidate cached pages on every commit through `session_factory`; safe to call again.
+
+    Also warns when the cache is per process but the app runs several workers.
+    """
+    for name, hook in _HOOKS:
+        if not event.contains(session_factory, name, hook):
+            event.listen(session_factory, name, hook)
+    if isinstance(backend, MemoryBackend) and WEB_CONCURRENCY > 1:
+        print(f"⚠️  Page cache is per process but WEB_CONCURRENCY={WEB_CONCURRENCY}: other workers serve "
+              f"edited pages stale for up to {TTL_SECONDS}s. Set PAGE_CACHE=redis (or off)")
@@ -0,0 +1,77 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+from urllib.parse import urlencode
+
+from fastapi import HTTPException
+from sqlalchemy import and_, literal, or_
+
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", "24"))
+ADMIN_PAGE_SIZE = int(os.environ.get("ADMIN_PAGE_SIZE", "50"))
+
+
+def encode_cursor(row, order):
+    values = []
+    for column, descending in order:
+        value = getattr(row, column.key)
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, order):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(order):
+            raise ValueError("cursor does not match ordering")
+        return [_cursor_value(column, value) for (column, descending), value in zip(order, values)]
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _cursor_value(column, value):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    # type(), not isinstance(): JSON true is not an id and 1 is not a flag
+    if type(value) is not python_type:
+        raise TypeError(f"cursor value for {column.key} is not {python_type.__name__}")
+    return value
+
+
+def keyset_page(query, order, cursor=None, limit=PAGE_SIZE):
+    """Return (rows, next_cursor) for one page of `query`.
+
+    `order` is a list of (column, descending) pairs ending in a unique column,
+    e.g. [(Model.featured, True), (Model.created_at, True), (Model.id, True)].
+    Ordering columns must be NOT NULL (see migrations.keyset_columns_not_null):
+    a NULL compares as unknown, so its row would drop out of every later page.
+    Each page continues strictly after the previous page's last row, so rows
+    inserted while a visitor scrolls never shift, repeat or skip later pages.
+    """
+    if cursor:
+        # literal() so booleans compare as bound values (featured < true)
+        values = [literal(value, column.type) for (column, _), value in zip(order, decode_cursor(cursor, order))]
+        after = []
+        for i, (column, descending) in enumerate(order):
+            equal = [earlier == value for (earlier, _), value in zip(order[:i], values[:i])]
+            beyond = column < values[i] if descending else column > values[i]
+            after.append(and_(*equal, beyond))
+        query = query.filter(or_(*after))
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in order])
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1], order)
+    return rows, None
+
+
+def next_page_url(path, cursor, **params):
+    """Relative URL of the next page, keeping the active filters; None on the last page."""
+    if not cursor:
+        return None
+    query = {key: value for key, value in params.items() if value not in (None, "")}
+    query["cursor"] = cursor
+    return f"{path}?{urlencode(query)}"
@@ -0,0 +1,288 @@
+"""
+Per-request profiling: SQL, template rendering and upload staging time.
+
+ProfilingMiddleware gives each request a Profile in a context variable.
+Handlers run on the threadpool with a copy of that context, so the engine's
+cursor events, TimedTemplate and timed() blocks all add to the same Profile.
+Each response then gets:
+
+  * for admin sessions only, a Server-Timing header (db, render, upload,
+    app) that browser dev tools show next to the request. Query counts and
+    timings are not for anonymous visitors. A streamed page renders after its
+    headers are sent, so its header only counts the work done before the
+    first byte.
+  * a JSON log line on the "agency.requests" logger: every request with
+    PROFILING_LOG=all, only those over PROFILING_SLOW_MS with "slow".
+  * an entry in a sliding window of the last PROFILING_WINDOW seconds, which
+    /admin/profiling summarises: the slowest endpoints, and N+1 offenders,
+    i.e. requests running one statement PROFILING_REPEAT_THRESHOLD times or
+    more (a lazy load per row).
+
+The window is per process. PROFILING=off leaves the middleware out and the
+events unregistered.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import jinja2
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.requests import cookie_parser
+
+PROFILING = os.environ.get("PROFILING", "on")
+PROFILING_LOG = os.environ.get("PROFILING_LOG", "slow")  # all, slow or off
+SLOW_MS = float(os.environ.get("PROFILING_SLOW_MS", "500"))
+WINDOW_SECONDS = int(os.environ.get("PROFILING_WINDOW", "900"))
+REPEAT_THRESHOLD = int(os.environ.get("PROFILING_REPEAT_THRESHOLD", "10"))
+WINDOW_MAX_REQUESTS = 10000
+SLOWEST_STATEMENTS = 3
+
+logger = logging.getLogger("agency.requests")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_current = ContextVar("request_profile", default=None)
+
+# IN lists expand to one placeholder per value; fold them so the statement
+# is the same whatever the list length
+_IN_LIST = re.compile(r"\((?:\?|%\(\w+\)s|:\w+)(?:, (?:\?|%\(\w+\)s|:\w+))+\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(statement):
+    return _IN_LIST.sub("(…)", _SPACE.sub(" ", statement).strip())
+
+
+class Profile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slowest = []  # (seconds, statement), longest first
+        self.statements = Counter()
+        self.timings = Counter()  # "render", "upload": seconds
+
+    def record_query(self, statement, seconds):
+        self.queries += 1
+        self.sql_seconds += seconds
+        statement = normalize(statement)
+        self.statements[statement] += 1
+        if len(self.slowest) < SLOWEST_STATEMENTS or seconds > self.slowest[-1][0]:
+            self.slowest = sorted(self.slowest + [(seconds, statement)], reverse=True)[:SLOWEST_STATEMENTS]
+
+    def repeated(self):
+        """Statements run REPEAT_THRESHOLD times or more: (statement, times)."""
+        return [(statement, count) for statement, count in self.statements.most_common()
+                if count >= REPEAT_THRESHOLD]
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def timed(kind):
+    """Add the block's duration to the current request's `kind` timing, if any."""
+    profile = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.timings[kind] += time.perf_counter() - started
+
+
+class TimedTemplate(jinja2.Template):
+    """Template whose render()/generate() time counts as the request's "render" time."""
+
+    def render(self, *args, **kwargs):
+        with timed("render"):
+            return super().render(*args, **kwargs)
+
+    def generate(self, *args, **kwargs):
+        chunks = super().generate(*args, **kwargs)
+        while True:
+            with timed("render"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+
+# --- SQL ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is not None and conn.info.get("profile_started"):
+        profile.record_query(statement, time.perf_counter() - conn.info["profile_started"].pop())
+
+
+def instrument(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- sliding window ---
+
+class Window:
+    """Finished requests of the last `seconds`, for the admin page."""
+
+    def __init__(self, seconds=WINDOW_SECONDS, max_requests=WINDOW_MAX_REQUESTS):
+        self.seconds = seconds
+        self._requests = deque(maxlen=max_requests)  # (finished at, endpoint, ms, queries, sql ms, repeated)
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, ms, queries, sql_ms, repeated):
+        with self._lock:
+            self._requests.append((time.monotonic(), endpoint, ms, queries, sql_ms, repeated))
+
+    def entries(self):
+        cutoff = time.monotonic() - self.seconds
+        with self._lock:
+            while self._requests and self._requests[0][0] < cutoff:
+                self._requests.popleft()
+            return list(self._requests)
+
+    def clear(self):
+        with self._lock:
+            self._requests.clear()
+
+    def endpoints(self, limit=20):
+        """Per endpoint: requests, p50/p95/max ms and mean queries and SQL ms, slowest p95 first."""
+        grouped = {}
+        for _, endpoint, ms, queries, sql_ms, _ in self.entries():
+            grouped.setdefault(endpoint, []).append((ms, queries, sql_ms))
+        rows = []
+        for endpoint, samples in grouped.items():
+            durations = sorted(ms for ms, _, _ in samples)
+            rows.append({
+                "endpoint": endpoint,
+                "requests": len(samples),
+                "p50_ms": durations[len(durations) // 2],
+                "p95_ms": durations[min(int(len(durations) * 0.95), len(durations) - 1)],
+                "max_ms": durations[-1],
+                "queries": sum(queries for _, queries, _ in samples) / len(samples),
+                "sql_ms": sum(sql_ms for _, _, sql_ms in samples) / len(samples),
+            })
+        return sorted(rows, key=lambda row: row["p95_ms"], reverse=True)[:limit]
+
+    def repeated_statements(self, limit=20):
+        """N+1 offenders: (endpoint, statement) with affected requests and the most runs in one."""
+        offenders = {}
+        for _, endpoint, _, _, _, repeated in self.entries():
+            for statement, count in repeated:
+                requests, most = offenders.get((endpoint, statement), (0, 0))
+                offenders[(endpoint, statement)] = (requests + 1, max(most, count))
+        rows = [{"endpoint": endpoint, "statement": statement, "requests": requests, "max_per_request": most}
+                for (endpoint, statement), (requests, most) in offenders.items()]
+        return sorted(rows, key=lambda row: (row["max_per_request"], row["requests"]), reverse=True)[:limit]
+
+
+window = Window()
+
+_route_paths = {}
+
+
+def route_template(scope):
+    """The matched route's path template ("/model/{model_id}") rather than the URL."""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "(unmatched)"
+    if endpoint not in _route_paths:
+        router = scope.get("router")
+        for route in getattr(router, "routes", []):
+            if getattr(route, "endpoint", getattr(route, "app", None)) is endpoint:
+                _route_paths[endpoint] = route.path
+                break
+        else:
+            _route_paths[endpoint] = getattr(endpoint, "__name__", str(endpoint))
+    return _route_paths[endpoint]
+
+
+def endpoint_name(scope):
+    return f"{scope['method']} {route_template(scope)}"
+
+
+def server_timing(profile, total):
+    parts = [f'db;dur={profile.sql_seconds * 1000:.1f};desc="{profile.queries} queries"']
+    for kind in ("render", "upload"):
+        if profile.timings[kind]:
+            parts.append(f"{kind};dur={profile.timings[kind] * 1000:.1f}")
+    parts.append(f"app;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def admin_session(scope):
+    """The admin pages' check (the admin_logged_in cookie), on an ASGI scope."""
+    for name, value in scope["headers"]:
+        if name == b"cookie":
+            return bool(cookie_parser(value.decode("latin-1")).get("admin_logged_in"))
+    return False
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = Profile()
+        token = _current.set(profile)
+        status = 500
+        show_timing = admin_session(scope)
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if show_timing:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", server_timing(profile, time.perf_counter() - profile.started)
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            self.finish(scope, profile, status)
+
+    def finish(self, scope, profile, status):
+        ms = (time.perf_counter() - profile.started) * 1000
+        endpoint = endpoint_name(scope)
+        repeated = profile.repeated()
+        window.add(endpoint, ms, profile.queries, profile.sql_seconds * 1000, repeated)
+        if PROFILING_LOG == "all" or (PROFILING_LOG == "slow" and ms >= SLOW_MS):
+            logger.info(json.dumps({
+                "event": "request",
+                "method": scope["method"],
+                "path": scope["path"],
+                "endpoint": endpoint,
+                "status": status,
+                "ms": round(ms, 1),
+                "queries": profile.queries,
+                "sql_ms": round(profile.sql_seconds * 1000, 1),
+                "render_ms": round(profile.timings["render"] * 1000, 1),
+                "upload_ms": round(profile.timings["upload"] * 1000, 1),
+                "slowest_sql": [{"ms": round(seconds * 1000, 1), "statement": statement[:300]}
+                                for seconds, statement in profile.slowest],
+                "repeated_sql": [{"times": count, "statement": statement[:300]} for statement, count in repeated],
+            }))
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Full-text search over model profiles: name, bio, languages, nationality,
+job, clothing style and favourite cuisine.
+
+The index lives beside the models table:
+
+  * SQLite: model_search, an FTS5 table (porter stemming) keyed by model id.
+    Ranked with bm25(), excerpts from snippet().
+  * Postgres: model_search(model_id, document tsvector, body) with a GIN
+    index on document. Ranked with ts_rank_cd(), excerpts from ts_headline().
+
+Both weight a hit in the name above languages/nationality, those above
+job/style/cuisine, and those above the bio. Every ORM flush that adds,
+edits or deletes a Model rewrites its index row in the same transaction, so
+the admin add/edit forms, applications and deletes keep it current.
+migrations.py creates the table and fills it from existing models.
+
+A query matches profiles containing all of its words. When none do, it
+falls back to any of them, so "speaks French" still finds French speakers
+whose bio never says "speaks".
+
+Writes that bypass the ORM (raw SQL, bulk imports) don't reach the index.
+Rebuild after them:
+
+    python search.py --rebuild
+"""
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from markupsafe import Markup, escape
+from sqlalchemy import event, func, inspect, text
+from sqlalchemy.orm import joinedload
+
+from models import SessionLocal, engine, Model
+from pagination import PAGE_SIZE
+
+SEARCH = os.environ.get("SEARCH", "on")
+# Postgres text search configuration (stemming and stop words)
+SEARCH_LANGUAGE = os.environ.get("SEARCH_LANGUAGE", "english")
+MAX_TERMS = 8
+# Dropped from queries, as Postgres' english configuration does; "who", "and"
+# would otherwise fail the all-words match on SQLite
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have her his i in is it me my of on or she so "
+    "that the their to was who with".split()
+)
+
+FIELDS = ("name", "bio", "languages", "nationality", "job", "clothing_style", "favorite_cuisine")
+# bm25() column weights, in FIELDS order, stored as the FTS5 rank function;
+# Postgres gets the same ranking from setweight()
+SQLITE_WEIGHTS = (10.0, 1.0, 4.0, 4.0, 2.0, 2.0, 2.0)
+
+# Marks around matched words in excerpts; swapped for <mark> after escaping
+_START, _STOP = "\x02", "\x03"
+
+Hit = namedtuple("Hit", "model snippet rank")
+Results = namedtuple("Results", "hits match page has_more")
+
+
+def _dialect():
+    # Other backends have no index; SEARCH=off only hides the endpoints, the
+    # index is still kept current so switching back on needs no rebuild
+    return engine.dialect.name if engine.dialect.name in ("sqlite", "postgresql") else None
+
+
+def terms(query):
+    """Words of a user query, lowercased; punctuation and operators are dropped."""
+    return [word for word in re.findall(r"\w+", query.lower()) if word not in STOP_WORDS][:MAX_TERMS]
+
+
+def _language_text(value):
+    try:
+        languages = json.loads(value) if value else []
+    except ValueError:
+        return value or ""
+    if not isinstance(languages, list):
+        return ""
+    return ", ".join(language for language in languages if isinstance(language, str))
+
+
+def document(model):
+    """The indexed text of a Model (or a row with the same attributes), per field."""
+    values = {field: getattr(model, field) or "" for field in FIELDS}
+    values["languages"] = _language_text(model.languages)
+    return values
+
+
+def _highlight(excerpt):
+    return Markup(str(escape(excerpt or "")).replace(_START, "<mark>").replace(_STOP, "</mark>"))
+
+
+# --- SQLite FTS5 ---
+
+_SQLITE_CREATE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS model_search USING fts5({', '.join(FIELDS)}, "
+    "tokenize='porter unicode61 remove_diacritics 2')"
+)
+# Kept in the table's config, so ORDER BY rank uses the weights above
+_SQLITE_RANK = (
+    "INSERT INTO model_search (model_search, rank) "
+    f"VALUES ('rank', 'bm25({', '.join(map(str, SQLITE_WEIGHTS))})')"
+)
+_SQLITE_DELETE = "DELETE FROM model_search WHERE rowid = :id"
+_SQLITE_INSERT = (
+    f"INSERT INTO model_search (rowid, {', '.join(FIELDS)}) "
+    f"VALUES (:id, {', '.join(':' + field for field in FIELDS)})"
+)
+_SQLITE_SEARCH = """
+    SELECT model_search.rowid AS id, model_search.rank,
+           snippet(model_search, -1, char(2), char(3), '…', 16) AS snippet
+    FROM model_search JOIN models ON models.id = model_search.rowid
+    WHERE model_search MATCH :query AND models.agency_id = :agency_id AND models.status = 'approved'
+    ORDER BY model_search.rank, models.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def _sqlite_query(words, match):
+    quoted = [f'"{word}"' for word in words]
+    return " ".join(quoted) if match == "all" else " OR ".join(quoted)
+
+
+# --- Postgres tsvector ---
+
+_PG_CREATE = (
+    "CREATE TABLE IF NOT EXISTS model_search ("
+    "model_id INTEGER PRIMARY KEY REFERENCES models(id) ON DELETE CASCADE, "
+    "document TSVECTOR NOT NULL, body TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_model_search_document ON model_search USING GIN (document)",
+)
+_PG_DELETE = "DELETE FROM model_search WHERE model_id = :id"
+_PG_UPSERT = """
+    INSERT INTO model_search (model_id, document, body)
+    VALUES (:id,
+            setweight(to_tsvector(CAST(:config AS regconfig), :name), 'A')
+            || setweight(to_tsvector(CAST(:config AS regconfig), :origin), 'B')
+            || setweight(to_tsvector(CAST(:config AS regconfig), :style), 'C')
+            || setweight(to_tsvector(CAST(:config AS regconfig), :bio), 'D'),
+            :body)
+    ON CONFLICT (model_id) DO UPDATE SET document = EXCLUDED.document, body = EXCLUDED.body
+"""
+# Rank and page first, then build headlines for that page only
+_PG_SEARCH = """
+    SELECT hit.model_id AS id, hit.rank,
+           ts_headline(CAST(:config AS regconfig), hit.body, hit.query, :headline) AS snippet
+    FROM (
+        SELECT model_search.model_id, model_search.body, q.query,
+               ts_rank_cd(model_search.document, q.query) AS rank
+        FROM model_search JOIN models ON models.id = model_search.model_id,
+             to_tsquery(CAST(:config AS regconfig), :query) AS q(query)
+        WHERE model_search.document @@ q.query
+          AND models.agency_id = :agency_id AND models.status = 'approved'
+        ORDER BY rank DESC, model_search.model_id DESC
+        LIMIT :limit OFFSET :offset
+    ) AS hit
+    ORDER BY hit.rank DESC, hit.model_id DESC
+"""
+_PG_HEADLINE = f'StartSel="{_START}", StopSel="{_STOP}", MaxWords=30, MinWords=12, MaxFragments=2, FragmentDelimiter=" … "'
+
+
+def _pg_params(model_id, values):
+    return {
+        "id": model_id, "config": SEARCH_LANGUAGE, "name": values["name"], "bio": values["bio"],
+        "origin": f"{values['languages']} {values['nationality']}",
+        "style": f"{values['job']} {values['clothing_style']} {values['favorite_cuisine']}",
+        "body": _pg_body(values),
+    }
+
+
+def _pg_body(values):
+    # Excerpt source: everything but the name, which the result card shows anyway
+    return " · ".join(values[field] for field in FIELDS[1:] if values[field])
+
+
+def _pg_query(words, match):
+    return (" & " if match == "all" else " | ").join(words)
+
+
+# --- maintenance ---
+
+def _write(connection, dialect, rows):
+    """Replace the index rows of `rows`: (model id, document() or None to drop it)."""
+    if dialect == "sqlite":
+        connection.execute(text(_SQLITE_DELETE), [{"id": model_id} for model_id, _ in rows])
+        inserts = [{"id": model_id, **values} for model_id, values in rows if values is not None]
+        if inserts:
+            connection.execute(text(_SQLITE_INSERT), inserts)
+    else:
+        deletes = [{"id": model_id} for model_id, values in rows if values is None]
+        upserts = [_pg_params(model_id, values) for model_id, values in rows if values is not None]
+        if deletes:
+            connection.execute(text(_PG_DELETE), deletes)
+        if upserts:
+            connection.execute(text(_PG_UPSERT), upserts)
+
+
+def rebuild(db, batch=2000):
+    """Re-index every model; the caller commits. Returns how many were indexed."""
+    dialect = _dialect()
+    if dialect is None:
+        return 0
+    connection = db.connection()
+    connection.execute(text("DELETE FROM model_search"))
+    columns = [Model.id] + [getattr(Model, field) for field in FIELDS]
+    indexed, last_id = 0, 0
+    while True:
+        rows = db.query(*columns).filter(Model.id > last_id).order_by(Model.id).limit(batch).all()
+        if not rows:
+            return indexed
+        _write(connection, dialect, [(row.id, document(row)) for row in rows])
+        indexed += len(rows)
+        last_id = rows[-1].id
+
+
+def ensure_index(db):
+    """Create the index table and fill it when it is behind the models table; the caller commits."""
+    dialect = _dialect()
+    if dialect is None:
+        print(f"ℹ️  Full-text search needs SQLite or Postgres, not {engine.dialect.name}")
+        return
+    connection = db.connection()
+    for statement in (_SQLITE_CREATE, _SQLITE_RANK) if dialect == "sqlite" else _PG_CREATE:
+        connection.execute(text(statement))
+    indexed = connection.execute(text("SELECT count(*) FROM model_search")).scalar()
+    # Only the id column: this runs as a migration step, before later steps add theirs
+    if indexed != db.query(func.count(Model.id)).scalar():
+        indexed = rebuild(db)
+        print(f"✅ Indexed {indexed} models for full-text search")
+
+
+# --- queries ---
+
+def search(db, agency_id, query, page=1, limit=PAGE_SIZE):
+    """One page of the agency's approved models matching `query`, best first."""
+    words = terms(query)
+    dialect = _dialect()
+    page = max(page, 1)
+    if not words or dialect is None:
+        return Results([], "all", page, False)
+
+    for match in ("all", "any") if len(words) > 1 else ("all",):
+        if dialect == "sqlite":
+            statement, params = _SQLITE_SEARCH, {"query": _sqlite_query(words, match)}
+        else:
+            statement, params = _PG_SEARCH, {"query": _pg_query(words, match), "config": SEARCH_LANGUAGE,
+                                             "headline": _PG_HEADLINE}
+        rows = db.execute(text(statement), {
+            **params, "agency_id": agency_id, "limit": limit + 1, "offset": (page - 1) * limit
+        }).all()
+        # Fall back to any word only when all of them match nothing at all
+        if rows or page > 1:
+            break
+
+    shown = rows[:limit]
+    loaded = {model.id: model for model in db.query(Model).options(joinedload(Model.city)).filter(
+        Model.id.in_([row.id for row in shown])
+    )} if shown else {}
+    hits = [Hit(loaded[row.id], _highlight(row.snippet), row.rank) for row in shown if row.id in loaded]
+    return Results(hits, match, page, len(rows) > limit)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _index_model_changes(session, flush_context):
+    if _dialect() is None:
+        return
+    rows = {}
+    for obj in session.new:
+        if isinstance(obj, Model):
+            rows[obj.id] = document(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Model):
+            state = inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in FIELDS):
+                rows[obj.id] = document(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Model):
+            rows[obj.id] = None
+    if rows:
+        _write(session.connection(), _dialect(), sorted(rows.items()))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Full-text search index")
+    parser.add_argument("--rebuild", action="store_true", help="re-index every model")
+    parser.add_argument("query", nargs="?", help="search the first agency's approved models")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.rebuild:
+            indexed = rebuild(db)
+            db.commit()
+            print(f"✅ Rebuilt model_search: {indexed} models")
+        if args.query:
+            from models import Agency
+            agency = db.query(Agency).order_by(Agency.id).first()
+            results = search(db, agency.id, args.query)
+            print(f"{len(results.hits)} results (matching {results.match} words)")
+            for hit in results.hits:
+                print(f"  {hit.rank:8.3f}  #{hit.model.id} {hit.model.name}: {hit.snippet}")
+    finally:
+        db.close()
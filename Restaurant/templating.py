@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Production settings for the Jinja2 environment.
+
+Jinja compiles a template to Python the first time it is rendered. With
+auto_reload (Jinja's default) it also stats the file before every render to
+see if it changed. Here:
+
+  * TEMPLATE_RELOAD=off (the default) skips that check. Restart to pick up
+    template edits, or set TEMPLATE_RELOAD=on while working on templates.
+  * Compiled templates are kept in a FileSystemBytecodeCache in
+    TEMPLATE_CACHE_DIR (template_cache/ next to this file), keyed by a
+    checksum of the source. Another worker, or the next start, loads the
+    bytecode instead of compiling again; an edited template is recompiled.
+  * Startup loads every template (TEMPLATE_PRECOMPILE=on), so the first
+    visitors don't wait for compilation, and a syntax error shows up in the
+    startup log rather than on a page.
+
+The cache can be filled ahead of time, e.g. during the build:
+
+    python templating.py
+"""
+import os
+import sys
+
+from jinja2 import FileSystemBytecodeCache
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+TEMPLATE_RELOAD = os.environ.get("TEMPLATE_RELOAD", "off")
+TEMPLATE_PRECOMPILE = os.environ.get("TEMPLATE_PRECOMPILE", "on")
+# Empty for template_cache/ next to this file, "off" to compile in memory only
+cache_dir = os.environ.get("TEMPLATE_CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "template_cache"
+)
+
+
+def configure(env):
+    """Apply the reload setting and the bytecode cache to a Jinja environment."""
+    env.auto_reload = TEMPLATE_RELOAD == "on"
+    if cache_dir == "off":
+        return
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as e:
+        print(f"⚠️  Template bytecode cache disabled: {e}")
+        return
+    # A read-only cache dir would fail every first render, not just the cache
+    if not os.access(cache_dir, os.W_OK):
+        print(f"⚠️  Template bytecode cache disabled: {cache_dir} is not writable")
+        return
+    env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+def precompile(env):
+    """Load every template into the environment's cache; returns how many."""
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+if __name__ == "__main__":
+    import time
+
+    # The app's own environment: the same filters, globals and template class
+    from main import templates
+
+    if templates.env.bytecode_cache is None:
+        print("ℹ️  TEMPLATE_CACHE_DIR=off, nothing to write")
+        sys.exit(0)
+    started = time.perf_counter()
+    count = precompile(templates.env)
+    print(f"✅ Compiled {count} templates into {cache_dir} in {(time.perf_counter() - started) * 1000:.0f}ms")
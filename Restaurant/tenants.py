@@ -0,0 +1,154 @@
+"""
+Agency (tenant) resolution.
+
+Each request belongs to one agency. It is chosen from the first label of the
+Host header, so redmarbs.example.com maps to Agency.subdomain "redmarbs".
+Hosts that name no agency get DEFAULT_AGENCY instead. These include
+localhost, the bare domain and *.herokuapp.com. When DEFAULT_AGENCY is unset
+the oldest active agency is used, so a single-agency deployment works
+unchanged.
+
+Resolved agencies are cached per process as plain snapshots. Committing a
+change to an Agency clears this process's cache. Other processes pick up
+edits after TENANT_CACHE_TTL seconds.
+
+Handlers take the agency as a dependency and scope every query with it:
+
+    def handler(agency: tenants.Tenant = Depends(tenants.current_agency), db: Session = Depends(get_db)):
+        tenants.scoped(db, agency, Model).filter(...)
+"""
+import os
+import threading
+import time
+from itertools import chain
+from types import SimpleNamespace
+
+from fastapi import HTTPException, Request
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+from models import SessionLocal, Agency
+
+DEFAULT_AGENCY = os.environ.get("DEFAULT_AGENCY", "")
+TTL_SECONDS = int(os.environ.get("TENANT_CACHE_TTL", "60"))
+# Unknown hosts are cached too (as None); bound what random Host headers can add
+MAX_CACHED_HOSTS = 1000
+
+
+class Tenant(SimpleNamespace):
+    """Read-only copy of an Agency row, safe to share between requests and threads."""
+
+
+_cache = {}  # host label -> (expires_at, Tenant or None)
+_generation = 0
+_lock = threading.Lock()
+# Counted on the event loop (hits) and in threadpool workers (misses)
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def host_label(host):
+    # "redmarbs.example.com:8000" -> "redmarbs"; bare hostnames are their own label
+    host = host.strip().lower()
+    if host.startswith("["):  # IPv6 literal, never a subdomain
+        return ""
+    return host.split(":")[0].split(".")[0]
+
+
+def _snapshot(agency):
+    return Tenant(**{column.key: getattr(agency, column.key) for column in Agency.__table__.columns})
+
+
+def _load(label):
+    db = SessionLocal()
+    try:
+        active = db.query(Agency).filter(Agency.active == True)
+        agency = active.filter(Agency.subdomain == label).first() if label else None
+        if agency is None and DEFAULT_AGENCY:
+            agency = active.filter(Agency.subdomain == DEFAULT_AGENCY).first()
+        elif agency is None:
+            agency = active.order_by(Agency.id).first()
+        return _snapshot(agency) if agency else None
+    finally:
+        db.close()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _cached(label):
+    entry = _cache.get(label)
+    if entry is not None and entry[0] > time.monotonic():
+        _count("hits")
+        return True, entry[1]
+    return False, None
+
+
+def _resolve_uncached(label):
+    _count("misses")
+    generation = _generation
+    tenant = _load(label)
+    with _lock:
+        # An agency was edited while we were loading; don't cache the old row
+        if generation == _generation:
+            if len(_cache) >= MAX_CACHED_HOSTS:
+                _cache.clear()
+            _cache[label] = (time.monotonic() + TTL_SECONDS, tenant)
+    return tenant
+
+
+def resolve(host):
+    """The Tenant serving `host`, or None when no agency matches and there is no default."""
+    label = host_label(host)
+    found, tenant = _cached(label)
+    return tenant if found else _resolve_uncached(label)
+
+
+async def current_agency(request: Request):
+    """FastAPI dependency: the request's agency, also kept on request.state.agency."""
+    # Async so a cache hit costs no threadpool hop; only a miss queries
+    label = host_label(request.headers.get("host", ""))
+    found, tenant = _cached(label)
+    if not found:
+        tenant = await run_in_threadpool(_resolve_uncached, label)
+    if tenant is None:
+        raise HTTPException(status_code=404, detail="Agency not found")
+    request.state.agency = tenant
+    return tenant
+
+
+def scoped(db, agency, entity, *columns):
+    """Query `entity` rows (or only `columns` of them) that belong to `agency`."""
+    return db.query(*(columns or (entity,))).filter(entity.agency_id == agency.id)
+
+
+def clear():
+    global _generation
+    with _lock:
+        _generation += 1
+        _cache.clear()
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    return {**snapshot, "cached_hosts": len(_cache)}
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _note_agency_changes(session, flush_context):
+    if any(isinstance(obj, Agency) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info["tenants_changed"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _clear_committed(session):
+    if session.info.pop("tenants_changed", False):
+        clear()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("tenants_changed", None)
@@ -0,0 +1,168 @@
+"""
+Shared fixtures: the app, in-process, against a throwaway SQLite database.
+
+The environment is set before any app module is imported, since models.py
+creates its engine from DATABASE_URL at import time.
+
+    cd Restaurant && python -m pytest
+"""
+import asyncio
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix="agency-test-")
+# Tests marked `postgres` run against a Postgres DATABASE_URL when one is
+# given (in a throwaway schema); everything else uses SQLite under TEST_DIR
+POSTGRES_URL = os.environ.get("DATABASE_URL", "").replace("postgres://", "postgresql://", 1)
+if not POSTGRES_URL.startswith("postgresql"):
+    POSTGRES_URL = ""
+os.environ["DATABASE_URL"] = f"sqlite:///{TEST_DIR}/test.db"
+os.environ["MEDIA_WORKER"] = "off"  # tests run jobs.process_due_jobs themselves
+os.environ["MEDIA_STORAGE"] = "local"
+os.environ["MEDIA_STAGING_DIR"] = os.path.join(TEST_DIR, "staging")
+os.environ["TEMPLATE_CACHE_DIR"] = "off"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jinja2
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+import page_cache
+from models import engine, SessionLocal, Agency, Booking, City, Model
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "postgres: needs a Postgres server in DATABASE_URL")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    engine.dispose()
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def app():
+    # Migrates the empty database and creates the sample agency and cities
+    asyncio.run(main.startup_event())
+    return main.app
+
+
+@pytest.fixture(scope="session")
+def postgres_engine():
+    """An engine on a fresh schema of the DATABASE_URL server, with the app's tables."""
+    if not POSTGRES_URL:
+        pytest.skip("set DATABASE_URL to a Postgres server to run this")
+    from sqlalchemy import create_engine, text
+    from models import Base
+    schema = f"agency_test_{os.getpid()}"
+    server = create_engine(POSTGRES_URL)
+    with server.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    postgres = create_engine(POSTGRES_URL, connect_args={"options": f"-csearch_path={schema}"})
+    try:
+        Base.metadata.create_all(postgres)
+        yield postgres
+    finally:
+        postgres.dispose()
+        with server.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        server.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return TestClient(app)
+
+
+@pytest.fixture
+def admin(app):
+    return TestClient(app, cookies={"admin_logged_in": "true"})
+
+
+@pytest.fixture
+def no_page_cache():
+    # Every request renders and queries
+    saved = page_cache.backend
+    page_cache.set_backend(None)
+    yield
+    page_cache.set_backend(saved)
+
+
+@pytest.fixture(scope="session")
+def seeded(app):
+    """60 approved models spread over the sample cities, with 200 bookings."""
+    db = SessionLocal()
+    try:
+        agency = db.query(Agency).first()
+        cities = db.query(City).filter(City.agency_id == agency.id).all()
+        models = [add_model(db, agency, cities[i % len(cities)], f"Seeded {i}", featured=i < 6) for i in range(60)]
+        db.flush()
+        for i in range(200):
+            db.add(Booking(agency_id=agency.id, model_id=models[i % len(models)].id, client_name=f"Client {i}",
+                           client_email=f"client{i}@example.com", event_type="Dinner",
+                           event_date=datetime(2026, 1, 1) + timedelta(days=i % 365),
+                           status=["pending", "confirmed", "cancelled"][i % 3]))
+        db.commit()
+        return [model.id for model in models]
+    finally:
+        db.close()
+
+
+def add_model(db, agency, city, name, status="approved", featured=False):
+    model = Model(
+        agency_id=agency.id, city_id=city.id, name=name, age=25, height=170, hair_color="Blonde",
+        eye_color="Blue", nationality="Spanish", availability="Worldwide", gender="female", bio="Test profile",
+        photos=json.dumps([f"https://example.com/{name}/{n}.jpg" for n in range(3)]),
+        languages=json.dumps(["English", "Spanish"]), rates=json.dumps({"overnight": "2200.-"}),
+        status=status, featured=featured,
+    )
+    db.add(model)
+    return model
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement the engine executes inside the block."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@contextmanager
+def count_renders():
+    """Collect the name of every Jinja template rendered inside the block."""
+    rendered = []
+    real_render = jinja2.Template.render
+
+    def render(template, *args, **kwargs):
+        rendered.append(template.name)
+        return real_render(template, *args, **kwargs)
+
+    jinja2.Template.render = render
+    try:
+        yield rendered
+    finally:
+        jinja2.Template.render = real_render
+
+
+def sample_photo(width):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.linear_gradient("L").resize((width, width * 3 // 2)).convert("RGB").save(buffer, "JPEG")
+    return buffer.getvalue()
@@ -0,0 +1,49 @@
+"""
+Conditional GETs of public pages: a 304 comes from the page cache before any
+query or template work, and an edit changes the validators.
+"""
+import pytest
+
+from conftest import add_model, count_queries, count_renders
+from models import SessionLocal, Agency, City, Model
+
+PAGES = ["/", "/models", "/cities", "/city/Marbella", "/about", "/contact", "/models?city=Marbella", "/model/{model_id}"]
+
+
+@pytest.mark.parametrize("path", PAGES)
+@pytest.mark.parametrize("validator", ["If-None-Match", "If-Modified-Since"])
+def test_not_modified_skips_database_and_templates(client, seeded, path, validator):
+    path = path.format(model_id=seeded[0])
+    first = client.get(path)
+    header = {"If-None-Match": "ETag", "If-Modified-Since": "Last-Modified"}[validator]
+    with count_queries() as statements, count_renders() as rendered:
+        response = client.get(path, headers={validator: first.headers[header]})
+    assert response.status_code == 304
+    assert not response.content
+    assert statements == []
+    assert rendered == []
+
+
+def test_edit_changes_etag(client, app):
+    db = SessionLocal()
+    agency = db.query(Agency).first()
+    model = add_model(db, agency, db.query(City).first(), "Conditional Probe")
+    db.commit()
+    model_id = model.id
+    db.close()
+
+    etag = client.get(f"/model/{model_id}").headers["ETag"]
+    db = SessionLocal()
+    db.get(Model, model_id).name = "Edited Probe"
+    db.commit()
+    db.close()
+    response = client.get(f"/model/{model_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "Edited Probe" in response.text
+
+
+def test_admin_pages_are_not_cached(admin):
+    response = admin.get("/admin/models")
+    assert response.headers["Cache-Control"] == "private, no-store"
+    assert "ETag" not in response.headers
@@ -0,0 +1,136 @@
+"""
+Bulk data migrations, run against the test database.
+"""
+import json
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import add_indexes
+import data_migrations
+from conftest import add_model
+from models import engine, SessionLocal, Agency, City, DataMigrationCheckpoint, Model
+
+# models.rates as found in old databases, and the odd values the SQL has to agree with Python on
+RATES = [
+    None,
+    "",
+    "On request",
+    "null",
+    "[1, 2]",
+    '{"short_price": NaN}',
+    json.dumps({"short_price": "900.-", "overnight_price": "2500.-"}),
+    json.dumps({"short_price": None, "gentleman_price": None}),
+    json.dumps({"short_price": {"weekday": "900.-", "weekend": None}}),
+    json.dumps({"extras": {"dinner": None}, "vip": True, "discount": False, "cities": ["Marbella", None],
+                "deposit": 0.5}),
+    json.dumps({"detailed": None}),
+    json.dumps(data_migrations.LEGACY_DETAILED_RATES),
+]
+PENDING = 3 * sum(data_migrations.detailed_rates({"rates": rates}) is not None for rates in RATES)
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+@pytest.fixture
+def rates_db(tmp_path, monkeypatch):
+    """A database of its own with RATES three times over in models, migrated by data_migrations."""
+    rates_engine = create_engine(f"sqlite:///{tmp_path}/rates.db")
+    with rates_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE models (id INTEGER PRIMARY KEY, rates TEXT)"))
+        DataMigrationCheckpoint.__table__.create(bind=conn)
+        conn.execute(text("INSERT INTO models (rates) VALUES (:rates)"), [{"rates": rates} for rates in RATES * 3])
+    monkeypatch.setattr(data_migrations, "engine", rates_engine)
+    yield rates_engine
+    rates_engine.dispose()
+
+
+def rates_by_id(rates_engine):
+    with rates_engine.connect() as conn:
+        return dict(conn.execute(text("SELECT id, rates FROM models ORDER BY id")).all())
+
+
+def migrated(rates):
+    changes = data_migrations.detailed_rates({"rates": rates})
+    return json.loads(changes["rates"]) if changes else json.loads(rates)
+
+
+@pytest.mark.parametrize("set_based", [True, False], ids=["sql", "python"])
+def test_detailed_rates_same_in_sql_and_python(rates_db, set_based):
+    step = data_migrations.MIGRATIONS["detailed_rates"].passes[0]
+    with rates_db.connect() as conn:
+        pending = data_migrations.count_pending(conn, step)
+    changed, _ = data_migrations.run_pass("detailed_rates:0", step, chunk_size=5, set_based=set_based,
+                                          progress=quiet)
+    assert changed == pending == PENDING
+    # The model's keys win, nulls and nested values included
+    assert {model_id: json.loads(rates) for model_id, rates in rates_by_id(rates_db).items()} == {
+        model_id: migrated(rates) for model_id, rates in enumerate(RATES * 3, start=1)
+    }
+
+
+def test_interrupted_run_resumes(rates_db):
+    original = rates_by_id(rates_db)
+    report = data_migrations.run("detailed_rates", dry=True, chunk_size=5)[0]
+    assert rates_by_id(rates_db) == original and report["pending"] == PENDING
+
+    chunks = 0
+
+    def stop_after_two(*args, **kwargs):
+        nonlocal chunks
+        chunks += 1
+        if chunks == 2:
+            raise data_migrations.Interrupted()
+
+    with pytest.raises(data_migrations.Interrupted):
+        data_migrations.run("detailed_rates", chunk_size=5, progress=stop_after_two)
+    with rates_db.connect() as conn:
+        checkpoint = conn.execute(text("SELECT last_id, finished_at FROM data_migration_checkpoints")).one()
+    assert (checkpoint.last_id, checkpoint.finished_at) == (10, None)
+    assert rates_by_id(rates_db)[11] == original[11]
+
+    [(changed, _)] = data_migrations.run("detailed_rates", chunk_size=5, progress=quiet)
+    assert changed == PENDING
+    assert {model_id: json.loads(rates) for model_id, rates in rates_by_id(rates_db).items()} == {
+        model_id: migrated(rates) for model_id, rates in original.items()
+    }
+    [(again, _)] = data_migrations.run("detailed_rates", chunk_size=5, restart=True, progress=quiet)
+    assert again == 0
+
+
+def test_merge_duplicate_cities_keeps_first_active_city(app):
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS uq_cities_agency_name"))
+    db = SessionLocal()
+    try:
+        agency = Agency(name="DUPLICATES", subdomain="duplicates", email="info@duplicates.example")
+        db.add(agency)
+        db.flush()
+        # Deactivated first copy, then two active ones; and a name with no active copy
+        cities = [City(agency_id=agency.id, name="Girona", active=active) for active in (False, True, True)]
+        cities += [City(agency_id=agency.id, name="Lugo", active=False) for _ in range(2)]
+        db.add_all(cities)
+        db.flush()
+        models = [add_model(db, agency, city, f"Duplicate {n}") for n, city in enumerate(cities)]
+        db.commit()
+        city_ids, model_ids = [city.id for city in cities], [model.id for model in models]
+    finally:
+        db.close()
+
+    data_migrations.run("merge_duplicate_cities", chunk_size=2, restart=True, progress=quiet)
+
+    db = SessionLocal()
+    try:
+        assert [db.get(Model, model_id).city_id for model_id in model_ids] == [city_ids[1]] * 3 + [city_ids[3]] * 2
+        girona_0, girona_1, girona_2, lugo_0, lugo_1 = city_ids
+        assert [(db.get(City, city_id).name, db.get(City, city_id).active) for city_id in city_ids] == [
+            (f"Girona ({girona_0})", False), ("Girona", True), (f"Girona ({girona_2})", False),
+            ("Lugo", False), (f"Lugo ({lugo_1})", False),
+        ]
+    finally:
+        db.close()
+    with engine.begin() as conn:
+        assert not add_indexes.has_duplicate_cities(conn)
+        add_indexes.migrate(conn)
@@ -0,0 +1,149 @@
+"""
+Connection pool: SQLite pragmas, saturation and timeouts, /admin/db-pool.
+
+The saturation tests build small pools over the test database with
+db_pool.make_engine, so they don't touch the app's own engine.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+from anyio import to_thread
+from fastapi import Depends
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import db_pool
+import main
+import models
+from models import engine, get_db
+
+
+def hold_connection(pool_engine, seconds):
+    try:
+        with pool_engine.connect() as conn:
+            conn.execute(text("SELECT 1")).scalar()
+            time.sleep(seconds)
+        return True
+    except db_pool.PoolTimeout:
+        return False
+
+
+@pytest.fixture
+def slow_route(app):
+    # A DB-backed handler that keeps its Session for a while
+    running = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    @app.get("/__test/slow-db")
+    def slow_db(db: Session = Depends(get_db)):
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(0.3)
+        with lock:
+            running["now"] -= 1
+        return {}
+
+    yield running
+    app.router.routes = [route for route in app.router.routes if getattr(route, "path", None) != "/__test/slow-db"]
+
+
+@pytest.fixture
+def small_pool(app):
+    engines = []
+
+    def make(**kwargs):
+        engines.append(db_pool.make_engine(engine.url, **kwargs))
+        return engines[-1]
+
+    yield make
+    for pool_engine in engines:
+        pool_engine.dispose()
+
+
+def test_sqlite_pragmas(app):
+    with engine.connect() as conn:
+        pragmas = {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                   for name in ("journal_mode", "synchronous", "busy_timeout")}
+    assert pragmas == {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000}
+
+
+def test_saturated_pool(small_pool):
+    # More threads than connections: the pool is the bottleneck
+    pool_engine = small_pool(pool_size=2, max_overflow=2)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        served = list(executor.map(lambda _: hold_connection(pool_engine, 0.02), range(64)))
+    report = db_pool.stats(pool_engine)
+    assert all(served)
+    assert report["checkouts"] == 64
+    assert report["peak_in_use"] == 4
+    assert report["overflow_opened"] >= 2
+    assert report["in_use"] == 0
+    assert report["checkout_wait_ms"]["max"] >= 20
+
+
+def test_configured_limits_reported(small_pool):
+    pool_engine = small_pool(pool_size=2, max_overflow=3)
+    assert (db_pool.stats(pool_engine)["max_overflow"], db_pool.connection_limit(pool_engine)) == (3, 5)
+    pool_engine.dispose()  # recreates the pool with the same settings
+    assert (db_pool.stats(pool_engine)["max_overflow"], db_pool.connection_limit(pool_engine)) == (3, 5)
+
+
+def test_checkout_timeouts_counted(small_pool):
+    # Connections held past pool_timeout: the other requests give up
+    pool_engine = small_pool(pool_size=1, max_overflow=0, pool_timeout=0.05)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        served = list(executor.map(lambda _: hold_connection(pool_engine, 0.3), range(4)))
+    assert served.count(False) == 3
+    assert db_pool.stats(pool_engine)["timeouts"] == 3
+
+
+@pytest.mark.parametrize("max_connections, workers, expected", [
+    (0, 4, (5, 10)),  # no plan limit known
+    (20, 1, (5, 10)),  # 17 left after the reserve
+    (20, 4, (4, 0)),  # 17 // 4 per worker
+    (10, 8, (1, 0)),  # never less than one connection
+])
+def test_pool_limits(monkeypatch, max_connections, workers, expected):
+    monkeypatch.setattr(db_pool, "MAX_CONNECTIONS", max_connections)
+    monkeypatch.setattr(db_pool, "WEB_CONCURRENCY", workers)
+    assert db_pool.pool_limits(5, 10) == expected
+
+
+def test_admin_report(admin, client, seeded):
+    for path in ("/models", "/cities", "/city/Marbella"):
+        assert admin.get(path).status_code == 200
+    response = admin.get("/admin/db-pool")
+    report = response.json()
+    assert response.status_code == 200
+    assert report["peak_in_use"] <= report["threads"]
+    assert report["timeouts"] == 0
+    assert client.get("/admin/db-pool").status_code == 401
+
+
+def test_db_handlers_have_their_own_slots(slow_route, monkeypatch):
+    monkeypatch.setattr(models, "DB_THREADS", 2)
+
+    async def scenario():
+        await main.startup_event()
+        finished = []
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async def get(path):
+                response = await client.get(path)
+                finished.append((path, response.status_code))
+
+            await asyncio.gather(*[get("/__test/slow-db") for _ in range(6)],
+                                 *[get("/static/logo.jpg") for _ in range(10)])
+        return to_thread.current_default_thread_limiter().total_tokens, finished
+
+    threads, finished = asyncio.run(scenario())
+    # Static files don't queue behind the database, and the pool is never oversubscribed
+    assert threads == 40
+    assert finished[:10] == [("/static/logo.jpg", 200)] * 10
+    assert finished[10:] == [("/__test/slow-db", 200)] * 6
+    assert slow_route["peak"] == 2
@@ -0,0 +1,192 @@
+"""
+The /models facet index: the same pages and counts as filtering in SQL,
+kept current by committed edits.
+"""
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+import facets
+import main
+import tenants
+from models import SessionLocal, Agency, City, Model
+
+HOST = "facets.example.com"
+FILTERS = [
+    {},
+    {"city": "Marbella"},
+    {"hair_color": "Blonde", "eye_color": "Green"},
+    {"city": "Malaga", "language": "French", "age_min": 25},
+    {"nationality": "Italian", "availability": "Local", "height_min": 175, "age_max": 30},
+    {"language": "Spanish", "age_max": 24},
+]
+
+
+@pytest.fixture(scope="module")
+def agency(app):
+    """An agency of its own, with varied profiles: blanks, ties, other statuses."""
+    pick = random.Random(16)
+    db = SessionLocal()
+    try:
+        agency = Agency(name="FACETS", subdomain="facets", email="info@facets.example")
+        db.add(agency)
+        db.flush()
+        cities = [City(agency_id=agency.id, name=name) for name in ("Marbella", "Malaga", "Estepona")]
+        db.add_all(cities)
+        db.flush()
+        for n in range(150):
+            db.add(Model(
+                agency_id=agency.id, city_id=pick.choice(cities).id, name=f"Facet {n}",
+                age=pick.randint(18, 40), height=pick.randint(155, 190),
+                hair_color=pick.choice(["Blonde", "Brunette", "Red", ""]),
+                eye_color=pick.choice(["Blue", "Green", "Brown"]),
+                nationality=pick.choice(["Spanish", "Italian", "French", None]),
+                availability=pick.choice(["Local", "Worldwide"]),
+                gender=pick.choice(["female", "female", "male", "", None]),
+                languages=json.dumps(pick.sample(["English", "Spanish", "French", "Italian"], pick.randint(0, 3))),
+                photos="[]", status=pick.choice(["approved", "approved", "approved", "pending"]),
+                featured=pick.random() < 0.2,
+                # Whole hours apart from a few rows, so the ordering has ties to break
+                created_at=datetime(2026, 1, 1) + timedelta(hours=pick.randint(0, 60)),
+            ))
+        db.commit()
+    finally:
+        db.close()
+    return tenants.resolve(HOST)
+
+
+@pytest.fixture
+def slow_loads(monkeypatch):
+    """Every FacetIndex.load takes a while; returns the list of loads started."""
+    loads = []
+    load = facets.FacetIndex.load
+
+    def slow_load(index, db):
+        loads.append(threading.current_thread().name)
+        time.sleep(0.2)
+        return load(index, db)
+
+    monkeypatch.setattr(facets.FacetIndex, "load", slow_load)
+    return loads
+
+
+@pytest.fixture(autouse=True)
+def fresh_indexes():
+    facets.clear()
+    yield
+    facets.clear()
+
+
+def sql_ids(db, agency, filters, gender):
+    ids, cursor = [], None
+    while True:
+        filled = dict.fromkeys(main.DIRECTORY_FILTERS, None) | filters
+        models, cursor = main.keyset_page(main.directory_query(db, agency, gender=gender, **filled),
+                                          main.DIRECTORY_ORDER, cursor)
+        ids += [model.id for model in models]
+        if not cursor:
+            return ids
+
+
+def index_ids(db, agency, filters, gender):
+    ids, cursor = [], None
+    while True:
+        models, cursor = facets.search(db, agency.id, dict(filters, gender=gender), main.DIRECTORY_ORDER, cursor)
+        ids += [model.id for model in models]
+        if not cursor:
+            return ids
+
+
+def assert_matches_sql(agency):
+    db = SessionLocal()
+    try:
+        for filters in FILTERS:
+            for gender in ("female", "male"):
+                assert index_ids(db, agency, filters, gender) == sql_ids(db, agency, filters, gender), (filters, gender)
+    finally:
+        db.close()
+
+
+def test_pages_match_sql(agency):
+    assert_matches_sql(agency)
+
+
+@pytest.mark.parametrize("filters", FILTERS[:4], ids=[json.dumps(filters) for filters in FILTERS[:4]])
+def test_facet_counts_match_sql(agency, filters):
+    db = SessionLocal()
+    try:
+        counts = facets.index_for(db, agency.id).facet_counts(dict(filters, gender="female"))
+        for facet in ("city", "hair_color", "language"):
+            assert counts[facet]
+            for value, count in counts[facet].items():
+                assert count == len(sql_ids(db, agency, dict(filters, **{facet: value}), "female")), (facet, value)
+    finally:
+        db.close()
+
+
+def test_edits_patch_the_index(agency):
+    db = SessionLocal()
+    try:
+        index = facets.index_for(db, agency.id)
+        ids = [model_id for (model_id,) in db.query(Model.id).filter(Model.agency_id == agency.id).order_by(Model.id)]
+        for model_id in ids[:30:3]:
+            model = db.get(Model, model_id)
+            model.status = "rejected" if model.status == "approved" else "approved"
+        db.get(Model, ids[1]).hair_color = "Blonde"
+        db.get(Model, ids[2]).featured = not db.get(Model, ids[2]).featured
+        db.get(Model, ids[4]).languages = json.dumps(["French"])
+        db.commit()
+        assert facets.index_for(db, agency.id) is index
+    finally:
+        db.close()
+    assert_matches_sql(agency)
+
+
+def test_city_rename_rebuilds(agency):
+    db = SessionLocal()
+    try:
+        index = facets.index_for(db, agency.id)
+        city = db.query(City).filter(City.agency_id == agency.id, City.name == "Estepona").one()
+        city.name = "Marbella Este"
+        db.commit()
+        assert facets.index_for(db, agency.id) is not index
+        assert "Marbella Este" in facets.index_for(db, agency.id).facet_counts({})["city"]
+        city.name = "Estepona"
+        db.commit()
+    finally:
+        db.close()
+
+
+def lookup(agency_id):
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        return facets.index_for(db, agency_id), time.perf_counter() - started
+    finally:
+        db.close()
+
+
+def test_missing_index_built_once(agency, slow_loads):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        indexes = [index for index, _ in executor.map(lookup, [agency.id] * 8)]
+    assert len(slow_loads) == 1
+    assert all(index is indexes[0] for index in indexes)
+
+
+def test_stale_index_rebuilt_in_background(agency, slow_loads, monkeypatch):
+    old, _ = lookup(agency.id)
+    monkeypatch.setattr(facets, "TTL_SECONDS", -1)  # stale from now on
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        served = list(executor.map(lookup, [agency.id] * 8))
+    # Nobody waited for the rebuild, and only one was started
+    assert all(index is old and waited < 0.2 for index, waited in served)
+    deadline = time.monotonic() + 5
+    while facets._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert slow_loads == ["MainThread", "facet-index"]
+    assert facets._indexes[agency.id] is not old
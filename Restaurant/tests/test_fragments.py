@@ -0,0 +1,103 @@
+"""
+Fragment cache: a model's cached cards, rates and gallery never outlive the
+model as it was rendered.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+import fragments
+from conftest import add_model, count_queries
+from models import engine, SessionLocal, Agency, City, Model
+
+
+@pytest.fixture
+def model_id(app):
+    db = SessionLocal()
+    try:
+        agency = db.query(Agency).first()
+        model = add_model(db, agency, db.query(City).filter(City.agency_id == agency.id).first(), "Fragment Probe")
+        db.commit()
+        return model.id
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def other_process():
+    # Edits committed elsewhere drop nothing from this process's cache
+    invalidate, fragments.cache.invalidate = fragments.cache.invalidate, lambda model_ids: 0
+    yield
+    fragments.cache.invalidate = invalidate
+
+
+def test_same_pages_and_queries_with_cache(client, seeded, no_page_cache, monkeypatch):
+    paths = ["/", "/models", "/city/Marbella", f"/model/{seeded[0]}"]
+    monkeypatch.setattr(fragments, "FRAGMENT_CACHE", "off")
+    for path in paths:
+        client.get(path)  # build the facet index
+    with count_queries() as plain_statements:
+        plain = [client.get(path).text for path in paths]
+    monkeypatch.setattr(fragments, "FRAGMENT_CACHE", "on")
+    fragments.cache.clear()
+    with count_queries() as cold_statements:
+        cold = [client.get(path).text for path in paths]
+    warm = [client.get(path).text for path in paths]
+    assert plain == cold == warm
+    assert fragments.cache._entries
+    # Cached fragments are keyed on rows the page loads anyway
+    assert len(cold_statements) == len(plain_statements)
+
+
+def test_admin_edit_drops_fragments(admin, model_id, no_page_cache):
+    admin.get(f"/model/{model_id}")
+    cached = set(fragments.cache._by_model[model_id])
+    db = SessionLocal()
+    city_id = db.get(Model, model_id).city_id
+    db.close()
+    form = {"name": "Renamed Probe", "age": "30", "height": "175", "hair_color": "Red", "eye_color": "Green",
+            "gender": "female", "city_id": str(city_id), "status": "approved",
+            "rate_short_sweet_hour": "777.-", "rate_two_hours_passion": "", "rate_overnight": ""}
+    admin.post(f"/admin/models/{model_id}/edit", data=form)
+    db = SessionLocal()
+    assert db.get(Model, model_id).version == 2
+    db.close()
+    assert not cached & set(fragments.cache._by_model.get(model_id, ()))
+    page = admin.get(f"/model/{model_id}").text
+    assert "Renamed Probe's Rates" in page and "777.-" in page
+
+
+def test_edit_elsewhere_misses_by_version(client, model_id, no_page_cache, other_process):
+    client.get(f"/model/{model_id}")
+    db = SessionLocal()
+    db.get(Model, model_id).name = "Edited Elsewhere"
+    db.commit()
+    db.close()
+    assert "Edited Elsewhere's Rates" in client.get(f"/model/{model_id}").text
+
+
+def test_reused_id_misses(client, model_id, no_page_cache, other_process):
+    # SQLite gives a deleted newest row's id to the next insert, at version 1 again
+    client.get(f"/model/{model_id}")
+    with engine.begin() as conn:
+        row = conn.execute(text("SELECT * FROM models WHERE id = :id"), {"id": model_id}).mappings().one()
+        conn.execute(text("DELETE FROM models WHERE id = :id"), {"id": model_id})
+        reused = dict(row, name="Reused Id", photos='["https://example.com/reused/0.jpg"]', version=1,
+                      created_at=datetime.utcnow())
+        conn.execute(text(f"INSERT INTO models ({', '.join(reused)}) VALUES ({', '.join(':' + c for c in reused)})"),
+                     reused)
+    page = client.get(f"/model/{model_id}").text
+    assert "Reused Id's Rates" in page
+    assert "https://example.com/reused/0.jpg" in page
+    assert "Fragment Probe" not in page
+
+
+def test_lru_bound():
+    bounded = fragments.FragmentCache(max_entries=10)
+    for n in range(25):
+        bounded.set(("card", n, None, 1), f"<div>{n}</div>")
+    assert len(bounded._entries) == 10
+    assert bounded.stats()["evictions"] == 15
+    assert bounded.get(("card", 0, None, 1)) is None
+    assert bounded.get(("card", 24, None, 1)) == "<div>24</div>"
@@ -0,0 +1,193 @@
+"""
+Queued media uploads: staging in the storage backend and the worker that
+stores them.
+"""
+import io
+import json
+import os
+
+import pytest
+from starlette.datastructures import UploadFile
+
+import jobs
+import media
+import page_cache
+from conftest import add_model, sample_photo
+from models import SessionLocal, Agency, City, MediaJob, Model
+
+FORM = {"name": "Queued", "phone": "1", "age": "25", "height": "170", "hair_color": "Blonde",
+        "eye_color": "Blue", "gender": "female", "bio": ""}
+
+
+class FlakyStaging(media.LocalStorage):
+    """Refuses to stage the file called `refuse`."""
+
+    refuse = "photo1.jpg"
+
+    def stage(self, fileobj, filename=None):
+        if filename == self.refuse:
+            raise OSError("staging unavailable")
+        return super().stage(fileobj, filename)
+
+
+class EditedMeanwhile(media.LocalStorage):
+    """Lets an admin edit commit while the worker stores a photo's variants."""
+
+    edit = None
+
+    def upload(self, fileobj, folder, resource_type="image", filename=None):
+        if self.edit and filename.endswith((".avif", ".webp")):
+            self.edit()
+            self.edit = None
+        return super().upload(fileobj, folder, resource_type, filename)
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    backend = media.LocalStorage(root=str(tmp_path / "uploads"), staging_root=str(tmp_path / "staging"))
+    monkeypatch.setattr(media, "storage", backend)
+    return backend
+
+
+@pytest.fixture
+def city_id(app):
+    db = SessionLocal()
+    try:
+        return db.query(City.id).first()[0]
+    finally:
+        db.close()
+
+
+def staged_files(storage):
+    return sorted(os.listdir(storage.staging_root)) if os.path.isdir(storage.staging_root) else []
+
+
+def drain():
+    while jobs.process_due_jobs():
+        pass
+
+
+def test_uploads_staged_then_stored(client, storage, city_id):
+    photos = [sample_photo(400), sample_photo(500)]
+    files = [("photos", (f"photo{n}.jpg", photo, "image/jpeg")) for n, photo in enumerate(photos)]
+    assert client.post("/apply", data={**FORM, "city_id": str(city_id)}, files=files).json()["success"]
+
+    db = SessionLocal()
+    model = db.query(Model).order_by(Model.id.desc()).first()
+    refs = sorted(job.staged_ref for job in model.media_jobs)
+    db.close()
+    # The job rows hold a reference; the bytes are in the staging area
+    assert staged_files(storage) == refs
+    assert sorted(os.path.getsize(os.path.join(storage.staging_root, ref)) for ref in refs) == sorted(map(len, photos))
+
+    drain()
+    db = SessionLocal()
+    model = db.get(Model, model.id)
+    assert model.media_status == "ready"
+    assert len(model.photo_list) == 2 and all(model.photo_info(url) for url in model.photo_list)
+    assert all(job.staged_ref is None for job in model.media_jobs)
+    db.close()
+    assert staged_files(storage) == []
+
+
+def test_rolled_back_request_discards_staged_files(app, storage):
+    db = SessionLocal()
+    try:
+        agency = db.query(Agency).first()
+        model = add_model(db, agency, db.query(City).filter(City.agency_id == agency.id).first(), "Rolled Back")
+        with open(os.devnull, "rb") as empty:
+            jobs.enqueue_uploads(db, model, photos=[UploadFile(empty, filename="photo.jpg")])
+            assert len(staged_files(storage)) == 1
+        db.rollback()
+    finally:
+        db.close()
+    assert staged_files(storage) == []
+
+
+def test_failed_staging_discards_the_others(client, tmp_path, monkeypatch, city_id):
+    backend = FlakyStaging(root=str(tmp_path / "uploads"), staging_root=str(tmp_path / "staging"))
+    monkeypatch.setattr(media, "storage", backend)
+    files = [("photos", (f"photo{n}.jpg", sample_photo(300), "image/jpeg")) for n in range(3)]
+    response = client.post("/apply", data={**FORM, "name": "Not Staged", "city_id": str(city_id)}, files=files)
+    assert response.json()["success"] is False
+    assert staged_files(backend) == []
+    db = SessionLocal()
+    try:
+        assert db.query(Model).filter(Model.name == "Not Staged").count() == 0
+    finally:
+        db.close()
+
+
+def test_failed_upload_keeps_staged_file_for_retry(client, storage, city_id, monkeypatch):
+    files = [("photos", ("photo.jpg", sample_photo(300), "image/jpeg"))]
+    assert client.post("/apply", data={**FORM, "name": "Retried", "city_id": str(city_id)}, files=files).json()["success"]
+
+    def unavailable(*args, **kwargs):
+        raise OSError("storage unavailable")
+
+    monkeypatch.setattr(storage, "upload", unavailable)
+    drain()
+    db = SessionLocal()
+    try:
+        job = db.query(MediaJob).order_by(MediaJob.id.desc()).first()
+        assert (job.status, job.last_error) == ("pending", "storage unavailable")
+        assert staged_files(storage) == [job.staged_ref]
+    finally:
+        db.close()
+
+
+def test_admin_edit_during_upload_kept(admin, tmp_path, monkeypatch):
+    backend = EditedMeanwhile(root=str(tmp_path / "uploads"), staging_root=str(tmp_path / "staging"))
+    monkeypatch.setattr(media, "storage", backend)
+    db = SessionLocal()
+    try:
+        agency = db.query(Agency).first()
+        model = add_model(db, agency, db.query(City).filter(City.agency_id == agency.id).first(), "Edited Meanwhile")
+        jobs.enqueue_uploads(db, model, photos=[UploadFile(io.BytesIO(sample_photo(300)), filename="new.jpg")])
+        db.commit()
+        model_id, city_id, photos = model.id, model.city_id, model.photo_list
+    finally:
+        db.close()
+
+    form = {"name": "Renamed Meanwhile", "age": "30", "height": "175", "hair_color": "Red", "eye_color": "Green",
+            "gender": "female", "city_id": str(city_id), "status": "approved",
+            "removed_photos": json.dumps(photos[:1])}
+    backend.edit = lambda: admin.post(f"/admin/models/{model_id}/edit", data=form)
+    drain()
+
+    db = SessionLocal()
+    try:
+        model = db.get(Model, model_id)
+        # The admin's removal and the worker's new photo are both there
+        assert model.name == "Renamed Meanwhile"
+        assert model.photo_list[:-1] == photos[1:]
+        assert model.photo_list[-1].startswith("/static/uploads/models/")
+        assert model.media_status == "ready"
+    finally:
+        db.close()
+
+
+def test_finished_upload_evicts_cached_profile(client, storage, monkeypatch):
+    monkeypatch.setattr(page_cache, "backend", page_cache.MemoryBackend())
+    db = SessionLocal()
+    try:
+        agency = db.query(Agency).first()
+        model = add_model(db, agency, db.query(City).filter(City.agency_id == agency.id).first(), "Cached Profile")
+        db.commit()
+        model_id = model.id
+    finally:
+        db.close()
+    assert client.get(f"/model/{model_id}").headers["x-cache"] == "MISS"
+    db = SessionLocal()
+    try:
+        jobs.enqueue_uploads(db, db.get(Model, model_id), photos=[UploadFile(io.BytesIO(sample_photo(300)),
+                                                                             filename="new.jpg")])
+        db.commit()
+    finally:
+        db.close()
+    assert client.get(f"/model/{model_id}").headers["x-cache"] == "MISS"  # the queued job changed media_status
+    assert client.get(f"/model/{model_id}").headers["x-cache"] == "HIT"
+    drain()
+    page = client.get(f"/model/{model_id}")
+    assert page.headers["x-cache"] == "MISS"
+    assert "/static/uploads/models/" in page.text
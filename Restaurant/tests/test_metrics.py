@@ -0,0 +1,190 @@
+"""
+/metrics: what the middleware and the handlers record, and the totals over
+several worker processes sharing METRICS_DIR.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import jobs
+import main
+import media
+import metrics
+from models import engine, SessionLocal, City
+
+from conftest import TEST_DIR, sample_photo
+
+SAMPLE_LINE = re.compile(r'^([a-z_]+)(?:\{(.*)\})? (\S+)$')
+
+# One "uvicorn worker": serves some requests, writes its snapshot and exits.
+# {getpid} can stand in for os.getpid, to give it the PID of an earlier worker.
+WORKER = """
+import asyncio, os
+{getpid}
+import main, metrics
+from fastapi.testclient import TestClient
+asyncio.run(main.startup_event())
+client = TestClient(main.app)
+for _ in range({requests}):
+    client.get("/about")
+metrics.flush()
+"""
+
+
+def parse_exposition(body):
+    """{(name, frozenset of label pairs): value} from Prometheus text format."""
+    samples = {}
+    for line in body.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, labels, value = SAMPLE_LINE.match(line).groups()
+        pairs = frozenset(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels or ""))
+        samples[(name, pairs)] = float(value)
+    return samples
+
+
+def sample_total(samples, name, **labels):
+    wanted = set(labels.items())
+    return sum(value for (sample, pairs), value in samples.items() if sample == name and wanted <= pairs)
+
+
+@pytest.fixture
+def scrape(admin):
+    def get():
+        response = admin.get("/metrics")
+        assert response.status_code == 200
+        return parse_exposition(response.text)
+    return get
+
+
+def test_exposition_format(admin):
+    response = admin.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE http_requests_total counter" in response.text
+
+
+def test_requests_counted_by_route_template(admin, scrape, seeded):
+    before = scrape()
+    for _ in range(10):
+        admin.get(f"/model/{seeded[0]}")
+    after = scrape()
+    for name in ("http_requests_total", "http_request_duration_seconds_count"):
+        counted = sample_total(after, name, route="/model/{model_id}") - sample_total(before, name, route="/model/{model_id}")
+        assert counted == 10
+
+
+def test_histogram_buckets_are_cumulative(admin, scrape, seeded):
+    admin.get("/models")
+    samples = scrape()
+    buckets = sorted((float(dict(pairs)["le"]), value) for (name, pairs), value in samples.items()
+                     if name == "http_request_duration_seconds_bucket" and ("route", "/models") in pairs)
+    assert all(a[1] <= b[1] for a, b in zip(buckets, buckets[1:]))
+    assert buckets[-1][1] == sample_total(samples, "http_request_duration_seconds_count", route="/models")
+
+
+def test_handled_error_counted(client, scrape, seeded):
+    # The booking form turns the bad date into {"success": false}
+    before = scrape()
+    booking = {"client_name": "A", "client_email": "a@example.com", "event_date": "next week", "event_type": "Other"}
+    assert client.post(f"/book/{seeded[0]}", data=booking).json()["success"] is False
+    after = scrape()
+    labels = {"route": "/book/{model_id}", "error": "ValueError"}
+    assert sample_total(after, "app_errors_total", **labels) - sample_total(before, "app_errors_total", **labels) == 1
+
+
+def test_uploads_observed(client, scrape, monkeypatch):
+    monkeypatch.setattr(media, "storage", media.LocalStorage(root=os.path.join(TEST_DIR, "uploads")))
+    db = SessionLocal()
+    city_id = db.query(City.id).first()[0]
+    db.close()
+    photos = [sample_photo(400 * (n + 1)) for n in range(3)]
+    before = scrape()
+    form = {"name": "Metrics", "phone": "1", "age": "25", "height": "170", "hair_color": "Blonde",
+            "eye_color": "Blue", "gender": "female", "city_id": str(city_id), "bio": ""}
+    files = [("photos", (f"photo{n}.jpg", photo, "image/jpeg")) for n, photo in enumerate(photos)]
+    assert client.post("/apply", data=form, files=files).json()["success"]
+    while jobs.process_due_jobs():
+        pass
+    after = scrape()
+
+    def delta(name, **labels):
+        return sample_total(after, name, **labels) - sample_total(before, name, **labels)
+
+    assert delta("media_upload_duration_seconds_count", backend="local", outcome="ok") == 3
+    assert delta("media_upload_bytes_sum", backend="local") == sum(map(len, photos))
+
+
+def test_pool_gauges(scrape):
+    samples = scrape()
+    assert sample_total(samples, "db_pool_size", setting="size") == engine.pool.size()
+    assert ("db_pool_connections", frozenset({("state", "in_use")})) in samples
+
+
+def test_exited_workers_aggregated(admin, monkeypatch):
+    # Two workers sharing METRICS_DIR exit before this process is scraped
+    shared = os.path.join(TEST_DIR, "metrics")
+    env = {**os.environ, "METRICS_DIR": shared}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", WORKER.format(requests=5, getpid="")], env=env, cwd=root, check=True,
+                       stdout=subprocess.DEVNULL)
+    monkeypatch.setattr(metrics, "METRICS_DIR", shared)
+    own = sample_total(parse_exposition(metrics.exposition(metrics.snapshot())), "http_requests_total")
+    combined = parse_exposition(admin.get("/metrics").text)
+    assert sample_total(combined, "http_requests_total") == own + 2 * 5
+    # Their gauges went with them
+    assert sample_total(combined, "db_pool_size", setting="size") == engine.pool.size()
+
+
+def dead_pid():
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    return child.pid
+
+
+def write_snapshot(shared, pid, requests):
+    os.makedirs(shared, exist_ok=True)
+    with open(os.path.join(shared, f"metrics-{pid}.json"), "w") as out:
+        json.dump([["http_requests_total", ["GET", "/about", "200"], requests],
+                   ["db_pool_size", ["size"], 5]], out)
+
+
+def test_dead_workers_retired(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    write_snapshot(str(tmp_path), dead_pid(), 7)
+    own = metrics.snapshot().get(("http_requests_total", ("GET", "/about", "200")), 0)
+    for _ in range(2):
+        totals = metrics.collect_all()
+        assert totals[("http_requests_total", ("GET", "/about", "200"))] == own + 7
+    # Its snapshot is gone, its counts stay in retired.json, its gauge is dropped
+    assert sorted(os.listdir(tmp_path)) == [f"metrics-{os.getpid()}.json", "metrics.lock", "retired.json"]
+    assert totals[("db_pool_size", ("size",))] == engine.pool.size()
+
+
+def test_reused_pid_keeps_counts(monkeypatch, tmp_path):
+    # A worker killed before its exit hook, then a new one with the same PID
+    pid = dead_pid()
+    write_snapshot(str(tmp_path), pid, 7)
+    env = {**os.environ, "METRICS_DIR": str(tmp_path)}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", WORKER.format(requests=5, getpid=f"os.getpid = lambda: {pid}")],
+                   env=env, cwd=root, check=True, stdout=subprocess.DEVNULL)
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    own = metrics.snapshot().get(("http_requests_total", ("GET", "/about", "200")), 0)
+    assert metrics.collect_all()[("http_requests_total", ("GET", "/about", "200"))] == own + 7 + 5
+
+
+def test_token_required(client, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "s3cret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer s3cret"}).status_code == 200
+
+
+def test_closed_without_token_outside_sqlite(client, monkeypatch):
+    monkeypatch.setattr(main, "engine", SimpleNamespace(dialect=SimpleNamespace(name="postgresql")))
+    assert client.get("/metrics").status_code == 403
@@ -0,0 +1,115 @@
+"""
+Versioned schema migrations, each test on a database file of its own.
+"""
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+
+import migrations
+from models import Model
+
+# An old database: no version table, none of the later columns
+LEGACY_SCHEMA = [
+    "CREATE TABLE agencies (id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR(100) NOT NULL, "
+    "subdomain VARCHAR(50) NOT NULL UNIQUE, description TEXT, phone VARCHAR(20), email VARCHAR(255), "
+    "address TEXT, created_at DATETIME, active BOOLEAN)",
+    "CREATE TABLE cities (id INTEGER PRIMARY KEY AUTOINCREMENT, agency_id INTEGER NOT NULL, "
+    "name VARCHAR(100) NOT NULL, country VARCHAR(50), active BOOLEAN)",
+    "CREATE TABLE models (id INTEGER PRIMARY KEY AUTOINCREMENT, agency_id INTEGER NOT NULL, city_id INTEGER, "
+    "name VARCHAR(100) NOT NULL, age INTEGER, height INTEGER, hair_color VARCHAR(50), eye_color VARCHAR(50), "
+    "bio TEXT, photos TEXT, status VARCHAR(20), available BOOLEAN, created_at DATETIME)",
+    "INSERT INTO agencies (name, subdomain, active) VALUES ('Legacy', 'legacy', 1)",
+    "INSERT INTO cities (agency_id, name, country, active) VALUES (1, 'Marbella', 'Spain', 1)",
+    "INSERT INTO models (agency_id, city_id, name, age, height, bio, photos, status, available) "
+    "VALUES (1, 1, 'Old Profile', 25, 170, 'Speaks fluent Italian', '[]', 'approved', 1)",
+]
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """An empty database that migrations.py migrates instead of the app's."""
+    engine = create_engine(f"sqlite:///{tmp_path}/migrate.db")
+    monkeypatch.setattr(migrations, "engine", engine)
+    yield engine
+    engine.dispose()
+
+
+def applied_versions(engine):
+    with engine.connect() as conn:
+        return [version for (version,) in conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+
+
+def model_columns(engine):
+    with engine.connect() as conn:
+        return {column["name"] for column in inspect(conn).get_columns("models")}
+
+
+def test_fresh_database_reaches_head(database):
+    assert migrations.current_version() == 0
+    assert migrations.migrate() == len(migrations.STEPS)
+    assert migrations.current_version() == migrations.LATEST
+    assert applied_versions(database) == [version for version, _, _ in migrations.STEPS]
+    assert model_columns(database) >= set(Model.__table__.columns.keys())
+
+
+def test_rerun_is_a_no_op(database):
+    migrations.migrate()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database, "before_cursor_execute", before_cursor_execute)
+    try:
+        assert migrations.migrate() == 0
+        assert migrations.check() == migrations.LATEST
+    finally:
+        event.remove(database, "before_cursor_execute", before_cursor_execute)
+    writes = [statement for statement in statements
+              if statement.lstrip().split()[0].upper() in ("CREATE", "ALTER", "INSERT", "UPDATE", "DELETE")]
+    assert writes == []
+    assert applied_versions(database) == [version for version, _, _ in migrations.STEPS]
+
+
+def test_partially_applied_database_resumes(database, monkeypatch):
+    assert migrations.migrate(target=5) == 5
+    assert migrations.current_version() == 5
+
+    # A step that fails rolls back with its version row; the ones before it stay applied
+    def broken(conn):
+        conn.execute(text("ALTER TABLE models ADD COLUMN half_done TEXT"))
+        raise RuntimeError("step failed")
+
+    steps = [(version, name, broken if version == 8 else step) for version, name, step in migrations.STEPS]
+    monkeypatch.setattr(migrations, "STEPS", steps)
+    with pytest.raises(RuntimeError):
+        migrations.migrate()
+    assert migrations.current_version() == 7
+    assert "half_done" not in model_columns(database)
+
+    monkeypatch.undo()
+    monkeypatch.setattr(migrations, "engine", database)
+    assert migrations.migrate() == migrations.LATEST - 7
+    assert applied_versions(database) == [version for version, _, _ in migrations.STEPS]
+
+
+def test_legacy_database_migrated_and_backfilled(database):
+    with database.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+    assert migrations.migrate() == len(migrations.STEPS)
+    assert model_columns(database) >= set(Model.__table__.columns.keys())
+    with database.connect() as conn:
+        assert conn.execute(text("SELECT gender FROM models")).scalar() == "female"
+        assert conn.execute(text("SELECT rowid FROM model_search WHERE model_search MATCH 'italian'")).all() == [(1,)]
+
+
+def test_check_refuses_stale_schema(database, monkeypatch, capsys):
+    migrations.migrate(target=migrations.LATEST - 1)
+    monkeypatch.setattr(migrations, "MIGRATE_ON_STARTUP", "off")
+    assert migrations.check() == migrations.LATEST - 1
+    assert migrations.current_version() == migrations.LATEST - 1
+    assert "Run: python migrations.py migrate" in capsys.readouterr().out
+
+    monkeypatch.setattr(migrations, "MIGRATE_ON_STARTUP", "on")
+    assert migrations.check() == migrations.LATEST
+    assert migrations.current_version() == migrations.LATEST
@@ -0,0 +1,19 @@
+"""
+Page cache setup: the per-process backend is flagged when several workers
+would each keep their own copy.
+"""
+import pytest
+
+import page_cache
+
+
+@pytest.mark.parametrize("workers, cache, warned", [
+    (1, page_cache.MemoryBackend, False),
+    (4, page_cache.MemoryBackend, True),
+    (4, lambda: None, False),  # PAGE_CACHE=off
+])
+def test_memory_cache_with_several_workers_warns(app, monkeypatch, capsys, workers, cache, warned):
+    monkeypatch.setattr(page_cache, "WEB_CONCURRENCY", workers)
+    monkeypatch.setattr(page_cache, "backend", cache())
+    page_cache.install()
+    assert ("PAGE_CACHE=redis" in capsys.readouterr().out) == warned
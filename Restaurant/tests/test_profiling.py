@@ -0,0 +1,85 @@
+"""
+Request profiling: Server-Timing for admins, N+1 detection, request logs
+and /admin/profiling.
+"""
+import io
+import json
+import logging
+import re
+
+import pytest
+from fastapi import Depends
+from sqlalchemy.orm import Session
+
+import profiling
+from conftest import count_queries
+from models import get_db, Model
+
+SERVER_TIMING = re.compile(r'(\w+);dur=([\d.]+)(?:;desc="(\d+) queries")?')
+
+
+def server_timing(response):
+    return {name: (float(ms), int(queries) if queries else None)
+            for name, ms, queries in SERVER_TIMING.findall(response.headers.get("server-timing", ""))}
+
+
+@pytest.fixture(scope="module")
+def lazy_route(app):
+    # A listing that forgets to eager-load a collection: one SELECT per row
+    @app.get("/__test/lazy")
+    def lazy_jobs(db: Session = Depends(get_db)):
+        return {"jobs": [len(model.media_jobs) for model in db.query(Model).order_by(Model.id.desc()).limit(30)]}
+
+    yield "/__test/lazy"
+    app.router.routes = [route for route in app.router.routes if getattr(route, "path", None) != "/__test/lazy"]
+
+
+def test_no_server_timing_for_visitors(client, seeded):
+    for path in ("/", "/models", f"/model/{seeded[0]}"):
+        assert "server-timing" not in client.get(path).headers
+
+
+@pytest.mark.parametrize("path", ["/models", "/model/{model_id}", "/cities"])
+def test_server_timing_counts_queries(admin, seeded, no_page_cache, path):
+    path = path.format(model_id=seeded[0])
+    admin.get(path)  # compile templates
+    with count_queries() as statements:
+        response = admin.get(path)
+    timing = server_timing(response)
+    assert timing["db"][1] == len(statements)
+    assert "render" in timing and "app" in timing
+
+
+def test_upload_staging_timed(admin):
+    form = {"name": "Profiled", "phone": "1", "age": "25", "height": "170", "hair_color": "Blonde",
+            "eye_color": "Blue", "gender": "female", "city_id": "1", "bio": ""}
+    files = [("photos", (f"photo{n}.jpg", b"x" * 200000, "image/jpeg")) for n in range(3)]
+    assert "upload" in server_timing(admin.post("/apply", data=form, files=files))
+
+
+def test_n_plus_one_flagged(admin, client, seeded, lazy_route):
+    profiling.window.clear()
+    for _ in range(3):
+        client.get(lazy_route)
+    endpoint = f"GET {lazy_route}"
+    offenders = [row for row in profiling.window.repeated_statements() if row["endpoint"] == endpoint]
+    assert offenders[0]["requests"] == 3
+    assert offenders[0]["max_per_request"] >= 20
+    report = admin.get("/admin/profiling")
+    assert report.status_code == 200
+    assert report.text.count(endpoint) == 2  # slowest endpoints and N+1 offenders
+    assert client.get("/admin/profiling", follow_redirects=False).headers["location"] == "/admin/login"
+
+
+def test_request_log_line(client, seeded, no_page_cache, monkeypatch):
+    lines = io.StringIO()
+    handler = logging.StreamHandler(lines)
+    profiling.logger.addHandler(handler)
+    monkeypatch.setattr(profiling, "PROFILING_LOG", "all")
+    try:
+        client.get("/models")
+    finally:
+        profiling.logger.removeHandler(handler)
+    logged = json.loads(lines.getvalue().splitlines()[-1])
+    assert logged["endpoint"] == "GET /models"
+    assert logged["queries"] > 0 and logged["render_ms"] > 0
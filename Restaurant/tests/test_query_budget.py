@@ -0,0 +1,32 @@
+"""
+SQL statements per listing page.
+
+The budgets don't depend on how many rows a page shows, so a lazy load per
+card or row (N+1) goes straight past them.
+"""
+import pytest
+
+from conftest import count_queries
+
+QUERY_BUDGETS = {
+    "/": 1,
+    "/models": 2,
+    "/models?city=Marbella": 2,
+    "/cities": 2,
+    "/city/Marbella": 2,
+    "/model/{model_id}": 1,
+    "/admin/dashboard": 3,
+    "/admin/models": 2,
+    "/admin/bookings": 1,
+}
+
+
+@pytest.mark.parametrize("path, budget", QUERY_BUDGETS.items())
+def test_listing_stays_within_budget(admin, seeded, no_page_cache, path, budget):
+    path = path.format(model_id=seeded[0])
+    # The agency lookup and facet index are built once per process, not per request
+    assert admin.get(path).status_code == 200
+    with count_queries() as statements:
+        response = admin.get(path)
+    assert response.status_code == 200
+    assert len(statements) <= budget, "\n".join(" ".join(statement.split())[:160] for statement in statements)
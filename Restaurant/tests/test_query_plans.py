@@ -0,0 +1,25 @@
+"""
+The hot public and admin queries use their composite indexes, on SQLite and
+(with a Postgres DATABASE_URL) on Postgres.
+"""
+import pytest
+
+import add_indexes
+from models import engine
+
+
+@pytest.mark.parametrize("description, query, index_name", add_indexes.HOT_QUERIES,
+                         ids=[description for description, _, _ in add_indexes.HOT_QUERIES])
+def test_query_uses_index(app, description, query, index_name):
+    with engine.connect() as conn:
+        plan = add_indexes.explain(conn, query)
+    assert index_name in plan, plan
+
+
+@pytest.mark.postgres
+@pytest.mark.parametrize("description, query, index_name", add_indexes.HOT_QUERIES,
+                         ids=[description for description, _, _ in add_indexes.HOT_QUERIES])
+def test_query_uses_index_on_postgres(postgres_engine, description, query, index_name):
+    with postgres_engine.connect() as conn:
+        plan = add_indexes.explain(conn, query)
+    assert index_name in plan, plan
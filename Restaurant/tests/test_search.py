@@ -0,0 +1,162 @@
+"""
+Full-text search: ranking, fallback to any word, agency and status filters,
+paging, and the index kept current by ORM writes. On SQLite (FTS5) and, with
+a Postgres DATABASE_URL, on Postgres (tsvector).
+"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import search
+from models import SessionLocal, Agency, City, Model
+
+HOST = "search.example.com"
+PROFILES = [
+    ("Jazz Moreno", {"bio": "Sings in a quartet.", "nationality": "Spanish"}),
+    ("Lucia", {"bio": "Loves live jazz on Fridays.", "nationality": "Italian"}),
+    ("Chiara", {"bio": "Cooks for friends <b>often</b>.", "nationality": "Italian",
+                "favorite_cuisine": "Home-made Italian cuisine"}),
+    ("Amelie", {"bio": "Painter.", "languages": ["French", "English"]}),
+    ("Sophie", {"bio": "Sailing and sushi.", "nationality": "French"}),
+    ("Pending Jazz", {"bio": "Plays jazz piano.", "status": "pending"}),
+] + [(f"Teacher {n}", {"bio": "Teaches yoga at dawn."}) for n in range(12)]
+
+
+def add_profiles(db, subdomain):
+    """An agency with PROFILES and a neighbour with a jazz singer; returns {name: id} of the first."""
+    ids = {}
+    for name in (subdomain, f"{subdomain}-neighbour"):
+        agency = Agency(name=name.upper(), subdomain=name, email=f"info@{name}.example")
+        db.add(agency)
+        db.flush()
+        city = City(agency_id=agency.id, name="Marbella")
+        db.add(city)
+        db.flush()
+        profiles = PROFILES if not ids else [("Jazz Neighbour", {"bio": "Jazz singer."})]
+        for profile, fields in profiles:
+            fields = dict(fields, languages=json.dumps(fields.get("languages", [])))
+            model = Model(agency_id=agency.id, city_id=city.id, name=profile, age=25, height=170,
+                          gender="female", photos="[]", **{"status": "approved", **fields})
+            db.add(model)
+            db.flush()
+            ids.setdefault(profile, model.id)
+        ids.setdefault("agency", agency.id)
+    return ids
+
+
+def assert_searches(db, ids):
+    """The checks shared by both backends, against add_profiles' data."""
+    agency_id = ids["agency"]
+    # A hit in the name outranks one in the bio; pending and other agencies' profiles never show
+    assert [hit.model.name for hit in search.search(db, agency_id, "jazz").hits] == ["Jazz Moreno", "Lucia"]
+    results = search.search(db, agency_id, "Italian cuisine")
+    assert (results.match, [hit.model.name for hit in results.hits]) == ("all", ["Chiara"])
+    # Nobody's profile says "speaks": falls back to any word
+    results = search.search(db, agency_id, "speaks French")
+    assert (results.match, sorted(hit.model.name for hit in results.hits)) == ("any", ["Amelie", "Sophie"])
+    lucia = search.search(db, agency_id, "jazz").hits[1]
+    assert "<mark>jazz</mark>" in lucia.snippet
+
+    pages = [search.search(db, agency_id, "yoga", page, limit=5) for page in (1, 2, 3)]
+    assert [page.has_more for page in pages] == [True, True, False]
+    seen = [hit.model.id for page in pages for hit in page.hits]
+    assert len(seen) == len(set(seen)) == 12
+
+
+@pytest.fixture(scope="module")
+def profiles(app):
+    db = SessionLocal()
+    try:
+        ids = add_profiles(db, "search")
+        db.commit()
+        return ids
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def db(app):
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+def test_terms():
+    assert search.terms('Who speaks "French" OR -yoga*?') == ["speaks", "french", "yoga"]
+    assert search.terms("who is the") == []
+
+
+def test_search(db, profiles):
+    assert_searches(db, profiles)
+
+
+def test_snippet_escapes_profile_html(db, profiles):
+    (hit,) = search.search(db, profiles["agency"], "often").hits
+    assert "&lt;b&gt;<mark>often</mark>&lt;/b&gt;" in hit.snippet
+
+
+def test_operators_are_plain_words(db, profiles):
+    for query in ('yoga) OR ("', "NEAR(yoga dawn)", "yoga*", "-", "who is the"):
+        search.search(db, profiles["agency"], query)
+
+
+def test_admin_forms_keep_index_current(app, profiles):
+    admin = TestClient(app, base_url=f"http://{HOST}", cookies={"admin_logged_in": "true"})
+    db = SessionLocal()
+    try:
+        city_id = db.query(City.id).filter(City.agency_id == profiles["agency"]).scalar()
+    finally:
+        db.close()
+
+    def found(query):
+        return [hit["id"] for hit in admin.get("/models/search", params={"q": query}).json()["results"]]
+
+    form = {"name": "Search Probe", "age": "27", "height": "172", "hair_color": "Red", "eye_color": "Green",
+            "gender": "female", "city_id": str(city_id), "bio": "Plays the xylophone on Sundays.",
+            "languages": "English, Catalan"}
+    assert admin.post("/admin/models/add", data=form,
+                      files=[("photos", ("a.jpg", b"", "image/jpeg"))]).json()["success"]
+    (probe,) = found("xylophone catalan")
+
+    admin.post(f"/admin/models/{probe}/edit", data={**form, "bio": "Collects harpsichords."})
+    assert found("xylophone") == [] and found("harpsichord") == [probe]
+    assert "<mark>harpsichords</mark>" in admin.get("/search", params={"q": "harpsichord"}).text
+
+    admin.delete(f"/admin/models/{probe}/delete")
+    assert found("harpsichord") == []
+
+
+def test_rebuild_after_raw_writes(db, profiles):
+    db.execute(text("UPDATE models SET bio = 'Rides horses.' WHERE id = :id"), {"id": profiles["Sophie"]})
+    db.commit()
+    assert search.search(db, profiles["agency"], "horses").hits == []
+    assert search.rebuild(db) == db.query(Model).count()
+    db.commit()
+    assert [hit.model.id for hit in search.search(db, profiles["agency"], "horses").hits] == [profiles["Sophie"]]
+    assert db.execute(text("SELECT count(*) FROM model_search")).scalar() == db.query(Model).count()
+
+
+@pytest.mark.postgres
+def test_search_on_postgres(postgres_engine, monkeypatch):
+    monkeypatch.setattr(search, "engine", postgres_engine)
+    db = SessionLocal(bind=postgres_engine)
+    try:
+        search.ensure_index(db)
+        # The flush hook upserts the tsvector rows in the same transaction
+        ids = add_profiles(db, "search")
+        db.commit()
+        assert db.execute(text("SELECT count(*) FROM model_search")).scalar() == len(PROFILES) + 1
+        assert_searches(db, ids)
+
+        sophie = db.get(Model, ids["Sophie"])
+        sophie.bio = "Collects harpsichords."
+        db.commit()
+        assert search.search(db, ids["agency"], "sushi").hits == []
+        assert [hit.model.id for hit in search.search(db, ids["agency"], "harpsichord").hits] == [sophie.id]
+        db.delete(sophie)
+        db.commit()
+        assert search.search(db, ids["agency"], "harpsichord").hits == []
+    finally:
+        db.close()
@@ -0,0 +1,34 @@
+"""
+Static assets: hashed names, precompressed variants and caching headers.
+"""
+import re
+
+import pytest
+
+import assets
+
+
+def test_pages_link_hashed_names(client):
+    linked = set(re.findall(r"/static/[^\"')\s]+", client.get("/").text))
+    hashed = {f"/static/{entry['hashed']}" for entry in assets.manifest.values()}
+    plain = {f"/static/{name}" for name in assets.manifest}
+    assert linked & hashed
+    assert not linked & plain
+
+
+@pytest.mark.parametrize("accept", ["br, gzip", "gzip", "identity"])
+def test_best_accepted_encoding_served(client, accept):
+    assert assets.manifest, "startup builds the manifest"
+    for name, entry in assets.manifest.items():
+        response = client.get(assets.static_url(name), headers={"Accept-Encoding": accept})
+        expected = next((encoding for encoding in entry["encodings"] if encoding in accept), "identity")
+        assert response.status_code == 200
+        assert response.headers.get("Content-Encoding", "identity") == expected
+        assert "immutable" in response.headers["Cache-Control"]
+
+
+def test_unhashed_and_outdated_names_still_served(client):
+    assert client.get("/static/logo.jpg").status_code == 200
+    stale = client.get("/static/logo.000000000000.jpg")
+    assert stale.status_code == 200
+    assert "immutable" not in stale.headers.get("Cache-Control", "")
@@ -0,0 +1,115 @@
+"""
+Per-host agencies: each host sees and edits only its own agency's rows.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import page_cache
+import tenants
+from conftest import count_queries
+from models import SessionLocal, Agency, City, Model
+
+COSTA = {"host": "costa.example.com"}
+
+
+@pytest.fixture(scope="module")
+def costa(seeded):
+    """A second agency with a city of the same name as the first agency's."""
+    db = SessionLocal()
+    try:
+        agency = Agency(name="COSTA MODELS", subdomain="costa", email="info@costa.example")
+        db.add(agency)
+        db.flush()
+        city = City(agency_id=agency.id, name="Marbella")
+        db.add(city)
+        db.flush()
+        models = [Model(agency_id=agency.id, city_id=city.id, name=f"Costa {i}", age=25, height=170,
+                        gender="female", photos="[]", status="approved") for i in range(12)]
+        db.add_all(models)
+        db.commit()
+        return agency.id, [model.id for model in models]
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def memory_cache():
+    saved = page_cache.backend
+    page_cache.set_backend(page_cache.MemoryBackend())
+    yield
+    page_cache.set_backend(saved)
+
+
+@pytest.mark.parametrize("path", ["/models", "/city/Marbella", "/admin/models"])
+def test_each_host_lists_its_own_models(admin, costa, path):
+    default, other = admin.get(path).text, admin.get(path, headers=COSTA).text
+    assert "Seeded " in default and "Costa " not in default
+    assert "Costa " in other and "Seeded " not in other
+
+
+def test_one_cache_entry_per_agency(client, costa, memory_cache):
+    for headers in ({}, COSTA, {}, COSTA):
+        client.get("/about", headers=headers)
+    cached = page_cache.stats()
+    assert (cached["entries"], cached["hits"]) == (2, 2)
+
+
+def test_edit_invalidates_only_its_agency(client, seeded, costa, memory_cache):
+    pages = ("/", "/models", "/cities", "/about")
+    for path in pages:
+        client.get(path)
+        client.get(path, headers=COSTA)
+    db = SessionLocal()
+    try:
+        db.get(Model, seeded[0]).featured = not db.get(Model, seeded[0]).featured
+        db.get(Agency, costa[0]).phone = "+34 600 000 000"
+        db.commit()
+    finally:
+        db.close()
+    assert [client.get(path).headers["x-cache"] for path in pages] == ["MISS", "MISS", "MISS", "HIT"]
+    assert [client.get(path, headers=COSTA).headers["x-cache"] for path in pages] == ["MISS", "HIT", "HIT", "MISS"]
+
+
+def test_other_agencys_rows_out_of_reach(client, admin, costa):
+    _, model_ids = costa
+    assert client.get(f"/model/{model_ids[0]}").status_code == 404
+    admin.post(f"/admin/models/{model_ids[0]}/reject")
+    db = SessionLocal()
+    try:
+        assert db.get(Model, model_ids[0]).status == "approved"
+    finally:
+        db.close()
+
+
+def test_resolved_agency_cached(client, costa, no_page_cache):
+    client.get("/about", headers=COSTA)
+    with count_queries() as statements:
+        client.get("/about", headers=COSTA)
+        client.get("/")
+    assert len(statements) == 1
+
+
+def test_agency_edit_picked_up(costa):
+    agency_id, _ = costa
+    tenants.resolve("costa.example.com")
+    db = SessionLocal()
+    try:
+        db.get(Agency, agency_id).name = "COSTA DEL SOL MODELS"
+        db.commit()
+    finally:
+        db.close()
+    assert tenants.resolve("costa.example.com").name == "COSTA DEL SOL MODELS"
+
+
+def test_unknown_host_falls_back_to_default_agency(client, costa):
+    assert client.get("/about", headers={"host": "unknown.example.com"}).status_code == 200
+    assert tenants.resolve("unknown.example.com").subdomain == "redmarbs"
+
+
+def test_stats_count_every_lookup_across_threads(costa):
+    before = tenants.stats()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(tenants.resolve, ["costa.example.com", "localhost"] * 4000))
+    after = tenants.stats()
+    assert (after["hits"] + after["misses"]) - (before["hits"] + before["misses"]) == 8000
@@ -6,10 +6,10 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from models import get_db, City, Agency
+from models import SessionLocal, City, Agency
 
 def update_cities():
-    db = next(get_db())
+    db = SessionLocal()
     try:
         agency = db.query(Agency).first()
         if not agency: